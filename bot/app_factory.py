@@ -1,28 +1,55 @@
+import asyncio
+import json
 import logging
 import re
-from datetime import time
-from zoneinfo import ZoneInfo
+from datetime import datetime, timezone
 
 from telegram.error import BadRequest
-from telegram.ext import Application, CallbackQueryHandler, CommandHandler
+from telegram.ext import Application, CallbackQueryHandler, ChatMemberHandler, CommandHandler, MessageHandler, filters
 
 from bot import menus
-from bot.config import BOT_TOKEN, DEFAULT_PUBLISH_TIME_IR, DEFAULT_PRIVACY
-from bot.conversations.common import admin_only, go_main
+from bot.config import (
+    BOT_TOKEN,
+    DEFAULT_PRIVACY,
+    DEFAULT_PUBLISH_TIME_IR,
+    PREFETCH_LEAD_MIN,
+    YOUTUBE_API_KEY,
+    YT_QUOTA_DAILY,
+)
+from bot.conversations.common import admin_only, go_main, on_chat_member_updated
 from bot.conversations import add_link, edit_item, reorder_queue
 from bot.quality_callbacks import on_pick_quality_callback
-from publisher.job import daily_publisher, publish_one_item_now
+from publisher import bulk_import, quota, slots
+from publisher.job import (
+    catch_up_missed,
+    daily_publisher,
+    download_benchmark,
+    drain_queue,
+    invalidate_stale_prefetch,
+    prefetch_upcoming,
+    publish_one_item_now,
+    schedule_item_probe,
+)
 from shared import db as dbmod
+from shared.youtube_public import get_client
 
 logger = logging.getLogger(__name__)
 
 # FIX: در raw-string فقط یک \ لازم است
 TIME_RE = re.compile(r"^([01]\d|2[0-3]):([0-5]\d)$")
 
+CATCHUP_START_DELAY_S = 30
 
-def _parse_hhmm(hhmm: str) -> tuple[int, int]:
-    hh, mm = hhmm.split(":")
-    return int(hh), int(mm)
+# فایل لیست لینک‌ها برای /addbulk
+BULK_FILE_MAX_BYTES = 1024 * 1024
+
+SETTIME_HELP = (
+    "دستورها:\n"
+    "/settime HH:MM — همه زمان‌ها با یک زمان روزانه عوض می‌شود\n"
+    "/settime add HH:MM [روزها] — زمان جدید؛ روزها مثل sat,mon یا sat-wed (پیش‌فرض: هر روز)\n"
+    "/settime del ID — حذف یک زمان\n"
+    "/settime list — فهرست زمان‌ها"
+)
 
 
 async def _safe_edit_or_reply(q, text: str, reply_markup=None):
@@ -38,35 +65,90 @@ async def _safe_edit_or_reply(q, text: str, reply_markup=None):
             await q.message.reply_text(text, reply_markup=reply_markup)
 
 
+def _probe_line(it) -> str:
+    """خلاصه نتیجه probe زمان افزودن برای نمایش آیتم."""
+    status = it["probe_status"] if "probe_status" in it.keys() else None
+    if not status:
+        return "🎞 کیفیت: هنوز بررسی نشده"
+    if status == "error":
+        return "🎞 کیفیت: probe ناموفق"
+
+    heights = json.loads(it["probe_heights"] or "[]")
+    sizes = json.loads(it["probe_sizes"] or "{}")
+    parts = []
+    for h in heights[:4]:
+        size = sizes.get(str(h))
+        parts.append(f"{h}p (~{size / 1024 / 1024:.0f}MB)" if size else f"{h}p")
+    warn = " ⚠️ خارج از نردبان کیفیت" if status == "lowres" else ""
+    line = f"🎞 کیفیت: {', '.join(parts) or '-'}{warn}"
+    chosen = it["chosen_height"] if "chosen_height" in it.keys() else None
+    if chosen:
+        line += f"\n🎯 انتخاب‌شده: {chosen}p (format_id={it['chosen_format_id']})"
+    return line
+
+
+async def _post_init(application: Application) -> None:
+    # lookupهای metadata در thread جدا اجرا می‌شوند؛ ثبت quota به event loop سپرده می‌شود
+    loop = asyncio.get_running_loop()
+    con = application.bot_data["db"]
+    get_client(YOUTUBE_API_KEY).on_call = lambda: loop.call_soon_threadsafe(quota.spend, con, "videos.list")
+
+
 def build_app(db_path: str):
-    app = Application.builder().token(BOT_TOKEN).build()
+    app = Application.builder().token(BOT_TOKEN).post_init(_post_init).build()
 
     con = dbmod.connect(db_path)
     dbmod.migrate(con)
     dbmod.init_defaults(con, DEFAULT_PUBLISH_TIME_IR, DEFAULT_PRIVACY)
+    requeued = dbmod.requeue_stale_picking(con)
+    if requeued:
+        logger.warning("requeued %s item(s) left in 'picking' by a previous run", requeued)
     app.bot_data["db"] = con
 
     def ensure_daily_job(_app: Application) -> bool:
         if _app.job_queue is None:
             return False
 
-        for j in _app.job_queue.get_jobs_by_name("daily_publisher"):
-            j.schedule_removal()
+        for name in ("daily_publisher", "prefetch"):
+            for j in _app.job_queue.get_jobs_by_name(name):
+                j.schedule_removal()
 
+        # هر slot یک job مستقل (با روزهای هفته خودش) و یک prefetch قبل از آن
         con2 = _app.bot_data["db"]
-        hhmm = dbmod.get_publish_time_ir(con2)
-        h, m = _parse_hhmm(hhmm)
-
-        tz = ZoneInfo("Asia/Tehran")
-        _app.job_queue.run_daily(
-            daily_publisher,
-            time=time(hour=h, minute=m, tzinfo=tz),
-            name="daily_publisher",
-        )
+        for slot in dbmod.list_publish_slots(con2):
+            t = slots.slot_time(slot)
+            days = slots.slot_weekdays(slot)
+            _app.job_queue.run_daily(
+                daily_publisher,
+                time=t,
+                days=slots.ptb_days(days),
+                name="daily_publisher",
+                data={"slot_id": slot["id"]},
+            )
+
+            # prefetch: PREFETCH_LEAD_MIN دقیقه قبل از زمان انتشار
+            if PREFETCH_LEAD_MIN > 0:
+                pt, shift = slots.minus_minutes(t, PREFETCH_LEAD_MIN)
+                _app.job_queue.run_daily(
+                    prefetch_upcoming,
+                    time=pt,
+                    days=slots.ptb_days(days, shift),
+                    name="prefetch",
+                    data={"slot_id": slot["id"]},
+                )
         return True
 
     ensure_daily_job(app)
 
+    # slotهایی که در downtime جا ماندند؛ با کمی تاخیر تا ربات کامل بالا بیاید
+    if app.job_queue is not None:
+        app.job_queue.run_once(
+            catch_up_missed,
+            when=CATCHUP_START_DELAY_S,
+            name="catchup",
+            data={"cutoff": datetime.now(slots.TZ_IR)},
+        )
+
     # Conversations (اولویت بالاتر)
     app.add_handler(add_link.handler(), group=0)
     app.add_handler(edit_item.handler(), group=0)
@@ -87,27 +169,59 @@ def build_app(db_path: str):
             f"chat_id={chat.id}\nuser_id={user.id}\nstatus={m.status}"
         )
 
+    def _slots_text(con2) -> str:
+        rows = dbmod.list_publish_slots(con2)
+        if not rows:
+            return "هیچ زمان انتشاری تعریف نشده است."
+        return "زمان‌های انتشار (به وقت ایران):\n" + "\n".join(slots.slot_label(r) for r in rows)
+
+    def _slots_kb(con2):
+        return menus.time_slots_kb([(r["id"], slots.slot_label(r)) for r in dbmod.list_publish_slots(con2)])
+
     async def settime(update, context):
         if not await admin_only(update, context):
             return
 
-        if not context.args or len(context.args) != 1:
-            await update.effective_message.reply_text("فرمت درست: /settime HH:MM  (مثلاً /settime 17:00)")
-            return
+        args = context.args or []
+        con2 = context.application.bot_data["db"]
+        msg = update.effective_message
 
-        hhmm = context.args[0].strip()
-        if not TIME_RE.match(hhmm):
-            await update.effective_message.reply_text("زمان نامعتبر است. نمونه درست: 17:00")
+        if not args or args[0].lower() == "list":
+            await msg.reply_text(_slots_text(con2) + "\n\n" + SETTIME_HELP)
             return
 
-        con2 = context.application.bot_data["db"]
-        dbmod.set_publish_time_ir(con2, hhmm)
+        sub = args[0].lower()
+        if sub == "add":
+            if len(args) not in (2, 3) or not TIME_RE.match(args[1].strip()):
+                await msg.reply_text(SETTIME_HELP)
+                return
+            try:
+                weekdays = slots.parse_weekdays(args[2] if len(args) == 3 else None)
+            except ValueError:
+                await msg.reply_text("روزهای هفته نامعتبر است. نمونه: sat,mon یا sat-wed")
+                return
+            slot_id = dbmod.add_publish_slot(con2, args[1].strip(), weekdays)
+            text = f"✅ زمان انتشار اضافه شد: {slots.slot_label(dbmod.get_publish_slot(con2, slot_id))}"
+        elif sub in ("del", "rm"):
+            if len(args) != 2 or not args[1].lstrip("#").isdigit():
+                await msg.reply_text("فرمت درست: /settime del ID")
+                return
+            slot_id = int(args[1].lstrip("#"))
+            if not dbmod.delete_publish_slot(con2, slot_id):
+                await msg.reply_text(f"زمان #{slot_id} پیدا نشد.")
+                return
+            text = f"🗑 زمان #{slot_id} حذف شد."
+        elif len(args) == 1 and TIME_RE.match(args[0].strip()):
+            hhmm = args[0].strip()
+            dbmod.replace_publish_slots(con2, hhmm, datetime.now(slots.TZ_IR).strftime("%Y-%m-%d"))
+            text = f"✅ زمان انتشار ذخیره شد: {hhmm} (ایران، هر روز)"
+        else:
+            await msg.reply_text(SETTIME_HELP)
+            return
 
         ok = ensure_daily_job(context.application)
-        if ok:
-            await go_main(update, context, f"✅ زمان انتشار ذخیره و اعمال شد: {hhmm} (ایران)")
-        else:
-            await go_main(update, context, f"✅ زمان انتشار ذخیره شد: {hhmm} (ایران) — JobQueue فعال نیست")
+        suffix = "" if ok else " — JobQueue فعال نیست"
+        await go_main(update, context, f"{text}{suffix}\n\n{_slots_text(con2)}")
 
     async def add(update, context):
         if not await admin_only(update, context):
@@ -119,8 +233,57 @@ def build_app(db_path: str):
         url = context.args[0].strip()
         con2 = context.application.bot_data["db"]
         item_id = dbmod.add_queue_item_link(con2, url=url, thumb_mode="yt")
+        schedule_item_probe(context, item_id, url)
         await go_main(update, context, f"✅ به صف اضافه شد: #{item_id}")
 
+    async def _read_bulk_document(context, doc) -> str | None:
+        if doc is None:
+            return None
+        if (doc.file_size or 0) > BULK_FILE_MAX_BYTES:
+            raise ValueError(f"فایل بزرگ‌تر از {BULK_FILE_MAX_BYTES // 1024}KB است")
+        f = await context.bot.get_file(doc.file_id)
+        return bytes(await f.download_as_bytearray()).decode("utf-8", errors="replace")
+
+    async def addbulk(update, context):
+        """
+        /addbulk URL URL ... (چند خطی هم می‌شود)، لینک playlist/کانال،
+        یا فایل .txt با caption /addbulk (یا /addbulk در reply به همان فایل).
+        """
+        if not await admin_only(update, context):
+            return
+
+        msg = update.effective_message
+        # متن خام بعد از دستور (لینک‌ها ممکن است در چند خط باشند)
+        parts = (msg.text or msg.caption or "").split(maxsplit=1)
+        text = parts[1] if len(parts) > 1 else ""
+
+        doc = msg.document or (msg.reply_to_message.document if msg.reply_to_message else None)
+        try:
+            file_text = await _read_bulk_document(context, doc)
+        except Exception as e:
+            await msg.reply_text(f"❌ خواندن فایل ناموفق بود: {e}")
+            return
+        if file_text:
+            text = f"{text}\n{file_text}"
+
+        if not text.strip():
+            await msg.reply_text(
+                "فرمت درست: /addbulk URL URL ...\n"
+                "یا لینک playlist / کانال، یا یک فایل .txt با caption /addbulk (هر خط یک لینک)"
+            )
+            return
+
+        await msg.reply_text("⏳ در حال بررسی لینک‌ها…")
+        con2 = context.application.bot_data["db"]
+        try:
+            res = await bulk_import.import_links(con2, text)
+        except Exception as e:
+            logger.exception("addbulk failed", exc_info=e)
+            await msg.reply_text(f"❌ addbulk ناموفق بود (چیزی اضافه نشد): {type(e).__name__}: {e}")
+            return
+
+        await go_main(update, context, bulk_import.summary_text(res))
+
     async def delq(update, context):
         if not await admin_only(update, context):
             return
@@ -131,6 +294,7 @@ def build_app(db_path: str):
         item_id = int(context.args[0])
         con2 = context.application.bot_data["db"]
         dbmod.delete_queue_item(con2, item_id)
+        invalidate_stale_prefetch(context)
         await go_main(update, context, f"✅ از صف حذف شد: {item_id}")
 
     async def testjob(update, context):
@@ -178,19 +342,161 @@ def build_app(db_path: str):
             return
 
         daily = jq.get_jobs_by_name("daily_publisher")
+        prefetch = jq.get_jobs_by_name("prefetch")
         test = jq.get_jobs_by_name("test_daily_once")
-        await update.effective_message.reply_text(
-            f"daily_publisher jobs: {len(daily)}\n"
-            f"test_daily_once jobs: {len(test)}"
-        )
+        catchup = jq.get_jobs_by_name("catchup")
+        lines = [
+            f"daily_publisher jobs: {len(daily)}",
+            f"prefetch jobs: {len(prefetch)}",
+            f"test_daily_once jobs: {len(test)}",
+            f"catchup jobs: {len(catchup)}",
+        ]
+        for j in sorted(daily, key=lambda j: j.next_t or datetime.max.replace(tzinfo=timezone.utc)):
+            nxt = j.next_t.astimezone(slots.TZ_IR).strftime("%Y-%m-%d %H:%M") if j.next_t else "-"
+            lines.append(f"• slot #{(j.data or {}).get('slot_id')} → {nxt}")
+        await update.effective_message.reply_text("\n".join(lines))
 
     async def publish_now(update, context):
         if not await admin_only(update, context):
             return
+        args = context.args or []
+        if len(args) > 1 or (args and not args[0].isdigit()):
+            await update.effective_message.reply_text("فرمت درست: /publish_now [ID]")
+            return
         await update.effective_message.reply_text("🚀 شروع تست دانلود/آپلود…")
-        await publish_one_item_now(context)
+        await publish_one_item_now(context, int(args[0]) if args else None)
         await update.effective_message.reply_text("✅ تست تمام شد (اگر خطا بود، در پیام‌های گزارش می‌بینی).")
 
+    async def drain(update, context):
+        if not await admin_only(update, context):
+            return
+
+        args = context.args or []
+        if len(args) > 2 or not all(a.isdigit() and int(a) > 0 for a in args):
+            await update.effective_message.reply_text(
+                "فرمت درست: /drain N [WORKERS]  (مثلاً /drain 10 3)"
+            )
+            return
+
+        con2 = context.application.bot_data["db"]
+        max_items = int(args[0]) if args else len(dbmod.list_queued_ids(con2, limit=1000))
+        workers = int(args[1]) if len(args) > 1 else None
+        if max_items <= 0:
+            await update.effective_message.reply_text("📭 صف خالی است.")
+            return
+
+        # drain طولانی است؛ در پس‌زمینه اجرا می‌شود تا بقیه دستورها جواب بگیرند
+        context.application.create_task(drain_queue(context, max_items, workers))
+        await update.effective_message.reply_text(f"🚚 drain برای {max_items} آیتم شروع شد.")
+
+    async def prefetch_now(update, context):
+        if not await admin_only(update, context):
+            return
+        context.application.create_task(prefetch_upcoming(context))
+        await update.effective_message.reply_text("📦 prefetch در پس‌زمینه شروع شد.")
+
+    async def upstats(update, context):
+        if not await admin_only(update, context):
+            return
+
+        con2 = context.application.bot_data["db"]
+        rows = dbmod.upload_chunk_summary(con2, limit=10)
+        if not rows:
+            await update.effective_message.reply_text("هنوز آماری از چانک‌های آپلود ثبت نشده.")
+            return
+
+        lines = ["📊 آمار چانک‌های آپلود (آخرین آیتم‌ها):"]
+        for r in rows:
+            secs = r["total_seconds"] or 0
+            avg = (r["total_bytes"] or 0) / secs / (1024 * 1024) if secs else 0
+            best = (r["best_bps"] or 0) / (1024 * 1024)
+            lines.append(
+                f"#{r['item_id']}: {r['chunks']} چانک، میانگین {avg:.1f}MB/s، بهترین {best:.1f}MB/s، "
+                f"چانک {r['min_chunk'] // (1024 * 1024)}–{r['max_chunk'] // (1024 * 1024)}MB"
+            )
+        await update.effective_message.reply_text("\n".join(lines))
+
+    async def failed(update, context):
+        if not await admin_only(update, context):
+            return
+
+        con2 = context.application.bot_data["db"]
+        rows = dbmod.list_failed(con2, limit=20)
+        if not rows:
+            await update.effective_message.reply_text("آیتم پارک‌شده (failed) نداریم.")
+            return
+
+        lines = ["⛔️ آیتم‌های پارک‌شده:"]
+        for r in rows:
+            lines.append(f"#{r['id']} ({r['attempts']} تلاش): {(r['last_error'] or '')[:150]}")
+        lines.append("\nبرگرداندن به صف: /retry ID")
+        await update.effective_message.reply_text("\n".join(lines))
+
+    async def retry(update, context):
+        if not await admin_only(update, context):
+            return
+        if not context.args or len(context.args) != 1 or not context.args[0].isdigit():
+            await update.effective_message.reply_text("فرمت درست: /retry ID  (مثلاً /retry 12)")
+            return
+
+        item_id = int(context.args[0])
+        con2 = context.application.bot_data["db"]
+        if dbmod.requeue_failed(con2, item_id):
+            await go_main(update, context, f"✅ آیتم #{item_id} با شمارنده صفر به صف برگشت.")
+        else:
+            await update.effective_message.reply_text(f"آیتم #{item_id} در وضعیت failed پیدا نشد.")
+
+    async def cachestats(update, context):
+        if not await admin_only(update, context):
+            return
+
+        con2 = context.application.bot_data["db"]
+        st = dbmod.get_media_cache_stats(con2)
+        hits, misses = st.get("hits", 0), st.get("misses", 0)
+        ratio = hits / (hits + misses) * 100 if hits + misses else 0
+        used = dbmod.media_cache_total_bytes(con2)
+        await update.effective_message.reply_text(
+            "♻️ media cache:\n"
+            f"hit={hits} miss={misses} ({ratio:.0f}% hit)\n"
+            f"صرفه‌جویی دانلود: {st.get('bytes_saved', 0) / (1024 ** 3):.2f}GB\n"
+            f"حجم فعلی: {used / (1024 ** 3):.2f}GB، evict شده: {st.get('evictions', 0)}"
+        )
+
+    async def stats(update, context):
+        if not await admin_only(update, context):
+            return
+
+        con2 = context.application.bot_data["db"]
+        reserved = sum(context.application.bot_data.get("quota_reservations", {}).values())
+        rows = dbmod.get_quota_usage(con2, quota.quota_day())
+        reset = quota.next_reset().astimezone(slots.TZ_IR).strftime("%Y-%m-%d %H:%M")
+        lines = [
+            f"⛽️ quota یوتیوب ({quota.quota_day()} به وقت Pacific):",
+            f"مصرف: {quota.used(con2)} / {YT_QUOTA_DAILY}",
+        ]
+        lines += [f"• {r['kind']}: {r['calls']} درخواست، {r['units']} واحد" for r in rows]
+        left = quota.remaining(con2, reserved)
+        lines += [
+            f"رزرو آپلودهای در جریان: {reserved}",
+            f"باقیمانده: {left} (≈ {max(0, left) // quota.cost('videos.insert')} آپلود)",
+            f"reset: {reset} (ایران)",
+        ]
+        await update.effective_message.reply_text("\n".join(lines))
+
+    async def dlbench(update, context):
+        if not await admin_only(update, context):
+            return
+
+        args = context.args or []
+        if not args or len(args) > 2 or (len(args) == 2 and not args[1].isdigit()):
+            await update.effective_message.reply_text("فرمت درست: /dlbench YOUTUBE_URL [SECONDS]  (مثلاً /dlbench https://youtu.be/xxx 20)")
+            return
+
+        url = args[0].strip()
+        seconds = int(args[1]) if len(args) == 2 else 20
+        context.application.create_task(download_benchmark(context, update.effective_chat.id, url, seconds))
+        await update.effective_message.reply_text(f"🏎 بنچمارک شروع شد ({seconds}s برای هر تنظیم)…")
+
     async def on_click(update, context):
         if not await admin_only(update, context):
             return
@@ -251,7 +557,8 @@ def build_app(db_path: str):
                 f"📌 آیتم #{item_id}\n\n"
                 f"📌 تیتر:\n{title}\n\n"
                 f"📝 دیسکریپشن:\n{desc[:1500]}\n\n"
-                f"🔗 لینک:\n{url}"
+                f"🔗 لینک:\n{url}\n\n"
+                f"{_probe_line(it)}"
             )
             await _safe_edit_or_reply(q, text, reply_markup=menus.queue_item_kb(item_id))
             return
@@ -273,7 +580,8 @@ def build_app(db_path: str):
                 f"👁 مشاهده کامل — آیتم #{item_id}\n\n"
                 f"📌 تیتر:\n{title}\n\n"
                 f"📝 دیسکریپشن:\n{desc[:1500]}\n\n"
-                f"🔗 لینک:\n{url}"
+                f"🔗 لینک:\n{url}\n\n"
+                f"{_probe_line(it)}"
             )
             await _safe_edit_or_reply(q, text, reply_markup=menus.queue_item_kb(item_id))
             return
@@ -283,6 +591,7 @@ def build_app(db_path: str):
             item_id = int(m.group(1))
             con2 = context.application.bot_data["db"]
             dbmod.delete_queue_item(con2, item_id)
+            invalidate_stale_prefetch(context)
             rows = dbmod.list_queued(con2, limit=30)
             if not rows:
                 await _safe_edit_or_reply(q, "✅ حذف شد. صف خالی است.", reply_markup=menus.back_main_kb())
@@ -296,16 +605,20 @@ def build_app(db_path: str):
 
         if data == menus.CB_TIME_VIEW:
             con2 = context.application.bot_data["db"]
-            t = dbmod.get_publish_time_ir(con2)
-            await _safe_edit_or_reply(q, f"زمان فعلی انتشار: {t} (به وقت ایران)", reply_markup=menus.time_menu())
+            await _safe_edit_or_reply(q, _slots_text(con2), reply_markup=_slots_kb(con2))
             return
 
         if data == menus.CB_TIME_SET:
-            await _safe_edit_or_reply(
-                q,
-                "زمان جدید را با این دستور بفرست:\n/settime HH:MM\nمثلاً: /settime 17:00",
-                reply_markup=menus.time_menu(),
-            )
+            await _safe_edit_or_reply(q, SETTIME_HELP, reply_markup=menus.time_menu())
+            return
+
+        m = re.match(r"^TIME_DEL:(\d+)$", data)
+        if m:
+            con2 = context.application.bot_data["db"]
+            slot_id = int(m.group(1))
+            dbmod.delete_publish_slot(con2, slot_id)
+            ensure_daily_job(context.application)
+            await _safe_edit_or_reply(q, f"🗑 زمان #{slot_id} حذف شد.\n\n{_slots_text(con2)}", reply_markup=_slots_kb(con2))
             return
 
         await go_main(update, context)
@@ -323,16 +636,31 @@ def build_app(db_path: str):
     app.add_handler(CommandHandler("whoami", whoami), group=1)
     app.add_handler(CommandHandler("settime", settime), group=1)
     app.add_handler(CommandHandler("add", add), group=1)
+    app.add_handler(CommandHandler("addbulk", addbulk), group=1)
+    app.add_handler(
+        MessageHandler(filters.Document.ALL & filters.CaptionRegex(r"^/addbulk(@\w+)?(\s|$)"), addbulk), group=1
+    )
     app.add_handler(CommandHandler("delq", delq), group=1)
     app.add_handler(CommandHandler("testjob", testjob), group=1)
     app.add_handler(CommandHandler("daily_in", daily_in), group=1)
     app.add_handler(CommandHandler("jobs", jobs), group=1)
+    app.add_handler(CommandHandler("stats", stats), group=1)
     app.add_handler(CommandHandler("publish_now", publish_now), group=1)
+    app.add_handler(CommandHandler("drain", drain), group=1)
+    app.add_handler(CommandHandler("prefetch", prefetch_now), group=1)
+    app.add_handler(CommandHandler("upstats", upstats), group=1)
+    app.add_handler(CommandHandler("dlbench", dlbench), group=1)
+    app.add_handler(CommandHandler("cachestats", cachestats), group=1)
+    app.add_handler(CommandHandler("failed", failed), group=1)
+    app.add_handler(CommandHandler("retry", retry), group=1)
 
     # Callback ها
     app.add_handler(CallbackQueryHandler(on_pick_quality_callback, pattern=r"^qpick:"), group=1)
     app.add_handler(CallbackQueryHandler(on_click), group=1)
 
+    # تغییر نقش اعضا => cache ادمین admin_only به‌روز می‌شود
+    app.add_handler(ChatMemberHandler(on_chat_member_updated, ChatMemberHandler.ANY_CHAT_MEMBER), group=1)
+
     app.add_error_handler(error_handler)
 
     return app
@@ -12,3 +12,81 @@ DB_PATH = env("DB_PATH", "/mnt/data/app.db")
 DEFAULT_PUBLISH_TIME_IR = env("DEFAULT_PUBLISH_TIME_IR", "17:00")
 DEFAULT_PRIVACY = env("DEFAULT_PRIVACY", "public")
 YOUTUBE_API_KEY = env("YOUTUBE_API_KEY")
+
+# worker pool: تعداد آیتم‌های همزمان و سقف جداگانه دانلود/آپلود
+PUBLISH_WORKERS = int(env("PUBLISH_WORKERS", "3"))
+DOWNLOAD_CONCURRENCY = int(env("DOWNLOAD_CONCURRENCY", "2"))
+UPLOAD_CONCURRENCY = int(env("UPLOAD_CONCURRENCY", "1"))
+
+# prefetch: K آیتم بعدی صف، lead دقیقه قبل از زمان انتشار، در پوشه staging دانلود می‌شوند
+STAGING_DIR = env("STAGING_DIR", os.path.join(os.path.dirname(DB_PATH) or ".", "staging"))
+PREFETCH_COUNT = int(env("PREFETCH_COUNT", "1"))
+PREFETCH_LEAD_MIN = int(env("PREFETCH_LEAD_MIN", "120"))
+PREFETCH_BUDGET_MB = int(env("PREFETCH_BUDGET_MB", "8192"))
+
+# streaming: خروجی ffmpeg مستقیم (با بافر محدود) به resumable upload می‌رود، بدون فایل روی دیسک
+STREAM_UPLOAD = env("STREAM_UPLOAD", "0") == "1"
+STREAM_CHUNK_MB = int(env("STREAM_CHUNK_MB", "8"))
+STREAM_WINDOW_CHUNKS = int(env("STREAM_WINDOW_CHUNKS", "4"))
+
+# اندازه چانک آپلود (برای گزارش پیشرفت و جلوگیری از یک درخواست چندگیگی)
+UPLOAD_CHUNK_MB = int(env("UPLOAD_CHUNK_MB", "16"))
+# fixed: همیشه UPLOAD_CHUNK_MB | adaptive: بین MIN و MAX طوری که هر چانک حدود TARGET_S ثانیه طول بکشد
+UPLOAD_CHUNK_MODE = env("UPLOAD_CHUNK_MODE", "adaptive")
+UPLOAD_CHUNK_MIN_MB = int(env("UPLOAD_CHUNK_MIN_MB", "4"))
+UPLOAD_CHUNK_MAX_MB = int(env("UPLOAD_CHUNK_MAX_MB", "128"))
+UPLOAD_CHUNK_TARGET_S = float(env("UPLOAD_CHUNK_TARGET_S", "20"))
+
+# موتور دانلود: default | fragments (فرگمنت همزمان) | parallel (fragments + ترک ویدیو/صدا همزمان)
+DOWNLOAD_ENGINE = env("DOWNLOAD_ENGINE", "default")
+DOWNLOAD_FRAGMENTS = int(env("DOWNLOAD_FRAGMENTS", "4"))
+DOWNLOAD_BUFFER_KB = int(env("DOWNLOAD_BUFFER_KB", "0"))          # 0 = پیش‌فرض yt-dlp
+DOWNLOAD_HTTP_CHUNK_MB = int(env("DOWNLOAD_HTTP_CHUNK_MB", "0"))  # 0 = پیش‌فرض yt-dlp
+
+# cache نتیجه probe فرمت‌ها: خلاصه در SQLite، info کامل (با URLهای موقت یوتیوب) فقط کوتاه‌مدت در حافظه
+PROBE_CACHE_TTL_MIN = int(env("PROBE_CACHE_TTL_MIN", "360"))
+PROBE_INFO_TTL_MIN = int(env("PROBE_INFO_TTL_MIN", "20"))
+
+# نردبان کیفیت: اولین height موجود (با سقف حجم و codec مجاز) در همان یک تلاش دانلود انتخاب می‌شود
+QUALITY_LADDER = env("QUALITY_LADDER", "2160,1440,1080,720")
+QUALITY_MAX_MB = int(env("QUALITY_MAX_MB", "0"))                  # 0 = بدون سقف
+QUALITY_CODECS = os.getenv("QUALITY_CODECS", "")                  # مثلاً avc1,vp9,av01 — خالی = همه
+
+# محدودیت پیام/ادیت تلگرام برای گروه ادمین و فاصله ادیت پیام‌های پیشرفت
+TG_CHAT_MSGS_PER_MIN = int(env("TG_CHAT_MSGS_PER_MIN", "20"))
+TG_PROGRESS_INTERVAL_S = float(env("TG_PROGRESS_INTERVAL_S", "7"))
+
+# cache عضویت ادمین (admin_only)؛ جواب منفی کوتاه‌تر نگه داشته می‌شود
+ADMIN_CACHE_TTL_S = int(env("ADMIN_CACHE_TTL_S", "600"))
+ADMIN_NEG_CACHE_TTL_S = int(env("ADMIN_NEG_CACHE_TTL_S", "60"))
+
+# بعد از دانلود: remux بدون re-encode به mp4 با +faststart (اگر codec ها اجازه بدهند)
+UPLOAD_FASTSTART = env("UPLOAD_FASTSTART", "0") == "1"
+
+# کنترل پذیرش دانلود بر اساس فضای دیسک (حجم تخمینی از probe)
+STAGING_BUDGET_MB = int(env("STAGING_BUDGET_MB", "0"))            # 0 = فقط فضای آزاد دیسک
+DISK_MIN_FREE_MB = int(env("DISK_MIN_FREE_MB", "512"))
+DISK_PEAK_FACTOR = float(env("DISK_PEAK_FACTOR", "2.0"))          # ترک‌ها + فایل merge/remux هم‌زمان
+
+# cache فایل‌های آپلودشده با کلید video_id + format_id (LRU زیر سقف حجم)
+MEDIA_CACHE_DIR = env("MEDIA_CACHE_DIR", os.path.join(os.path.dirname(DB_PATH) or ".", "media_cache"))
+MEDIA_CACHE_MB = int(env("MEDIA_CACHE_MB", "4096"))               # 0 = خاموش
+
+# retry آیتم‌های خطادار: backoff نمایی، بعد از RETRY_MAX_ATTEMPTS پارک (failed)
+RETRY_MAX_ATTEMPTS = int(env("RETRY_MAX_ATTEMPTS", "5"))
+RETRY_BASE_MIN = int(env("RETRY_BASE_MIN", "15"))
+RETRY_MAX_MIN = int(env("RETRY_MAX_MIN", "720"))
+
+# catch-up بعد از downtime: slotهای جامانده تا CATCHUP_MAX_DAYS روز قبل، با فاصله بین آپلودها
+CATCHUP_MAX_DAYS = int(env("CATCHUP_MAX_DAYS", "2"))             # 0 = فقط slotهای گذشته امروز، -1 = خاموش
+CATCHUP_INTERVAL_MIN = int(env("CATCHUP_INTERVAL_MIN", "10"))
+
+# quota روزانه YouTube Data API (پیش‌فرض پروژه: 10000 واحد) و هزینه هر videos.insert
+YT_QUOTA_DAILY = int(env("YT_QUOTA_DAILY", "10000"))
+YT_QUOTA_UPLOAD_COST = int(env("YT_QUOTA_UPLOAD_COST", "1600"))
+
+# مهلت جواب videos.list در add-link (درخواست بعد از مهلت در پس‌زمینه تمام و cache می‌شود)
+METADATA_TIMEOUT_S = float(env("METADATA_TIMEOUT_S", "10"))
+
+# /addbulk: سقف تعداد ویدیو بعد از باز کردن playlist / کانال‌ها
+BULK_MAX_ITEMS = int(env("BULK_MAX_ITEMS", "200"))
@@ -1,3 +1,4 @@
+import asyncio
 import logging
 
 from telegram import Update
@@ -12,9 +13,10 @@ from telegram.ext import (
 
 from bot import menus
 from bot.conversations.common import admin_only, go_main
-from bot.config import YOUTUBE_API_KEY
+from bot.config import METADATA_TIMEOUT_S, YOUTUBE_API_KEY
+from publisher.job import schedule_item_probe
 from shared import db as dbmod
-from shared.youtube_public import extract_video_id, get_video, parse_iso8601_duration_to_seconds
+from shared.youtube_public import extract_video_id, get_video_async, parse_iso8601_duration_to_seconds
 
 logger = logging.getLogger(__name__)
 
@@ -72,7 +74,15 @@ async def got_url(update: Update, context: ContextTypes.DEFAULT_TYPE):
             )
             return S_WAIT_URL
 
-        item = get_video(YOUTUBE_API_KEY, vid)
+        # درخواست API در thread جدا: بقیه handlerها منتظر جواب یوتیوب نمی‌مانند
+        try:
+            item = await get_video_async(YOUTUBE_API_KEY, vid, timeout=METADATA_TIMEOUT_S)
+        except asyncio.TimeoutError:
+            await update.effective_message.reply_text(
+                "⏳ جواب یوتیوب دیر رسید. چند ثانیه بعد همین لینک را دوباره بفرست.",
+                reply_markup=menus.cancel_kb(),
+            )
+            return S_WAIT_URL
         if not item or not isinstance(item, dict):
             await update.effective_message.reply_text(
                 "❌ ویدیو پیدا نشد یا پاسخ API نامعتبر بود.",
@@ -187,6 +197,9 @@ async def _finalize(update: Update, context: ContextTypes.DEFAULT_TYPE, has_manu
             # اگر این ستون/جدول هنوز migration نشده بود، کل flow را خراب نکن
             logger.warning("ADD_LINK manual_thumb_file_id update skipped: %s", e)
 
+        # کیفیت‌های موجود از همین حالا بررسی می‌شود، نه در زمان انتشار
+        schedule_item_probe(context, item_id, url)
+
         await go_main(
             update,
             context,
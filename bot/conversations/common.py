@@ -1,18 +1,64 @@
 from __future__ import annotations
 
+import time
+
 from telegram import Update
 from telegram.error import BadRequest, Forbidden
 from telegram.ext import ContextTypes
 
-from bot.config import ADMIN_GROUP_ID
+from bot.config import ADMIN_CACHE_TTL_S, ADMIN_GROUP_ID, ADMIN_NEG_CACHE_TTL_S
 from bot import menus
 
+ADMIN_STATUSES = ("creator", "administrator")
+
+# user_id -> (expires_at, is_admin)؛ با ChatMemberUpdated به‌روز می‌شود
+_ADMIN_CACHE: dict[int, tuple[float, bool]] = {}
+
 
 def is_admin_group(update: Update) -> bool:
     chat = update.effective_chat
     return bool(chat and chat.id == ADMIN_GROUP_ID)
 
 
+def _remember_admin(user_id: int, is_admin: bool) -> None:
+    ttl = ADMIN_CACHE_TTL_S if is_admin else ADMIN_NEG_CACHE_TTL_S
+    _ADMIN_CACHE[user_id] = (time.monotonic() + ttl, is_admin)
+
+
+def invalidate_admin_cache(user_id: int | None = None) -> None:
+    if user_id is None:
+        _ADMIN_CACHE.clear()
+    else:
+        _ADMIN_CACHE.pop(user_id, None)
+
+
+async def _is_group_admin(context: ContextTypes.DEFAULT_TYPE, user_id: int) -> bool:
+    rec = _ADMIN_CACHE.get(user_id)
+    if rec and rec[0] > time.monotonic():
+        return rec[1]
+
+    # BadRequest/Forbidden به caller می‌رسد و cache نمی‌شود
+    member = await context.bot.get_chat_member(ADMIN_GROUP_ID, user_id)
+    is_admin = member.status in ADMIN_STATUSES
+    _remember_admin(user_id, is_admin)
+    return is_admin
+
+
+async def on_chat_member_updated(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """تغییر نقش اعضای گروه مدیریت را مستقیم در cache می‌نشاند (بدون get_chat_member)."""
+    cmu = update.chat_member or update.my_chat_member
+    if not cmu or cmu.chat.id != ADMIN_GROUP_ID:
+        return
+
+    if update.my_chat_member:
+        # نقش خود بات عوض شد؛ ممکن است دیگر ChatMemberUpdated اعضا را نگیرد
+        invalidate_admin_cache()
+        return
+
+    new = cmu.new_chat_member
+    _remember_admin(new.user.id, new.status in ADMIN_STATUSES)
+
+
 async def admin_only(update: Update, context: ContextTypes.DEFAULT_TYPE) -> bool:
     # فقط در گروه مدیریت
     if not is_admin_group(update):
@@ -25,14 +71,14 @@ async def admin_only(update: Update, context: ContextTypes.DEFAULT_TYPE) -> bool
         return False
 
     try:
-        member = await context.bot.get_chat_member(ADMIN_GROUP_ID, user.id)
+        is_admin = await _is_group_admin(context, user.id)
     except (BadRequest, Forbidden):
         # اگر دسترسی/اطلاعات عضو قابل دریافت نبود
         if update.effective_message:
             await update.effective_message.reply_text("خطا در بررسی دسترسی ادمین. بعداً دوباره تلاش کن.")
         return False
 
-    if member.status not in ("creator", "administrator"):
+    if not is_admin:
         if update.effective_message:
             await update.effective_message.reply_text("فقط ادمین‌های گروه اجازه استفاده دارند.")
         return False
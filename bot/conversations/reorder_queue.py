@@ -7,6 +7,7 @@ from telegram.ext import ConversationHandler, CallbackQueryHandler, ContextTypes
 
 from bot import menus
 from bot.conversations.common import admin_only, go_main
+from publisher.job import invalidate_stale_prefetch
 from shared import db as dbmod
 
 logger = logging.getLogger(__name__)
@@ -99,6 +100,8 @@ async def pick_pos(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     if target_id != item_id:
         dbmod.swap_queue_order(con, item_id, target_id)
+        # آیتمی که از پنجره prefetch بیرون رفته، فایل stage شده‌اش باطل می‌شود
+        invalidate_stale_prefetch(context)
 
     context.user_data.pop("reorder_item_id", None)
 
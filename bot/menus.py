@@ -23,6 +23,7 @@ CB_LINK_DESC_MANUAL = "LINK_DESC_MANUAL"
 # ---- Time menu callbacks ----
 CB_TIME_VIEW = "TIME_VIEW"
 CB_TIME_SET = "TIME_SET"
+CB_TIME_DEL = "TIME_DEL:"  # +slot id
 
 # ---- Queue item callbacks (prefixes) ----
 CB_QUEUE_ITEM = "QUEUE_ITEM:"  # +id  (کلیک روی آیتم در لیست -> منوی آیتم)
@@ -100,13 +101,22 @@ def link_desc_choice_kb() -> InlineKeyboardMarkup:
 # -----------------------------
 def time_menu() -> InlineKeyboardMarkup:
     rows = [
-        [InlineKeyboardButton("مشاهده زمان کنونی", callback_data=CB_TIME_VIEW)],
-        [InlineKeyboardButton("تغییر زمان کنونی", callback_data=CB_TIME_SET)],
+        [InlineKeyboardButton("مشاهده زمان‌های انتشار", callback_data=CB_TIME_VIEW)],
+        [InlineKeyboardButton("افزودن / تغییر زمان", callback_data=CB_TIME_SET)],
         [InlineKeyboardButton("بازگشت به منو ↩︎", callback_data=CB_BACK_MAIN)],
     ]
     return InlineKeyboardMarkup(rows)
 
 
+def time_slots_kb(slots) -> InlineKeyboardMarkup:
+    """slots: [(slot_id, label), ...] — کلیک روی هر ردیف آن زمان را حذف می‌کند."""
+    rows = []
+    for slot_id, label in slots:
+        rows.append([InlineKeyboardButton(f"🗑 {label}", callback_data=f"{CB_TIME_DEL}{slot_id}")])
+    rows.append([InlineKeyboardButton("بازگشت ↩︎", callback_data=CB_TIME)])
+    return InlineKeyboardMarkup(rows)
+
+
 # -----------------------------
 # Queue list + item menu
 # -----------------------------
@@ -1,6 +1,22 @@
+import json
+
 from telegram.error import BadRequest
 
 from bot.conversations.common import admin_only
+from shared import db as dbmod
+
+
+def _stored_heights(con, item_id: int) -> list[int] | None:
+    """
+    heightهای probe زمان افزودن که روی آیتم ذخیره شده؛ None اگر آیتم دیگر queued/picking نیست.
+    """
+    it = dbmod.get_queue_item(con, item_id)
+    if it is None:
+        return None
+    try:
+        return [int(h) for h in json.loads(it["probe_heights"] or "[]")]
+    except (TypeError, ValueError):
+        return []
 
 
 async def on_pick_quality_callback(update, context):
@@ -45,22 +61,38 @@ async def on_pick_quality_callback(update, context):
         pending = {}
         context.application.bot_data["pending_quality"] = pending
 
+    con = context.application.bot_data["db"]
     rec = pending.get(item_id)
     if not isinstance(rec, dict):
-        try:
-            await q.edit_message_text("این درخواست انتخاب کیفیت منقضی شده. دوباره /publish_now بزن.")
-        except BadRequest:
-            pass
-        return
+        # پیام انتخاب کیفیت ممکن است روزها قبل (زمان افزودن) فرستاده شده باشد و bot_data بعد از
+        # ری‌استارت خالی است؛ انتخاب با probe ذخیره‌شده و status خود آیتم سنجیده می‌شود
+        heights = _stored_heights(con, item_id)
+        if heights is None:
+            text = f"آیتم #{item_id} دیگر در صف نیست؛ انتخاب کیفیت لازم نیست."
+        elif heights and height not in heights:
+            text = f"کیفیت {height}p برای آیتم #{item_id} موجود نیست. دوباره /publish_now بزن."
+        else:
+            text = None
+        if text:
+            try:
+                await q.edit_message_text(text)
+            except BadRequest:
+                pass
+            return
+        rec = pending[item_id] = {"heights": heights, "chosen_height": None}
 
     rec["chosen_height"] = height
+    # روی آیتم هم ذخیره می‌شود تا بعد از ری‌استارت همین selector ساخته شود (و فایل stage شده معتبر بماند)
+    dbmod.set_item_pinned_height(con, item_id, height)
+    dbmod.clear_item_defer(con, item_id)
 
     # اگر می‌خوای بعد از انتخاب، pending پاک بشه تا انتخاب قدیمی اثر نذاره:
     # pending.pop(item_id, None)
 
     msg = (
         f"✅ انتخاب شد: {height}p برای آیتم #{item_id}.\n"
-        f"حالا دوباره /publish_now بزن تا با همین کیفیت دانلود شود."
+        f"این انتخاب جای نردبان کیفیت خودکار را برای این آیتم می‌گیرد؛\n"
+        f"در نوبت بعدی انتشار (یا با /publish_now) با همین کیفیت دانلود می‌شود."
     )
 
     try:
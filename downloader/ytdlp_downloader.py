@@ -1,9 +1,16 @@
+import copy
+import json
 import shutil
+import subprocess
 import tempfile
+import threading
 import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 import yt_dlp
+from yt_dlp.utils import DownloadCancelled
 
 
 def _fmt_bytes(n):
@@ -30,6 +37,44 @@ def probe_youtube_formats(url: str) -> dict:
         return ydl.extract_info(url, download=False)
 
 
+def expand_youtube_flat(url: str, limit: int = 500) -> list[str]:
+    """
+    لینک playlist / کانال را بدون گرفتن صفحه هر ویدیو (extract_flat) به لیست video id تبدیل می‌کند.
+    لینک ریشه کانال چند tab (Videos/Shorts/Live) برمی‌گرداند که یک سطح باز می‌شوند.
+    """
+    ydl_opts = {
+        "quiet": True,
+        "no_warnings": True,
+        "skip_download": True,
+        "extract_flat": True,
+        "playlistend": limit,
+    }
+    ids: list[str] = []
+
+    def _walk(entries, depth: int) -> None:
+        for e in entries or []:
+            if len(ids) >= limit:
+                return
+            if not e:
+                continue
+            if e.get("_type") == "playlist" or (e.get("ie_key") == "YoutubeTab" and depth > 0):
+                sub = e.get("entries")
+                if sub is None and e.get("url"):
+                    sub = ydl.extract_info(e["url"], download=False).get("entries")
+                _walk(sub, depth - 1)
+            elif e.get("id") and e.get("ie_key", "Youtube") == "Youtube":
+                ids.append(e["id"])
+
+    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+        info = ydl.extract_info(url, download=False)
+        if info.get("_type") in ("playlist", "multi_video"):
+            _walk(info.get("entries"), 1)
+        elif info.get("id"):
+            ids.append(info["id"])
+
+    return list(dict.fromkeys(ids))[:limit]
+
+
 def _extract_final_filepath(info: dict) -> str | None:
     """
     تلاش می‌کند مسیر فایل نهایی بعد از دانلود/مرج را از info دربیارد.
@@ -59,50 +104,78 @@ def _extract_final_filepath(info: dict) -> str | None:
     return None
 
 
-def download_youtube_temp(
-    url: str,
-    name: str,
-    *,
-    progress_cb=None,
-    format_selector: str | None = None,
-    merge_container: str = "mkv",   # پیش‌فرض پایدارتر از mp4 برای مرج [web:1016]
-    debug: bool = False,
-):
-    """
-    خروجی: (info, file_path, tmpdir)
+# default: رفتار خود yt-dlp (فرگمنت‌ها یکی‌یکی)
+# fragments: دانلود همزمان فرگمنت‌های DASH/HLS
+# parallel: fragments + دانلود همزمان ترک ویدیو و صدا و merge با ffmpeg
+DOWNLOAD_ENGINES = ("default", "fragments", "parallel")
 
-    progress_cb: تابع sync که dict پیشرفت را می‌گیرد.
-    format_selector: مثل 'bv*[height<=1080]+ba/b[height<=1080]' و ...
-    merge_container: 'mkv' یا 'mp4'
-    debug: اگر True باشد لاگ کامل yt-dlp/ffmpeg را می‌دهد.
+
+def _engine_opts(engine: str, fragments: int, buffersize: int | None, http_chunk_size: int | None) -> dict:
+    if engine not in DOWNLOAD_ENGINES:
+        raise ValueError(f"unknown download engine: {engine!r} (expected one of {DOWNLOAD_ENGINES})")
+
+    opts = {}
+    if engine in ("fragments", "parallel"):
+        opts["concurrent_fragment_downloads"] = max(1, int(fragments))
+    if buffersize:
+        # بافر ثابت برای هر کانکشن (بدون resize خودکار yt-dlp)
+        opts["buffersize"] = int(buffersize)
+        opts["noresizebuffer"] = True
+    if http_chunk_size:
+        opts["http_chunk_size"] = int(http_chunk_size)
+    return opts
+
+
+class _ProgressHook:
+    """
+    progress hook برای yt-dlp. وقتی چند ترک همزمان دانلود می‌شوند (engine=parallel)
+    بایت‌ها و سرعت همه ترک‌ها جمع زده و یکجا به progress_cb داده می‌شود.
     """
-    tmpdir = tempfile.mkdtemp(prefix="ytdlp_")
-    outtmpl = str(Path(tmpdir) / f"{name}.%(ext)s")
 
-    last = {"t": 0.0}
+    def __init__(self, progress_cb, interval: float = 7.0):
+        self._cb = progress_cb
+        self._interval = interval
+        self._last = 0.0
+        self._lock = threading.Lock()
+        self._tracks = {}
 
-    def hook(d):
-        if progress_cb is None:
+    def __call__(self, d):
+        if self._cb is None:
             return
 
         status = d.get("status")
         if status not in ("downloading", "finished"):
             return
 
-        now = time.time()
-        if status == "downloading" and (now - last["t"] < 7):
-            return
-        last["t"] = now
+        info_dict = d.get("info_dict") or {}
+        key = info_dict.get("format_id") or d.get("filename")
+
+        with self._lock:
+            self._tracks[key] = {
+                "downloaded": d.get("downloaded_bytes") or 0,
+                "total": d.get("total_bytes") or d.get("total_bytes_estimate") or 0,
+                "speed": d.get("speed") or 0,
+                "eta": d.get("eta"),
+                "finished": status == "finished",
+            }
+
+            now = time.time()
+            if status == "downloading" and (now - self._last < self._interval):
+                return
+            self._last = now
 
-        downloaded = d.get("downloaded_bytes") or 0
-        total = d.get("total_bytes") or d.get("total_bytes_estimate") or 0
-        speed = d.get("speed")
-        eta = d.get("eta")
+            tracks = list(self._tracks.values())
+
+        downloaded = sum(t["downloaded"] for t in tracks)
+        total = sum(t["total"] for t in tracks)
+        active = [t for t in tracks if not t["finished"]]
+        speed = sum(t["speed"] for t in active) or d.get("speed")
+        etas = [t["eta"] for t in active if t["eta"] is not None]
+        eta = max(etas) if etas else d.get("eta")
 
         percent = (downloaded / total * 100) if total else None
 
-        info_dict = d.get("info_dict") or {}
-        progress_cb(
+        self._cb(
             {
                 "status": status,
                 "downloaded": downloaded,
@@ -114,10 +187,138 @@ def download_youtube_temp(
             }
         )
 
+
+def _extract_or_reuse(ydl, url: str, info: dict | None, *, download: bool) -> dict:
+    """
+    اگر info قبلاً (مثلاً در probe_cache) گرفته شده باشد فقط انتخاب فرمت/دانلود
+    با process_ie_result انجام می‌شود و درخواست extract دوباره به یوتیوب نمی‌رود.
+    """
+    if info is not None:
+        return ydl.process_ie_result(copy.deepcopy(info), download=download)
+    return ydl.extract_info(url, download=download)
+
+
+def resolve_format(url: str, format_selector: str | None, info: dict | None = None) -> dict:
+    """
+    بدون دانلود مشخص می‌کند format_selector روی این ویدیو کدام فرمت(ها) را انتخاب می‌کند.
+    خروجی: {"id", "title", "format_id", "height", "resolution"}
+    """
+    ydl_opts = {
+        "quiet": True,
+        "no_warnings": True,
+        "noplaylist": True,
+    }
+    if format_selector:
+        ydl_opts["format"] = format_selector
+
+    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+        r = _extract_or_reuse(ydl, url, info, download=False)
+    return {k: r.get(k) for k in ("id", "title", "format_id", "height", "resolution")}
+
+
+def _download_tracks_parallel(
+    url: str,
+    name: str,
+    tmpdir: str,
+    base_opts: dict,
+    format_selector: str | None,
+    merge_container: str,
+    info: dict | None = None,
+):
+    """
+    ترک‌های requested_formats را در threadهای جدا دانلود و با ffmpeg (بدون re-encode) merge می‌کند.
+    اگر فرمت انتخاب‌شده یک فایل واحد باشد None برمی‌گرداند تا مسیر عادی استفاده شود.
+    """
+    probe_opts = {k: base_opts[k] for k in ("quiet", "no_warnings", "verbose", "noplaylist") if k in base_opts}
+    if format_selector:
+        probe_opts["format"] = format_selector
+
+    with yt_dlp.YoutubeDL(probe_opts) as ydl:
+        info = _extract_or_reuse(ydl, url, info, download=False)
+
+    tracks = info.get("requested_formats") or []
+    if len(tracks) < 2:
+        return None
+
+    final = Path(tmpdir) / f"{name}.{merge_container}"
+    if final.exists():
+        info["filepath"] = str(final)
+        return info, str(final)
+
+    def _one(fmt: dict) -> str:
+        opts = dict(base_opts)
+        opts.pop("merge_output_format", None)
+        opts["format"] = fmt["format_id"]
+        opts["outtmpl"] = str(Path(tmpdir) / f"{name}.f{fmt['format_id']}.%(ext)s")
+        with yt_dlp.YoutubeDL(opts) as ydl:
+            r = ydl.process_ie_result(copy.deepcopy(info), download=True)
+            return _extract_final_filepath(r) or ydl.prepare_filename(r)
+
+    with ThreadPoolExecutor(max_workers=len(tracks)) as ex:
+        paths = list(ex.map(_one, tracks))
+
+    cmd = ["ffmpeg", "-y", "-hide_banner", "-nostdin", "-loglevel", "error"]
+    for p in paths:
+        cmd += ["-i", p]
+    for i in range(len(paths)):
+        cmd += ["-map", str(i)]
+    cmd += ["-c", "copy", str(final)]
+
+    res = subprocess.run(cmd, capture_output=True, text=True)
+    if res.returncode != 0:
+        final.unlink(missing_ok=True)
+        raise RuntimeError(f"ffmpeg merge failed ({res.returncode}): {res.stderr.strip()[-500:]}")
+
+    for p in paths:
+        Path(p).unlink(missing_ok=True)
+
+    info["filepath"] = str(final)
+    return info, str(final)
+
+
+def download_youtube_temp(
+    url: str,
+    name: str,
+    *,
+    progress_cb=None,
+    format_selector: str | None = None,
+    merge_container: str = "mkv",   # پیش‌فرض پایدارتر از mp4 برای مرج [web:1016]
+    workdir: str | None = None,
+    engine: str = "default",
+    fragments: int = 4,
+    buffersize: int | None = None,
+    http_chunk_size: int | None = None,
+    extra_hooks: list | None = None,
+    info: dict | None = None,
+    debug: bool = False,
+):
+    """
+    خروجی: (info, file_path, tmpdir)
+
+    progress_cb: تابع sync که dict پیشرفت را می‌گیرد.
+    format_selector: مثل 'bv*[height<=1080]+ba/b[height<=1080]' و ...
+    merge_container: 'mkv' یا 'mp4'
+    workdir: اگر داده شود به جای tempdir در این پوشه دانلود می‌شود (پوشه staging آیتم).
+             در این حالت پوشه بعد از خطا پاک نمی‌شود تا فایل‌های .part در تلاش بعدی resume شوند.
+    engine: یکی از DOWNLOAD_ENGINES؛ fragments تعداد فرگمنت همزمان،
+            buffersize/http_chunk_size (بایت) تنظیمات اختیاری هر کانکشن.
+    extra_hooks: progress hook های خام yt-dlp (مثلاً برای benchmark).
+    info: خروجی extract_info که قبلاً گرفته شده (probe_cache)؛ اگر باشد extract تکرار نمی‌شود.
+    debug: اگر True باشد لاگ کامل yt-dlp/ffmpeg را می‌دهد.
+    """
+    if workdir:
+        Path(workdir).mkdir(parents=True, exist_ok=True)
+        tmpdir = workdir
+    else:
+        tmpdir = tempfile.mkdtemp(prefix="ytdlp_")
+    outtmpl = str(Path(tmpdir) / f"{name}.%(ext)s")
+
+    hook = _ProgressHook(progress_cb)
+
     ydl_opts = {
         "outtmpl": outtmpl,
         "noplaylist": True,
-        "progress_hooks": [hook],
+        "progress_hooks": [hook, *(extra_hooks or [])],
 
         # اگر debug روشن شد، خروجی کامل می‌گیری (برای دیدن خطای دقیق ffmpeg) [web:1004]
         "quiet": (not debug),
@@ -127,14 +328,26 @@ def download_youtube_temp(
         # مرج/ریمکس:
         # mkv برای مرج پایدارتره و faststart mp4 را دور می‌زند [web:1016]
         "merge_output_format": merge_container,
+
+        # resume: فایل‌های .part ادامه داده می‌شوند و فایل نهایی موجود دوباره دانلود نمی‌شود
+        "continuedl": True,
+        "nopart": False,
+        "overwrites": False,
     }
+    ydl_opts.update(_engine_opts(engine, fragments, buffersize, http_chunk_size))
 
     if format_selector:
         ydl_opts["format"] = format_selector
 
     try:
+        if engine == "parallel":
+            res = _download_tracks_parallel(url, name, tmpdir, ydl_opts, format_selector, merge_container, info)
+            if res is not None:
+                info, file_path = res
+                return info, file_path, tmpdir
+
         with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            info = ydl.extract_info(url, download=True)
+            info = _extract_or_reuse(ydl, url, info, download=True)
 
             file_path = _extract_final_filepath(info)
             if not file_path:
@@ -144,5 +357,199 @@ def download_youtube_temp(
             return info, file_path, tmpdir
 
     except Exception:
-        shutil.rmtree(tmpdir, ignore_errors=True)
+        if not workdir:
+            shutil.rmtree(tmpdir, ignore_errors=True)
         raise
+
+
+# codec هایی که بدون re-encode داخل mp4 می‌نشینند (نام‌های ffprobe)
+MP4_VIDEO_CODECS = {"h264", "hevc", "av1", "vp9"}
+MP4_AUDIO_CODECS = {"aac", "mp3", "opus", "ac3", "eac3"}
+
+
+def _probe_stream_codecs(file_path: str) -> list[tuple[str, str]]:
+    """خروجی: [(codec_type, codec_name), ...] با ffprobe"""
+    res = subprocess.run(
+        [
+            "ffprobe", "-v", "error",
+            "-show_entries", "stream=codec_type,codec_name",
+            "-of", "json",
+            file_path,
+        ],
+        capture_output=True,
+        text=True,
+    )
+    if res.returncode != 0:
+        raise RuntimeError(f"ffprobe failed ({res.returncode}): {res.stderr.strip()[-300:]}")
+
+    streams = json.loads(res.stdout or "{}").get("streams") or []
+    return [(st.get("codec_type"), st.get("codec_name")) for st in streams]
+
+
+def remux_faststart(file_path: str) -> tuple[str, float, str | None]:
+    """
+    فایل دانلودشده را بدون re-encode (-c copy) به mp4 با moov در ابتدای فایل (+faststart)
+    تبدیل می‌کند تا پردازش یوتیوب بعد از آپلود سریع‌تر شروع شود.
+    اگر codec ها در mp4 جا نشوند فایل اصلی (mkv) دست نمی‌خورد.
+
+    خروجی: (file_path نهایی, ثانیه‌های remux, دلیل fallback یا None)
+    """
+    src = Path(file_path)
+    if src.suffix.lower() == ".mp4":
+        return file_path, 0.0, "already mp4"
+
+    streams = _probe_stream_codecs(file_path)
+    bad = [
+        f"{t}:{c}"
+        for t, c in streams
+        if (t == "video" and c not in MP4_VIDEO_CODECS) or (t == "audio" and c not in MP4_AUDIO_CODECS)
+    ]
+    if bad:
+        return file_path, 0.0, f"codec not mp4-friendly ({', '.join(bad)})"
+
+    dst = src.with_suffix(".mp4")
+    tmp = src.with_suffix(".remux.mp4")
+    t0 = time.monotonic()
+    cmd = [
+        "ffmpeg", "-y", "-hide_banner", "-nostdin", "-loglevel", "error",
+        "-i", str(src),
+        "-map", "0:v", "-map", "0:a?",
+        "-c", "copy",
+        "-movflags", "+faststart",
+        str(tmp),
+    ]
+    res = subprocess.run(cmd, capture_output=True, text=True)
+    if res.returncode != 0:
+        tmp.unlink(missing_ok=True)
+        return file_path, time.monotonic() - t0, f"ffmpeg remux failed: {res.stderr.strip()[-300:]}"
+
+    tmp.replace(dst)
+    src.unlink(missing_ok=True)
+    return str(dst), time.monotonic() - t0, None
+
+
+class _BenchmarkStop(DownloadCancelled):
+    pass
+
+
+def benchmark_download_engines(
+    url: str,
+    configs: list[dict],
+    *,
+    format_selector: str | None = None,
+    seconds: float = 30.0,
+) -> list[dict]:
+    """
+    تنظیمات مختلف موتور دانلود را روی لینک واقعی مقایسه می‌کند.
+    configs: لیست dict با کلیدهای name/engine/fragments/buffersize/http_chunk_size
+    هر تنظیم حداکثر `seconds` ثانیه (از اولین بایت) دانلود می‌کند و فایل‌ها پاک می‌شوند.
+    خروجی: لیست {name, bytes, seconds, speed, error}
+    """
+    results = []
+    for cfg in configs:
+        tmpdir = tempfile.mkdtemp(prefix="ytdlp_bench_")
+        lock = threading.Lock()
+        counted = {}
+        t_first = {"t": None}
+
+        def hook(d, counted=counted, t_first=t_first, lock=lock):
+            if d.get("status") != "downloading":
+                return
+            key = (d.get("info_dict") or {}).get("format_id") or d.get("filename")
+            with lock:
+                if t_first["t"] is None:
+                    t_first["t"] = time.monotonic()
+                counted[key] = d.get("downloaded_bytes") or 0
+                elapsed = time.monotonic() - t_first["t"]
+            if elapsed >= seconds:
+                raise _BenchmarkStop()
+
+        error = None
+        try:
+            download_youtube_temp(
+                url,
+                "bench",
+                format_selector=format_selector,
+                workdir=tmpdir,
+                engine=cfg.get("engine", "default"),
+                fragments=cfg.get("fragments", 4),
+                buffersize=cfg.get("buffersize"),
+                http_chunk_size=cfg.get("http_chunk_size"),
+                extra_hooks=[hook],
+            )
+        except _BenchmarkStop:
+            pass
+        except Exception as e:
+            if not isinstance(e.__cause__ or e.__context__, _BenchmarkStop):
+                error = f"{type(e).__name__}: {e}"
+        finally:
+            shutil.rmtree(tmpdir, ignore_errors=True)
+
+        elapsed = (time.monotonic() - t_first["t"]) if t_first["t"] is not None else 0.0
+        total = sum(counted.values())
+        results.append(
+            {
+                "name": cfg.get("name") or cfg.get("engine", "default"),
+                "bytes": total,
+                "seconds": elapsed,
+                "speed": (total / elapsed) if elapsed > 0 else 0.0,
+                "error": error,
+            }
+        )
+
+    return results
+
+
+def open_youtube_stream(url: str, *, format_selector: str | None = None, info: dict | None = None):
+    """
+    حالت streaming: به جای دانلود روی دیسک، ffmpeg ترک‌های ویدیو/صدا را مستقیم
+    از یوتیوب می‌خواند و خروجی mux شده (matroska) را روی stdout می‌دهد.
+
+    خروجی: (info, proc)
+    proc.stdout را باید خواند و در پایان wait_youtube_stream(proc) را صدا زد.
+    """
+    ydl_opts = {
+        "quiet": True,
+        "no_warnings": True,
+        "noplaylist": True,
+    }
+    if format_selector:
+        ydl_opts["format"] = format_selector
+
+    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+        info = _extract_or_reuse(ydl, url, info, download=False)
+
+    formats = info.get("requested_formats") or [info]
+
+    cmd = ["ffmpeg", "-hide_banner", "-nostdin", "-loglevel", "error"]
+    for f in formats:
+        headers = f.get("http_headers") or {}
+        if headers:
+            cmd += ["-headers", "".join(f"{k}: {v}\r\n" for k, v in headers.items())]
+        cmd += ["-i", f["url"]]
+    for i in range(len(formats)):
+        cmd += ["-map", str(i)]
+    # matroska روی pipe بدون seek قابل نوشتن است (برخلاف mp4)
+    cmd += ["-c", "copy", "-f", "matroska", "pipe:1"]
+
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+    # stderr باید خالی شود وگرنه ffmpeg قفل می‌کند؛ چند خط آخر برای گزارش خطا نگه داشته می‌شود
+    tail = deque(maxlen=20)
+
+    def _drain_stderr():
+        for line in proc.stderr:
+            tail.append(line.decode("utf-8", "replace").rstrip())
+
+    threading.Thread(target=_drain_stderr, daemon=True).start()
+    proc.stderr_tail = tail
+
+    return info, proc
+
+
+def wait_youtube_stream(proc, timeout: float | None = None) -> None:
+    """منتظر پایان ffmpeg می‌ماند و اگر با خطا تمام شد RuntimeError می‌دهد."""
+    rc = proc.wait(timeout=timeout)
+    if rc != 0:
+        tail = " | ".join(getattr(proc, "stderr_tail", []) or [])
+        raise RuntimeError(f"ffmpeg stream exited with code {rc}: {tail}")
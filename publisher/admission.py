@@ -0,0 +1,62 @@
+import os
+import shutil
+from pathlib import Path
+
+from bot.config import DISK_MIN_FREE_MB, DISK_PEAK_FACTOR, STAGING_BUDGET_MB, STAGING_DIR
+from publisher import quality
+
+MB = 1024 * 1024
+
+
+def dir_bytes(path: str) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+def headroom(reservations: dict[int, int]) -> int:
+    """
+    فضای قابل رزرو برای دانلود جدید:
+    فضای آزاد دیسک منهای DISK_MIN_FREE_MB و رزروهای جاری،
+    و اگر STAGING_BUDGET_MB تنظیم شده باشد، حداکثر باقیمانده همان بودجه.
+    """
+    Path(STAGING_DIR).mkdir(parents=True, exist_ok=True)
+    reserved = sum(reservations.values())
+    room = shutil.disk_usage(STAGING_DIR).free - DISK_MIN_FREE_MB * MB - reserved
+    if STAGING_BUDGET_MB > 0:
+        room = min(room, STAGING_BUDGET_MB * MB - dir_bytes(STAGING_DIR) - reserved)
+    return room
+
+
+def need_bytes(est: int | None, already: int = 0) -> int | None:
+    """
+    فضای لازم برای دانلود: ترک‌ها + فایل merge/remux هم‌زمان روی دیسک هستند (DISK_PEAK_FACTOR).
+    بایت‌هایی که از قبل (فایل .part) در پوشه آیتم هست کم می‌شود.
+    """
+    if not est:
+        return None
+    return max(0, int(est * DISK_PEAK_FACTOR) - already)
+
+
+def plan(desc: dict, start_height: int | None, room: int, already: int = 0) -> tuple[int | None, int | None]:
+    """
+    از start_height به پایین (پله‌های نردبان کیفیت که در desc موجودند) اولین height که جا می‌شود.
+    desc: خروجی probe_cache.describe_heights
+    خروجی: (height, need) — height=None یعنی هیچ پله‌ای جا نمی‌شود.
+    اندازه نامعلوم (need=None) پذیرفته می‌شود چون تخمینی برای رد کردن نداریم.
+    """
+    if start_height is None:
+        return None, None
+
+    available = set(desc.get("heights") or [])
+    candidates = [start_height] + [h for h in quality.ladder_heights() if h < start_height and h in available]
+    for h in candidates:
+        need = need_bytes(desc["sizes"].get(h), already)
+        if need is None or need <= room:
+            return h, need
+    return None, need_bytes(desc["sizes"].get(start_height), already)
@@ -0,0 +1,128 @@
+import asyncio
+import re
+from urllib.parse import urlparse
+
+from bot.config import BULK_MAX_ITEMS, YOUTUBE_API_KEY
+from downloader.ytdlp_downloader import expand_youtube_flat
+from shared import db as dbmod
+from shared.youtube_public import ID_RE, extract_video_id, get_client, parse_iso8601_duration_to_seconds
+
+# همان شرط add_link: ویدیوهای تا ۳ دقیقه وارد صف نمی‌شوند
+MIN_DURATION_S = 180
+
+# دلیل‌های رد شدن در گزارش
+R_INVALID = "لینک نامعتبر"
+R_EXPAND = "باز کردن playlist/کانال ناموفق"
+R_DUPLICATE = "تکراری (در صف هست)"
+R_NOT_FOUND = "پیدا نشد / خصوصی"
+R_SHORT = "زیر ۳ دقیقه"
+R_LIVE = "لایو / در انتظار پخش"
+R_LIMIT = f"بیشتر از سقف {BULK_MAX_ITEMS}"
+
+_TOKEN_RE = re.compile(r"\S+")
+
+
+def split_sources(text: str) -> list[str]:
+    return [t.strip("<>()[],;\"'") for t in _TOKEN_RE.findall(text or "")]
+
+
+def _is_youtube_url(token: str) -> bool:
+    try:
+        host = (urlparse(token).netloc or "").lower()
+    except ValueError:
+        return False
+    return "youtube.com" in host or "youtu.be" in host
+
+
+def expand_sources(tokens: list[str], limit: int) -> tuple[list[str], list[tuple[str, str]]]:
+    """
+    (sync، در thread) لینک ویدیو -> id؛ لینک playlist/کانال -> idها با extract_flat yt-dlp.
+    خروجی: (idها به ترتیب و بدون تکرار، [(ورودی، دلیل رد)])
+    """
+    ids: list[str] = []
+    rejected: list[tuple[str, str]] = []
+    for tok in tokens:
+        if not tok:
+            continue
+        vid = extract_video_id(tok)
+        if vid:
+            ids.append(vid)
+            continue
+        if not _is_youtube_url(tok):
+            rejected.append((tok, R_INVALID))
+            continue
+        try:
+            ids.extend(expand_youtube_flat(tok, limit=limit + 1))
+        except Exception as e:
+            rejected.append((tok, f"{R_EXPAND}: {str(e)[:80]}"))
+    return list(dict.fromkeys(i for i in ids if ID_RE.match(i))), rejected
+
+
+def validate_items(items: dict[str, dict | None]) -> tuple[list[tuple[str, str, str]], list[tuple[str, str]]]:
+    """
+    items: خروجی MetadataClient.get_videos
+    خروجی: ([(video_id, title, description)], [(video_id, دلیل رد)])
+    """
+    ok, rejected = [], []
+    for vid, item in items.items():
+        if not item:
+            rejected.append((vid, R_NOT_FOUND))
+            continue
+        sn = item.get("snippet", {}) or {}
+        cd = item.get("contentDetails", {}) or {}
+        if (sn.get("liveBroadcastContent") or "none") != "none":
+            rejected.append((vid, R_LIVE))
+            continue
+        if parse_iso8601_duration_to_seconds((cd.get("duration") or "").strip()) <= MIN_DURATION_S:
+            rejected.append((vid, R_SHORT))
+            continue
+        ok.append((vid, (sn.get("title") or "").strip(), (sn.get("description") or "").strip()))
+    return ok, rejected
+
+
+async def import_links(con, text: str) -> dict:
+    """
+    کل مسیر /addbulk: باز کردن لینک‌ها، حذف تکراری‌ها، یک videos.list برای هر 50 id،
+    و insert همه آیتم‌های معتبر در یک transaction.
+    خروجی: {"ids": [item_id...], "accepted": [(video_id, title)], "rejected": [(ورودی، دلیل)]}
+    """
+    tokens = split_sources(text)
+    vids, rejected = await asyncio.to_thread(expand_sources, tokens, BULK_MAX_ITEMS)
+
+    existing = {extract_video_id(u) for u in dbmod.list_active_source_urls(con)}
+    fresh = []
+    for vid in vids:
+        if vid in existing:
+            rejected.append((vid, R_DUPLICATE))
+        elif len(fresh) >= BULK_MAX_ITEMS:
+            rejected.append((vid, R_LIMIT))
+        else:
+            fresh.append(vid)
+
+    found = await asyncio.to_thread(get_client(YOUTUBE_API_KEY).get_videos, fresh) if fresh else {}
+    ok, bad = validate_items({vid: found.get(vid) for vid in fresh})
+    rejected.extend(bad)
+
+    rows = [(f"https://www.youtube.com/watch?v={vid}", title, desc) for vid, title, desc in ok]
+    ids = dbmod.add_queue_items_bulk(con, rows) if rows else []
+    return {"ids": ids, "accepted": [(vid, title) for vid, title, _ in ok], "rejected": rejected}
+
+
+def summary_text(res: dict, max_lines: int = 10) -> str:
+    ids = res["ids"]
+    lines = [f"📥 addbulk: {len(ids)} آیتم به صف اضافه شد، {len(res['rejected'])} رد شد."]
+    if ids:
+        lines.append(f"شماره‌ها: #{ids[0]} … #{ids[-1]}" if len(ids) > 1 else f"شماره: #{ids[0]}")
+        for (vid, title), item_id in list(zip(res["accepted"], ids))[:max_lines]:
+            lines.append(f"✅ #{item_id} {title[:50] or vid}")
+        if len(ids) > max_lines:
+            lines.append(f"… و {len(ids) - max_lines} مورد دیگر")
+
+    by_reason: dict[str, list[str]] = {}
+    for src, reason in res["rejected"]:
+        by_reason.setdefault(reason, []).append(src)
+    for reason, srcs in by_reason.items():
+        shown = ", ".join(s[:60] for s in srcs[:max_lines])
+        more = f" … (+{len(srcs) - max_lines})" if len(srcs) > max_lines else ""
+        lines.append(f"❌ {reason} ({len(srcs)}): {shown}{more}")
+    return "\n".join(lines)
@@ -1,20 +1,69 @@
 import asyncio
+import json
+import logging
 import shutil
-import time
-from datetime import datetime
+from datetime import datetime, timedelta
 from zoneinfo import ZoneInfo
 
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup
-from telegram.error import BadRequest
 
-from bot.config import ADMIN_GROUP_ID
+from bot.config import (
+    ADMIN_GROUP_ID,
+    CATCHUP_INTERVAL_MIN,
+    CATCHUP_MAX_DAYS,
+    DOWNLOAD_BUFFER_KB,
+    DOWNLOAD_CONCURRENCY,
+    DOWNLOAD_ENGINE,
+    DOWNLOAD_FRAGMENTS,
+    DOWNLOAD_HTTP_CHUNK_MB,
+    PREFETCH_COUNT,
+    PREFETCH_LEAD_MIN,
+    PUBLISH_WORKERS,
+    QUALITY_LADDER,
+    RETRY_BASE_MIN,
+    RETRY_MAX_ATTEMPTS,
+    RETRY_MAX_MIN,
+    STREAM_CHUNK_MB,
+    STREAM_UPLOAD,
+    STREAM_WINDOW_CHUNKS,
+    TG_CHAT_MSGS_PER_MIN,
+    TG_PROGRESS_INTERVAL_S,
+    UPLOAD_FASTSTART,
+    UPLOAD_CHUNK_MAX_MB,
+    UPLOAD_CHUNK_MB,
+    UPLOAD_CHUNK_MIN_MB,
+    UPLOAD_CHUNK_MODE,
+    UPLOAD_CHUNK_TARGET_S,
+    UPLOAD_CONCURRENCY,
+)
+from publisher import admission, media_cache, probe_cache, quality, quota, slots, staging
+from publisher.telegram_out import PRIO_ERROR, PRIO_LOW, PRIO_NORMAL, ChatBudget, ProgressEditor, SendQueue
 from shared import db as dbmod
+from shared.youtube_public import extract_video_id
 
-from downloader.ytdlp_downloader import download_youtube_temp, probe_youtube_formats
-from uploader.youtube_uploader import upload_video
+from downloader.ytdlp_downloader import (
+    benchmark_download_engines,
+    download_youtube_temp,
+    open_youtube_stream,
+    remux_faststart,
+    resolve_format,
+    wait_youtube_stream,
+)
+from uploader.youtube_uploader import AdaptiveChunkPolicy, upload_stream, upload_video_async
+
+logger = logging.getLogger(__name__)
 
 TZ_IR = ZoneInfo("Asia/Tehran")
 
+# daily_publisher: اگر آیتم‌ها پشت سر هم خطا دادند، حداکثر این تعداد در یک اجرا امتحان می‌شود
+DAILY_MAX_PICKS = 3
+
+# آیتمی که بدون خطا عقب افتاد (فضای دیسک، انتظار انتخاب کیفیت) تا این مدت برداشته نمی‌شود
+DEFER_MIN = 15
+
+# سابقه اجرای slotها (slot_runs) تا این تعداد روز نگه داشته می‌شود
+SLOT_RUNS_KEEP_DAYS = 30
+
 
 def _now_str_ir() -> str:
     return datetime.now(TZ_IR).strftime("%Y-%m-%d %H:%M")
@@ -35,20 +84,123 @@ def _fmt_bytes(n):
     return f"{n:.1f}PB"
 
 
-async def _safe_send(context, text: str):
-    try:
-        await context.bot.send_message(ADMIN_GROUP_ID, text)
-    except BadRequest:
-        return
-    except Exception:
-        return
+def _chat_budget(context) -> ChatBudget:
+    """بودجه مشترک ارسال/ادیت برای ADMIN_GROUP_ID."""
+    bd = context.application.bot_data
+    if "chat_budget" not in bd:
+        bd["chat_budget"] = ChatBudget(TG_CHAT_MSGS_PER_MIN)
+    return bd["chat_budget"]
 
 
-async def _safe_edit(context, message_id: int, text: str):
-    try:
-        await context.bot.edit_message_text(chat_id=ADMIN_GROUP_ID, message_id=message_id, text=text)
-    except Exception:
-        return
+def _outbox(context) -> SendQueue:
+    bd = context.application.bot_data
+    if "outbox" not in bd:
+        bd["outbox"] = SendQueue(context.bot, ADMIN_GROUP_ID, _chat_budget(context))
+    return bd["outbox"]
+
+
+async def _safe_send(context, text: str, *, priority: int = PRIO_NORMAL, reply_markup=None):
+    """پیام به ADMIN_GROUP_ID از طریق صف خروجی؛ منتظر ارسال نمی‌ماند."""
+    _outbox(context).send(text, priority=priority, reply_markup=reply_markup)
+
+
+async def _send_tracked(context, text: str, *, priority: int = PRIO_NORMAL, reply_markup=None):
+    """مثل _safe_send ولی منتظر ارسال می‌ماند و Message (یا None) برمی‌گرداند."""
+    return await _outbox(context).send(text, priority=priority, reply_markup=reply_markup)
+
+
+def _progress_editor(context) -> ProgressEditor:
+    bd = context.application.bot_data
+    if "progress_editor" not in bd:
+        bd["progress_editor"] = ProgressEditor(
+            context.bot, ADMIN_GROUP_ID, _chat_budget(context), interval=TG_PROGRESS_INTERVAL_S
+        )
+    return bd["progress_editor"]
+
+
+def _progress_reporter(context, message_id: int | None, header: str):
+    """
+    progress_cb مشترک دانلود و آپلود؛ از thread کارگر صدا زده می‌شود و فقط آخرین
+    وضعیت را به ProgressEditor می‌دهد (ادیت‌ها آنجا coalesce و rate-limit می‌شوند).
+    """
+    loop = asyncio.get_running_loop()
+    editor = _progress_editor(context)
+
+    def progress_cb(p: dict):
+        if message_id is None:
+            return
+        done = p.get("downloaded") if "downloaded" in p else p.get("uploaded")
+        total = p.get("total") or 0
+        percent = p.get("percent")
+        speed = p.get("speed")
+        eta = p.get("eta")
+
+        percent_str = f"{percent:.1f}%" if percent is not None else "?"
+        total_str = _fmt_bytes(total) if total else "?"
+        text = (
+            f"{header}\n"
+            f"{percent_str}  ({_fmt_bytes(done)} / {total_str})\n"
+            f"⚡️ speed={_fmt_bytes(speed)}/s  ⏳ eta={eta}s"
+        )
+
+        loop.call_soon_threadsafe(editor.update, message_id, text)
+
+    return progress_cb
+
+
+def _session_saver(context, con, item_id: int, file_path: str):
+    """
+    on_session برای uploader: از thread آپلود صدا زده می‌شود و نوشتن در SQLite را
+    به event loop می‌سپارد تا همه دسترسی‌های DB روی یک thread بمانند.
+    """
+    loop = asyncio.get_running_loop()
+
+    def on_session(rec: dict | None):
+        if rec is None:
+            # uploader یک videos.insert تازه شروع می‌کند (session نبود، فایل عوض شده یا session از دست رفت)
+            loop.call_soon_threadsafe(dbmod.delete_upload_session, con, item_id)
+            loop.call_soon_threadsafe(_charge_upload, context, con, item_id)
+            return
+        loop.call_soon_threadsafe(
+            dbmod.save_upload_session,
+            con,
+            item_id,
+            rec["session_uri"],
+            file_path,
+            rec["file_fingerprint"],
+            rec["offset"],
+        )
+
+    return on_session
+
+
+def _chunk_policy() -> AdaptiveChunkPolicy | None:
+    if UPLOAD_CHUNK_MODE != "adaptive":
+        return None
+    return AdaptiveChunkPolicy(
+        UPLOAD_CHUNK_MIN_MB * 1024 * 1024,
+        UPLOAD_CHUNK_MAX_MB * 1024 * 1024,
+        UPLOAD_CHUNK_TARGET_S,
+    )
+
+
+def _chunk_recorder(con, item_id: int):
+    """chunk_cb برای uploader: زمان هر چانک را (روی event loop) در upload_chunk_stats ثبت می‌کند."""
+    loop = asyncio.get_running_loop()
+
+    def chunk_cb(c: dict):
+        loop.call_soon_threadsafe(
+            dbmod.add_upload_chunk_stat,
+            con,
+            item_id,
+            c["seq"],
+            c["offset"],
+            c["bytes"],
+            c["chunksize"],
+            c["seconds"],
+        )
+
+    return chunk_cb
 
 
 def _row_to_dict(it):
@@ -61,16 +213,34 @@ def _row_to_dict(it):
     return {}
 
 
-def _pick_url(it: dict) -> str:
-    return (it.get("source_url") or it.get("url") or it.get("link") or "").strip()
+def _pipeline_limits(context) -> dict:
+    """
+    سمافورهای مشترک دانلود/آپلود؛ یک بار در bot_data ساخته می‌شوند
+    تا daily_publisher، publish_now و drain همه از یک سقف پیروی کنند.
+    """
+    bd = context.application.bot_data
+    limits = bd.get("pipeline_limits")
+    if limits is None:
+        limits = {
+            "download": asyncio.Semaphore(max(1, DOWNLOAD_CONCURRENCY)),
+            "upload": asyncio.Semaphore(max(1, UPLOAD_CONCURRENCY)),
+        }
+        bd["pipeline_limits"] = limits
+    return limits
+
+
+def download_engine_kwargs() -> dict:
+    """تنظیمات موتور دانلود از env برای download_youtube_temp."""
+    return {
+        "engine": DOWNLOAD_ENGINE,
+        "fragments": DOWNLOAD_FRAGMENTS,
+        "buffersize": DOWNLOAD_BUFFER_KB * 1024 or None,
+        "http_chunk_size": DOWNLOAD_HTTP_CHUNK_MB * 1024 * 1024 or None,
+    }
 
 
-def _hires_format_selector() -> str:
-    # فقط 4K یا 1080: اول 2160، اگر نبود 1080 [web:610]
-    return (
-        "bv*[height=2160]+ba/b[height=2160]/"
-        "bv*[height=1080]+ba/b[height=1080]"
-    )
+def _pick_url(it: dict) -> str:
+    return (it.get("source_url") or it.get("url") or it.get("link") or "").strip()
 
 
 def _looks_like_no_requested_format(err: Exception) -> bool:
@@ -82,39 +252,362 @@ def _get_pending_quality(context, item_id: int) -> int | None:
     pending = context.application.bot_data.get("pending_quality") or {}
     rec = pending.get(item_id) or {}
     chosen = rec.get("chosen_height")
-    return int(chosen) if chosen else None
+    if chosen:
+        return int(chosen)
+    # بعد از ری‌استارت bot_data خالی است؛ انتخاب ثابت‌شده روی خود آیتم ذخیره شده
+    return dbmod.get_item_pinned_height(context.application.bot_data["db"], item_id)
 
 
 def _set_pending_quality(context, item_id: int, *, url: str, heights: list[int]):
     pending = context.application.bot_data.setdefault("pending_quality", {})
     pending[item_id] = {"url": url, "heights": heights, "chosen_height": None}
+    # کیفیت ثابت‌شده قبلی دیگر موجود نیست؛ منتظر انتخاب تازه
+    dbmod.set_item_pinned_height(context.application.bot_data["db"], item_id, None)
+
+
+def _format_for_item(context, item_id: int) -> str:
+    # انتخاب دستی (qpick) فقط override است؛ در حالت عادی نردبان کیفیت خودکار انتخاب می‌کند
+    chosen_height = _get_pending_quality(context, item_id)
+    if chosen_height:
+        return quality.height_selector(chosen_height)
+    return quality.ladder_selector()
+
+
+def _record_format(con, item_id: int, info: dict) -> None:
+    """فرمت و height انتخاب‌شده را روی آیتم ثبت می‌کند."""
+    try:
+        dbmod.set_item_format(con, item_id, info.get("format_id"), info.get("height"))
+    except Exception:
+        pass
+
+
+async def _prepare_for_upload(context, con, item_id: int, file_path: str, tag: str = "") -> str:
+    """
+    مرحله اختیاری UPLOAD_FASTSTART: remux به mp4 با moov در ابتدا؛ زمان remux روی آیتم ثبت می‌شود.
+    خروجی: مسیر فایلی که باید آپلود شود.
+    """
+    if not UPLOAD_FASTSTART:
+        return file_path
+
+    try:
+        new_path, seconds, note = await asyncio.to_thread(remux_faststart, file_path)
+    except Exception as e:
+        await _safe_send(context, f"{tag}⚠️ remux آیتم #{item_id} انجام نشد: {e}", priority=PRIO_LOW)
+        return file_path
+
+    container = new_path.rsplit(".", 1)[-1].lower()
+    try:
+        dbmod.set_item_remux(con, item_id, container, seconds)
+    except Exception:
+        pass
+
+    if note:
+        await _safe_send(context, f"{tag}ℹ️ آیتم #{item_id} بدون remux آپلود می‌شود ({container}): {note}", priority=PRIO_LOW)
+    else:
+        await _safe_send(context, f"{tag}🎞 remux به mp4 (faststart): #{item_id} در {seconds:.1f}s", priority=PRIO_LOW)
+    return new_path
+
+
+async def _media_cache_lookup(con, url: str, fmt: str) -> tuple[str, dict] | None:
+    """
+    قبل از دانلود: format_id که fmt انتخاب می‌کند را (از info همان probe، بدون extract اضافه)
+    پیدا می‌کند و در media_cache دنبال همان video_id + format_id می‌گردد.
+    """
+    vid = extract_video_id(url)
+    if not vid or not media_cache.enabled():
+        return None
+    try:
+        _, full = await probe_cache.get_probe(con, url, need_info=True)
+        sel = await asyncio.to_thread(resolve_format, url, fmt, full)
+    except Exception:
+        # خطای فرمت را خود دانلود گزارش می‌کند
+        return None
+
+    path = media_cache.lookup(con, vid, sel["format_id"])
+    return (path, sel) if path else None
+
+
+def _media_cache_store(con, url: str, info: dict, file_path: str) -> str | None:
+    vid = extract_video_id(url)
+    fid = info.get("format_id")
+    if not vid or not fid or not media_cache.enabled():
+        return None
+    try:
+        return media_cache.store(con, vid, fid, file_path)
+    except Exception:
+        return None
+
+
+def _retry_delay_s(prev_attempts: int) -> int:
+    # 15m, 30m, 1h, 2h, ... تا سقف RETRY_MAX_MIN
+    return min(RETRY_MAX_MIN, RETRY_BASE_MIN * 2 ** max(0, prev_attempts)) * 60
+
+
+async def _schedule_retry(context, con, item_id: int, prev_attempts: int, err: Exception, tag: str = "") -> None:
+    """
+    به جای برگشت به سر صف: تلاش ناموفق ثبت و آیتم با backoff عقب انداخته می‌شود
+    تا آیتم‌های پشت سرش گیر نکنند. بعد از RETRY_MAX_ATTEMPTS در status='failed' پارک می‌شود.
+    """
+    error = f"{type(err).__name__}: {err}"
+    delay = _retry_delay_s(prev_attempts)
+    try:
+        status, attempts = dbmod.record_failed_attempt(con, item_id, error, RETRY_MAX_ATTEMPTS, delay)
+    except Exception:
+        status, attempts = "unknown", prev_attempts + 1
+
+    if status == "failed":
+        # آیتم پارک‌شده معلوم نیست کی /retry شود؛ فایل و session آپلودش نباید بودجه staging را نگه دارد
+        staging.invalidate(con, item_id)
+        dbmod.delete_upload_session(con, item_id)
+        await _safe_send(
+            context,
+            f"{tag}⛔️ آیتم #{item_id} بعد از {attempts} تلاش پارک شد (failed): {error}\n"
+            f"برای تلاش دوباره: /retry {item_id}",
+            priority=PRIO_ERROR,
+        )
+    else:
+        await _safe_send(
+            context,
+            f"{tag}❌ خطا در پردازش آیتم #{item_id} (تلاش {attempts}/{RETRY_MAX_ATTEMPTS}): {error}\n"
+            f"🔁 تلاش بعدی حداقل {delay // 60} دقیقه دیگر",
+            priority=PRIO_ERROR,
+        )
+
+
+def _disk_reservations(context) -> dict:
+    """item_id -> بایت رزروشده برای دانلودهای در جریان."""
+    return context.application.bot_data.setdefault("disk_reservations", {})
+
+
+def _quota_reservations(context) -> dict:
+    """item_id -> واحد quota رزروشده برای آیتم‌های برداشته‌شده‌ای که هنوز videos.insert نزده‌اند."""
+    return context.application.bot_data.setdefault("quota_reservations", {})
+
+
+def _reserve_upload(context, con, item_id: int) -> bool:
+    res = _quota_reservations(context)
+    if item_id in res:
+        return True
+    if not quota.can_afford(con, "videos.insert", sum(res.values())):
+        return False
+    res[item_id] = quota.cost("videos.insert")
+    return True
+
+
+def _claim_next(context, con, exclude_ids=()) -> tuple[int | None, bool]:
+    """
+    pick_next_for_today فقط وقتی quota یک آپلود (با احتساب آپلودهای در جریان) باقی باشد،
+    تا دانلود برای آیتمی که امروز قابل آپلود نیست شروع نشود. بدون await بین چک و رزرو.
+    خروجی: (item_id | None, quota_ok)
+    """
+    res = _quota_reservations(context)
+    if not quota.can_afford(con, "videos.insert", sum(res.values())):
+        return None, False
+    item_id = dbmod.pick_next_for_today(con, exclude_ids=exclude_ids)
+    if item_id:
+        res[item_id] = quota.cost("videos.insert")
+    return item_id, True
+
+
+def _charge_upload(context, con, item_id: int) -> None:
+    """videos.insert واقعاً زده می‌شود: رزرو به مصرف ثبت‌شده در ledger تبدیل می‌شود."""
+    _quota_reservations(context).pop(item_id, None)
+    quota.spend(con, "videos.insert")
+
+
+def _quota_note(con) -> str:
+    reset = quota.next_reset().astimezone(TZ_IR).strftime("%Y-%m-%d %H:%M")
+    return f"باقیمانده quota: {quota.remaining(con)} واحد، reset: {reset} (ایران)"
+
+
+async def _admit_download(
+    context, con, item_id: int, url: str, fmt: str, chosen_height: int | None, tag: str = "", *, allow_downgrade: bool = True
+) -> str | None:
+    """
+    قبل از دانلود: حجم تخمینی (از probe) را با فضای دیسک و STAGING_BUDGET_MB مقایسه و رزرو می‌کند.
+    اگر جا نشد و allow_downgrade باشد، پایین‌ترین پله‌ای از نردبان که جا شود انتخاب می‌شود.
+    خروجی: format_selector برای دانلود، یا None یعنی فعلاً جا نیست (آیتم عقب می‌افتد).
+    """
+    try:
+        summary, _ = await probe_cache.get_probe(con, url)
+    except Exception:
+        # بدون probe تخمینی نداریم؛ خطای واقعی را خود دانلود نشان می‌دهد
+        return fmt
+
+    desc = probe_cache.describe_heights(summary)
+    start = chosen_height or quality.pick_height(desc)
+    if start is None:
+        return fmt
+
+    reservations = _disk_reservations(context)
+    reservations.pop(item_id, None)
+    room = admission.headroom(reservations)
+    already = admission.dir_bytes(staging.item_dir(item_id))
+    height, need = admission.plan(desc, start, room, already)
+
+    if height is None or (height != start and not allow_downgrade):
+        if allow_downgrade:
+            await _safe_send(
+                context,
+                f"{tag}💽 آیتم #{item_id} عقب افتاد: فضای دیسک کافی نیست "
+                f"(لازم ≈ {_fmt_bytes(need)}، قابل استفاده {_fmt_bytes(max(0, room))}).",
+                priority=PRIO_ERROR,
+            )
+        return None
+
+    if need:
+        reservations[item_id] = need
+
+    if height == start:
+        return fmt
+
+    # کیفیت پایین‌تر روی خود آیتم ثابت می‌شود تا فایل stage شده در تلاش بعدی (حتی بعد از ری‌استارت) معتبر بماند
+    pending = context.application.bot_data.setdefault("pending_quality", {})
+    pending[item_id] = {"url": url, "heights": desc["heights"], "chosen_height": height}
+    dbmod.set_item_pinned_height(con, item_id, height)
+    await _safe_send(
+        context,
+        f"{tag}💽 آیتم #{item_id}: فضای دیسک برای {start}p کافی نیست؛ با {height}p دانلود می‌شود "
+        f"(≈ {_fmt_bytes(need)}).",
+        priority=PRIO_ERROR,
+    )
+    return quality.height_selector(height)
+
+
+def _prefetching(context) -> dict:
+    """item_id -> asyncio.Event برای prefetchهای در جریان."""
+    return context.application.bot_data.setdefault("prefetching", {})
 
 
 async def _ask_quality(context, item_id: int, url: str):
-    info0 = await asyncio.to_thread(probe_youtube_formats, url)
-    formats = info0.get("formats") or []
+    con = context.application.bot_data["db"]
+    # خلاصه فرمت‌ها از cache (SQLite/حافظه)؛ فقط اگر کهنه باشد extract تازه زده می‌شود
+    summary, _ = await probe_cache.get_probe(con, url)
 
-    heights = sorted({f.get("height") for f in formats if f.get("height")}, reverse=True)
     # گزینه‌های معقول: از بزرگ به کوچک، حداکثر 8 گزینه
-    heights = [int(h) for h in heights if int(h) <= 2160][:8]
+    heights = probe_cache.available_heights(summary)[:8]
 
     if not heights:
-        await _safe_send(context, f"⚠️ آیتم #{item_id}: کیفیت قابل انتخاب پیدا نشد.\n{url}")
+        await _safe_send(context, f"⚠️ آیتم #{item_id}: کیفیت قابل انتخاب پیدا نشد.\n{url}", priority=PRIO_ERROR)
         return
 
     _set_pending_quality(context, item_id, url=url, heights=heights)
 
     keyboard = [[InlineKeyboardButton(f"{h}p", callback_data=f"qpick:{item_id}:{h}")] for h in heights]
-    await context.bot.send_message(
-        ADMIN_GROUP_ID,
-        f"⚠️ آیتم #{item_id}: 4K/1080 موجود نیست.\nیکی از کیفیت‌های زیر را انتخاب کن:",
+    await _safe_send(
+        context,
+        f"⚠️ آیتم #{item_id}: هیچ پله‌ای از نردبان کیفیت ({QUALITY_LADDER}) موجود نیست.\n"
+        f"یکی از کیفیت‌های زیر را انتخاب کن:",
+        priority=PRIO_ERROR,
         reply_markup=InlineKeyboardMarkup(keyboard),  # ساخت inline keyboard [web:705]
     )
 
 
-async def _process_item(context, con, item_id: int, *, set_today_done: bool):
+async def _handle_missing_format(context, con, item_id: int, url: str, chosen_height: int | None):
+    # اگر هنوز انتخاب نشده: دکمه‌ها را بفرست
+    if not chosen_height:
+        await _ask_quality(context, item_id, url)
+    else:
+        await _safe_send(
+            context,
+            f"⚠️ آیتم #{item_id}: کیفیت انتخاب‌شده ({chosen_height}p) موجود نیست.\n"
+            f"دوباره یکی را انتخاب کن:\n{url}",
+            priority=PRIO_ERROR,
+        )
+        await _ask_quality(context, item_id, url)
+
+    # تا انتخاب کیفیت (یا DEFER_MIN) بقیه صف منتظر این آیتم نمی‌ماند
+    try:
+        dbmod.defer_item(con, item_id, DEFER_MIN * 60)
+    except Exception:
+        pass
+
+
+async def probe_queue_item(context, item_id: int, url: str) -> str:
+    """
+    probe فرمت‌ها بلافاصله بعد از افزودن به صف؛ heightها، codecها و حجم تخمینی روی ردیف
+    queue_items ذخیره می‌شوند. اگر هیچ پله‌ای از نردبان کیفیت جور نبود همین حالا
+    انتخاب کیفیت پرسیده می‌شود، نه در زمان انتشار. خروجی: probe_status
+    """
+    con = context.application.bot_data["db"]
+    try:
+        summary, _ = await probe_cache.get_probe(con, url)
+    except Exception as e:
+        logger.warning("probe failed for item #%s: %s", item_id, e)
+        dbmod.set_item_probe(con, item_id, "error", None, None, None)
+        await _safe_send(context, f"⚠️ probe آیتم #{item_id} ناموفق بود: {type(e).__name__}: {e}\n{url}", priority=PRIO_ERROR)
+        return "error"
+
+    d = probe_cache.describe_heights(summary)
+    status = "ok" if quality.pick_height(d) else "lowres"
+    dbmod.set_item_probe(
+        con,
+        item_id,
+        status,
+        json.dumps(d["heights"]),
+        json.dumps(d["codecs"]),
+        json.dumps(d["sizes"]),
+    )
+
+    if status == "lowres" and not _get_pending_quality(context, item_id):
+        await _ask_quality(context, item_id, url)
+    return status
+
+
+def schedule_item_probe(context, item_id: int, url: str) -> None:
+    """probe را در پس‌زمینه اجرا می‌کند تا جواب کاربر معطل شبکه نشود."""
+    context.application.create_task(probe_queue_item(context, item_id, url))
+
+
+async def _stream_item(context, item_id: int, url: str, fmt: str, title: str, desc: str, tag: str):
+    """
+    حالت STREAM_UPLOAD: خروجی mux شده ffmpeg بدون فایل کامل روی دیسک، چانک به چانک
+    به resumable upload می‌رود. هم سهم دانلود و هم سهم آپلود را می‌گیرد.
+    خروجی: (info, resp)
+    """
+    limits = _pipeline_limits(context)
+    async with limits["download"], limits["upload"]:
+        info, proc = await asyncio.to_thread(
+            open_youtube_stream, url, format_selector=fmt, info=probe_cache.cached_info(url)
+        )
+        # از همین‌جا هر خطا (حتی قبل از شروع آپلود) باید ffmpeg را هم ببندد
+        try:
+            up_title = title or (info.get("title") or f"item {item_id}")
+
+            msg = await _send_tracked(
+                context,
+                f"{tag}📡 شروع stream دانلود→آپلود (public): #{item_id}\n📌 {up_title}\n"
+                f"🎞️ format_id={info.get('format_id')}",
+            )
+            _charge_upload(context, context.application.bot_data["db"], item_id)
+            resp = await asyncio.to_thread(
+                upload_stream,
+                proc.stdout,
+                up_title,
+                desc,
+                "public",
+                chunksize=STREAM_CHUNK_MB * 1024 * 1024,
+                window_chunks=STREAM_WINDOW_CHUNKS,
+                on_eof=lambda: wait_youtube_stream(proc, timeout=60),
+                progress_cb=_progress_reporter(context, msg.message_id if msg else None, f"{tag}📡 stream: #{item_id}"),
+            )
+        except BaseException:
+            proc.kill()
+            raise
+        finally:
+            proc.stdout.close()
+
+    return info, resp
+
+
+async def _process_item(context, con, item_id: int, *, worker: str | None = None) -> bool:
+    """
+    یک آیتم را کامل دانلود و آپلود می‌کند.
+    خروجی: True اگر آپلود انجام شد، False اگر آیتم به صف برگشت.
+    """
     now_str = _now_str_ir()
-    today = _today_ir()
+    tag = f"👷 {worker} | " if worker else ""
+    limits = _pipeline_limits(context)
 
     it = _row_to_dict(dbmod.get_queue_item(con, item_id))
     title = (it.get("title") or "").strip()
@@ -122,98 +615,117 @@ async def _process_item(context, con, item_id: int, *, set_today_done: bool):
     desc = (it.get("description") or "").strip()
 
     if not url:
-        await _safe_send(context, f"❌ آیتم #{item_id} لینک ندارد (source_url/url/link خالی است).")
-        if set_today_done:
-            dbmod.set_last_publish_day(con, today)
-        try:
-            dbmod.mark_back_to_queue(con, item_id)
-        except Exception:
-            pass
-        return
+        # با backoff عقب می‌افتد و بعد از RETRY_MAX_ATTEMPTS پارک می‌شود، نه اینکه هر slot دوباره برداشته شود
+        err = ValueError("آیتم لینک ندارد (source_url/url/link خالی است)")
+        await _schedule_retry(context, con, item_id, int(it.get("attempts") or 0), err, tag)
+        return False
 
     tmpdir = None
-    progress_msg_id = None
+    resp = None
+    file_path = None
+    cache_hit = False
+    done = False
 
     try:
-        msg = await context.bot.send_message(ADMIN_GROUP_ID, f"⬇️ شروع دانلود: #{item_id}\n🔗 {url}")
-        progress_msg_id = msg.message_id
-
-        loop = asyncio.get_running_loop()
-        last_edit = {"t": 0.0}
-
-        def progress_cb(p: dict):
-            now = time.time()
-            if now - last_edit["t"] < 7:
-                return
-            last_edit["t"] = now
-
-            downloaded = p.get("downloaded") or 0
-            total = p.get("total") or 0
-            percent = p.get("percent")
-            speed = p.get("speed")
-            eta = p.get("eta")
-
-            percent_str = f"{percent:.1f}%" if percent is not None else "?"
-            total_str = _fmt_bytes(total) if total else "?"
-            text = (
-                f"⬇️ دانلود: #{item_id}\n"
-                f"{percent_str}  ({_fmt_bytes(downloaded)} / {total_str})\n"
-                f"⚡️ speed={_fmt_bytes(speed)}/s  ⏳ eta={eta}s"
+        chosen_height = _get_pending_quality(context, item_id)
+        fmt = _format_for_item(context, item_id)
+
+        # اگر prefetch همین آیتم در جریان است، صبر کن تا دوباره دانلود نشود
+        ev = _prefetching(context).get(item_id)
+        if ev is not None:
+            await _safe_send(context, f"{tag}⏳ آیتم #{item_id} در حال prefetch است؛ صبر می‌کنم…", priority=PRIO_LOW)
+            await ev.wait()
+
+        # فایل آماده (prefetch یا دانلود کامل تلاش قبلی) بدون دانلود دوباره استفاده می‌شود
+        staged = staging.take_staged(con, item_id, fmt)
+        # همین ویدیو با همین format_id قبلاً آپلود شده بود (مثلاً دوباره به صف اضافه شده)
+        cached = None if staged else await _media_cache_lookup(con, url, fmt)
+
+        if staged:
+            file_path, info = staged
+            tmpdir = staging.item_dir(item_id)
+            await _safe_send(context, f"{tag}📦 فایل آماده از قبل استفاده شد: #{item_id}", priority=PRIO_LOW)
+        elif cached:
+            file_path, info = cached
+            cache_hit = True
+            await _safe_send(
+                context,
+                f"{tag}♻️ فایل از media cache استفاده شد (بدون دانلود): #{item_id} format_id={info.get('format_id')}",
+                priority=PRIO_LOW,
             )
+        elif STREAM_UPLOAD:
+            # streaming روی دیسک چیزی نمی‌نویسد؛ admission لازم نیست
+            try:
+                info, resp = await _stream_item(context, item_id, url, fmt, title, desc, tag)
+            except Exception as e:
+                if _looks_like_no_requested_format(e):
+                    await _handle_missing_format(context, con, item_id, url, chosen_height)
+                    return False
+                raise
+        else:
+            fmt = await _admit_download(context, con, item_id, url, fmt, chosen_height, tag)
+            if fmt is None:
+                dbmod.defer_item(con, item_id, DEFER_MIN * 60)
+                return False
+
+            msg = await _send_tracked(context, f"{tag}⬇️ شروع دانلود: #{item_id}\n🔗 {url}")
+            progress_cb = _progress_reporter(context, msg.message_id if msg else None, f"{tag}⬇️ دانلود: #{item_id}")
+
+            try:
+                async with limits["download"]:
+                    # پوشه staging ماندگار: .part ها و فایل نهایی بین تلاش‌ها و ری‌استارت‌ها می‌مانند
+                    info, file_path, tmpdir = await asyncio.to_thread(
+                        download_youtube_temp,
+                        url,
+                        f"item_{item_id}",
+                        progress_cb=progress_cb,
+                        format_selector=fmt,
+                        workdir=staging.item_dir(item_id),
+                        info=probe_cache.cached_info(url),
+                        **download_engine_kwargs(),
+                    )
+            except Exception as e:
+                if _looks_like_no_requested_format(e):
+                    await _handle_missing_format(context, con, item_id, url, chosen_height)
+                    return False
+                raise
 
-            loop.call_soon_threadsafe(
-                lambda: asyncio.create_task(_safe_edit(context, progress_msg_id, text))
-            )
+            file_path = await _prepare_for_upload(context, con, item_id, file_path, tag)
 
-        chosen_height = _get_pending_quality(context, item_id)
-        if chosen_height:
-            fmt = f"bv*[height={chosen_height}]+ba/b[height={chosen_height}]"  # انتخاب بر اساس height [web:610]
-        else:
-            fmt = _hires_format_selector()
+            # اگر آپلود شکست خورد، تلاش بعدی همین فایل را دوباره استفاده می‌کند
+            staging.record(con, item_id, file_path, fmt, info, pinned=True)
 
-        try:
-            info, file_path, tmpdir = await asyncio.to_thread(
-                download_youtube_temp,
-                url,
-                f"item_{item_id}",
-                progress_cb=progress_cb,
-                format_selector=fmt,
+            await _safe_send(
+                context,
+                f"{tag}✅ دانلود تمام شد: #{item_id}\n🎞️ resolution={info.get('resolution')} format_id={info.get('format_id')}",
+                priority=PRIO_LOW,
             )
-        except Exception as e:
-            if _looks_like_no_requested_format(e):
-                # اگر هنوز انتخاب نشده: دکمه‌ها را بفرست
-                if not chosen_height:
-                    await _ask_quality(context, item_id, url)
-                else:
-                    await _safe_send(
-                        context,
-                        f"⚠️ آیتم #{item_id}: کیفیت انتخاب‌شده ({chosen_height}p) موجود نیست.\n"
-                        f"دوباره یکی را انتخاب کن:\n{url}"
-                    )
-                    await _ask_quality(context, item_id, url)
-
-                try:
-                    dbmod.mark_back_to_queue(con, item_id)
-                except Exception:
-                    pass
-                return
-            raise
 
-        await _safe_send(
-            context,
-            f"✅ دانلود تمام شد: #{item_id}\n🎞️ resolution={info.get('resolution')} format_id={info.get('format_id')}"
-        )
+        _record_format(con, item_id, info)
 
         up_title = title or (info.get("title") or f"item {item_id}")
         up_desc = desc
 
-        await _safe_send(context, f"⬆️ شروع آپلود یوتیوب (public): #{item_id}\n📌 {up_title}")
-        resp = upload_video(
-            file_path=file_path,
-            title=up_title,
-            description=up_desc,
-            privacy_status="public",
-        )
+        if resp is None:
+            async with limits["upload"]:
+                session = _row_to_dict(dbmod.get_upload_session(con, item_id)) or None
+                resume_note = f"\n♻️ ادامه session قبلی از {_fmt_bytes(session['offset_bytes'])}" if session else ""
+                msg = await _send_tracked(
+                    context, f"{tag}⬆️ شروع آپلود یوتیوب (public): #{item_id}\n📌 {up_title}{resume_note}"
+                )
+                resp = await upload_video_async(
+                    file_path,
+                    up_title,
+                    up_desc,
+                    "public",
+                    progress_cb=_progress_reporter(context, msg.message_id if msg else None, f"{tag}⬆️ آپلود: #{item_id}"),
+                    chunksize=UPLOAD_CHUNK_MB * 1024 * 1024,
+                    session=session,
+                    on_session=_session_saver(context, con, item_id, file_path),
+                    chunk_policy=_chunk_policy(),
+                    chunk_cb=_chunk_recorder(con, item_id),
+                )
+            dbmod.delete_upload_session(con, item_id)
         yt_id = (resp or {}).get("id")
 
         try:
@@ -221,55 +733,393 @@ async def _process_item(context, con, item_id: int, *, set_today_done: bool):
         except Exception:
             pass
 
-        if set_today_done:
-            dbmod.set_last_publish_day(con, today)
-
-        await _safe_send(context, f"🎬 ✅ آپلود انجام شد: #{item_id}\nvideo_id={yt_id}\n⏱ {now_str}")
+        done = True
+        if cache_hit:
+            media_cache.record_hit(con, file_path)
+        elif file_path:
+            _media_cache_store(con, url, info, file_path)
+        await _safe_send(context, f"{tag}🎬 ✅ آپلود انجام شد: #{item_id}\nvideo_id={yt_id}\n⏱ {now_str}")
+        return True
 
     except Exception as e:
-        try:
+        if _is_quota_error(e):
+            # تقصیر آیتم نیست: بدون شمردن تلاش به صف برمی‌گردد و ledger تا reset پر حساب می‌شود
+            quota.mark_exhausted(con)
             dbmod.mark_back_to_queue(con, item_id)
-        except Exception:
-            pass
-        await _safe_send(context, f"❌ خطا در پردازش آیتم #{item_id}: {type(e).__name__}: {e}")
+            await _safe_send(context, f"{tag}⛽️ quota یوتیوب تمام شد؛ آیتم #{item_id} به صف برگشت.\n{_quota_note(con)}", priority=PRIO_ERROR)
+            raise
+        await _schedule_retry(context, con, item_id, int(it.get("attempts") or 0), e, tag)
         raise
 
     finally:
-        if tmpdir:
-            shutil.rmtree(tmpdir, ignore_errors=True)
-            await _safe_send(context, f"🧹 فایل‌های موقت پاک شد: #{item_id}")
+        _disk_reservations(context).pop(item_id, None)
+        _quota_reservations(context).pop(item_id, None)
+
+        # فقط بعد از آپلود موفق پاک می‌شود؛ در غیر این صورت برای resume/استفاده مجدد می‌ماند
+        if done:
+            dbmod.delete_staged_media(con, item_id)
+            shutil.rmtree(staging.item_dir(item_id), ignore_errors=True)
+            if tmpdir:
+                await _safe_send(context, f"{tag}🧹 فایل‌های موقت پاک شد: #{item_id}", priority=PRIO_LOW)
+        elif tmpdir:
+            await _safe_send(context, f"{tag}📁 فایل‌های آیتم #{item_id} برای تلاش بعدی نگه داشته شد.", priority=PRIO_LOW)
+
+
+def _job_data(context) -> dict:
+    """data job زمان‌بندی؛ اجراهای تستی (/testjob، /daily_in) data ندارند."""
+    data = getattr(getattr(context, "job", None), "data", None)
+    return data if isinstance(data, dict) else {}
 
 
 async def daily_publisher(context):
     con = context.application.bot_data["db"]
     now_str = _now_str_ir()
-    today = _today_ir()
+    data = _job_data(context)
+    # اجرای عقب‌افتاده (بعد از reset quota) همچنان به حساب روز اصلی slot ثبت می‌شود
+    today = data.get("day") or _today_ir()
+    slot_id = data.get("slot_id")
+    slot = dbmod.get_publish_slot(con, slot_id) if slot_id is not None else None
+    label = f"slot {slots.slot_label(slot)}" if slot else "اجرای دستی"
+
+    await _safe_send(context, f"⏰ daily_publisher اجرا شد — {now_str} (Asia/Tehran) | {label}", priority=PRIO_LOW)
+
+    if slot_id is not None:
+        if slot is None:
+            # slot حذف شده ولی job هنوز برداشته نشده
+            return
+        run = dbmod.get_slot_run(con, slot_id, today)
+        if run:
+            await _safe_send(context, f"ℹ️ {label} امروز قبلاً انجام شده بود ({run['status']}).")
+            return
+        dbmod.purge_slot_runs(con, (datetime.now(TZ_IR) - timedelta(days=SLOT_RUNS_KEEP_DAYS)).strftime("%Y-%m-%d"))
+
+    # اگر آیتم اول خطا داد (و با backoff عقب افتاد)، آیتم بعدی همین امروز امتحان می‌شود
+    tried = []
+    for _ in range(DAILY_MAX_PICKS):
+        item_id, quota_ok = _claim_next(context, con, exclude_ids=tried)
+        if not quota_ok:
+            await _defer_until_quota_reset(context, con, daily_publisher, label, {"slot_id": slot_id, "day": today})
+            return
+        if not item_id:
+            break
+        tried.append(item_id)
+        try:
+            if await _process_item(context, con, item_id):
+                if slot_id is not None:
+                    dbmod.set_slot_run(con, slot_id, today, "done", item_id)
+                return
+        except Exception:
+            continue
+
+    if not tried:
+        if dbmod.list_queued_ids(con, limit=1):
+            await _safe_send(context, f"⏳ آیتم‌های صف همه در انتظار retry هستند؛ {label} چیزی منتشر نکرد.")
+            return
+        if slot_id is not None:
+            dbmod.set_slot_run(con, slot_id, today, "empty")
+            await _safe_send(context, f"📭 صف خالی بود؛ {label} برای امروز انجام‌شده ثبت شد. ({today})")
+            return
+        await _safe_send(context, "📭 صف خالی است.")
+
+
+async def _defer_until_quota_reset(context, con, callback, label: str, data: dict) -> None:
+    when = quota.next_reset() + timedelta(minutes=5)
+    if context.job_queue is not None:
+        context.job_queue.run_once(callback, when=when, name="quota_deferred", data=data)
+    await _safe_send(
+        context,
+        f"⛽️ quota یوتیوب برای یک آپلود کافی نیست؛ {label} بعد از reset اجرا می‌شود.\n{_quota_note(con)}",
+        priority=PRIO_ERROR,
+    )
+
+
+def _is_quota_error(err: Exception) -> bool:
+    text = str(err)
+    return "quotaExceeded" in text or "uploadLimitExceeded" in text or "dailyLimitExceeded" in text
+
 
-    await _safe_send(context, f"⏰ daily_publisher اجرا شد — {now_str} (Asia/Tehran)")
+async def catch_up_missed(context):
+    """
+    بعد از ری‌استارت: slotهایی که در downtime جا ماندند (run_daily آن‌ها را اجرا نمی‌کند)
+    به ترتیب زمان، هر کدام یک آیتم، با فاصله CATCHUP_INTERVAL_MIN بین آپلودها منتشر می‌شوند.
+    کمبود quota (ledger یا خطای quotaExceeded) catch-up را تا بعد از reset روزانه عقب می‌اندازد.
+    data job: {"cutoff": datetime} — فقط slotهای قبل از این لحظه (زمان شروع برنامه) بررسی می‌شوند.
+    """
+    if CATCHUP_MAX_DAYS < 0:
+        return
+    con = context.application.bot_data["db"]
+    data = getattr(context.job, "data", None) or {}
+    cutoff = data.get("cutoff") or datetime.now(TZ_IR)
 
-    last = dbmod.get_last_publish_day(con)
-    if last == today:
-        await _safe_send(context, f"ℹ️ امروز قبلاً انجام شده بود (last_publish_day={last}).")
+    since = (cutoff.astimezone(TZ_IR) - timedelta(days=CATCHUP_MAX_DAYS)).strftime("%Y-%m-%d")
+    missed = slots.missed_slots(
+        dbmod.list_publish_slots(con), dbmod.list_slot_runs_since(con, since), cutoff, CATCHUP_MAX_DAYS
+    )
+    if not missed:
         return
 
-    item_id = dbmod.pick_next_for_today(con)
-    if not item_id:
-        dbmod.set_last_publish_day(con, today)
-        await _safe_send(context, f"📭 صف خالی بود؛ امروز را انجام‌شده ثبت کردم. ({today})")
+    await _safe_send(
+        context,
+        f"🔁 catch-up: {len(missed)} زمان انتشار جا مانده:\n"
+        + "\n".join(f"• {day} {slots.slot_label(row)}" for row, day, _ in missed),
+    )
+
+    caught, empty, failed = [], [], []
+    tried = []
+    for n, (row, day, _) in enumerate(missed):
+        # آیتمی که در همین catch-up عقب افتاد یا خطا داد دوباره برای slot بعدی برداشته نمی‌شود
+        item_id, quota_ok = _claim_next(context, con, exclude_ids=tried)
+        if not quota_ok:
+            await _defer_until_quota_reset(context, con, catch_up_missed, "catch-up", {"cutoff": cutoff})
+            break
+        if not item_id:
+            if dbmod.list_queued_ids(con, limit=1):
+                # آیتم‌ها در انتظار retry هستند؛ slot ثبت نمی‌شود تا بعداً دوباره امتحان شود
+                break
+            if tried:
+                # بقیه آیتم‌ها همین حالا امتحان شده‌اند؛ slotهای باقیمانده ثبت نمی‌شوند
+                break
+            for r, d, _ in missed[n:]:
+                dbmod.set_slot_run(con, r["id"], d, "empty")
+                empty.append(f"{d} #{r['id']}")
+            break
+        tried.append(item_id)
+
+        try:
+            ok = await _process_item(context, con, item_id, worker="catch-up")
+        except Exception as e:
+            if _is_quota_error(e):
+                await _defer_until_quota_reset(context, con, catch_up_missed, "catch-up", {"cutoff": cutoff})
+                break
+            failed.append(f"{day} #{row['id']}")
+            if len(failed) >= DAILY_MAX_PICKS:
+                break
+            continue
+
+        if ok:
+            dbmod.set_slot_run(con, row["id"], day, "catchup", item_id)
+            caught.append(f"{day} #{row['id']} → آیتم #{item_id}")
+            if n + 1 < len(missed):
+                await asyncio.sleep(CATCHUP_INTERVAL_MIN * 60)
+        else:
+            failed.append(f"{day} #{row['id']}")
+
+    lines = [f"🔁 گزارش catch-up: {len(caught)} منتشر شد از {len(missed)}"]
+    lines += [f"✅ {c}" for c in caught]
+    if empty:
+        lines.append(f"📭 صف خالی بود: {', '.join(empty)}")
+    if failed:
+        lines.append(f"❌ ناموفق (در ری‌استارت بعدی دوباره بررسی می‌شود): {', '.join(failed)}")
+    await _safe_send(context, "\n".join(lines))
+
+
+def _is_picking(con, item_id: int) -> bool:
+    row = dbmod.get_queue_item(con, item_id)
+    return row is not None and row["status"] == "picking"
+
+
+def invalidate_stale_prefetch(context) -> list[int]:
+    """بعد از swap_queue_order / delete_queue_item صدا زده می‌شود."""
+    con = context.application.bot_data["db"]
+    ids = dbmod.list_queued_ids(con, limit=max(0, PREFETCH_COUNT), due_only=True)
+    return staging.invalidate_stale(con, ids, busy_ids=_prefetching(context).keys())
+
+
+async def prefetch_upcoming(context):
+    """
+    چند آیتم بعدی صف (به ترتیب sort_order) را قبل از زمان انتشار در STAGING_DIR دانلود می‌کند
+    تا در زمان انتشار فقط آپلود باقی بماند. سقف فضای دیسک: PREFETCH_BUDGET_MB.
+    """
+    con = context.application.bot_data["db"]
+    limits = _pipeline_limits(context)
+    inflight = _prefetching(context)
+
+    # دانلود فقط وقتی که آپلودش در زمان انتشار (slot بعد از PREFETCH_LEAD_MIN) از نظر quota ممکن باشد
+    publish_at = datetime.now(TZ_IR) + timedelta(minutes=PREFETCH_LEAD_MIN) if context.job else None
+    if not quota.can_afford_upload(con, publish_at, sum(_quota_reservations(context).values())):
+        await _safe_send(context, f"⛽️ prefetch رد شد: quota آپلود کافی نیست.\n{_quota_note(con)}", priority=PRIO_LOW)
         return
 
-    await _process_item(context, con, item_id, set_today_done=True)
+    ids = dbmod.list_queued_ids(con, limit=max(0, PREFETCH_COUNT), due_only=True)
+    removed = staging.invalidate_stale(con, ids, busy_ids=inflight.keys())
+    if removed:
+        await _safe_send(context, f"🗑 prefetch باطل شد برای: {', '.join(f'#{i}' for i in removed)}", priority=PRIO_LOW)
+
+    for item_id in ids:
+        if item_id in inflight:
+            continue
+
+        fmt = _format_for_item(context, item_id)
+        if staging.take_staged(con, item_id, fmt):
+            continue
+
+        used = staging.used_bytes(con)
+        if used >= staging.budget_bytes():
+            await _safe_send(context, f"💾 بودجه prefetch پر است ({_fmt_bytes(used)}). بقیه آیتم‌ها در زمان انتشار دانلود می‌شوند.", priority=PRIO_LOW)
+            return
+
+        url = _pick_url(_row_to_dict(dbmod.get_queue_item(con, item_id)))
+        if not url:
+            continue
+
+        # prefetch کیفیت را پایین نمی‌آورد؛ اگر جا نبود، دانلود به زمان انتشار موکول می‌شود
+        chosen = _get_pending_quality(context, item_id)
+        if await _admit_download(context, con, item_id, url, fmt, chosen, allow_downgrade=False) is None:
+            await _safe_send(context, f"💽 prefetch آیتم #{item_id} رد شد: فضای دیسک کافی نیست.", priority=PRIO_LOW)
+            continue
+
+        ev = asyncio.Event()
+        inflight[item_id] = ev
+        workdir = staging.item_dir(item_id)
+        try:
+            async with limits["download"]:
+                info, file_path, _ = await asyncio.to_thread(
+                    download_youtube_temp,
+                    url,
+                    f"item_{item_id}",
+                    format_selector=fmt,
+                    workdir=workdir,
+                    info=probe_cache.cached_info(url),
+                    **download_engine_kwargs(),
+                )
+
+            # آیتم ممکن است وسط دانلود حذف یا جابجا شده باشد؛
+            # ولی اگر انتشارش شروع شده (picking)، _process_item منتظر همین فایل است
+            waiting = _is_picking(con, item_id)
+            if not waiting and item_id not in dbmod.list_queued_ids(con, limit=max(0, PREFETCH_COUNT), due_only=True):
+                staging.invalidate(con, item_id)
+                continue
+
+            file_path = await _prepare_for_upload(context, con, item_id, file_path)
+            size = staging.record(con, item_id, file_path, fmt, info)
+            if not waiting and used + size > staging.budget_bytes():
+                staging.invalidate(con, item_id)
+                await _safe_send(context, f"💾 آیتم #{item_id} ({_fmt_bytes(size)}) در بودجه prefetch جا نشد.", priority=PRIO_LOW)
+                return
+
+            _record_format(con, item_id, info)
+            await _safe_send(
+                context,
+                f"📦 prefetch آماده شد: #{item_id} ({_fmt_bytes(size)}, {info.get('height') or '?'}p)",
+                priority=PRIO_LOW,
+            )
+        except Exception as e:
+            # .part ها برای ادامه دانلود (prefetch بعدی یا زمان انتشار) می‌مانند
+            dbmod.delete_staged_media(con, item_id)
+            # خطای کیفیت را همان زمان انتشار با دکمه‌ها هندل می‌کنیم
+            if not _looks_like_no_requested_format(e):
+                await _safe_send(context, f"⚠️ prefetch ناموفق برای #{item_id}: {type(e).__name__}: {e}", priority=PRIO_ERROR)
+        finally:
+            inflight.pop(item_id, None)
+            _disk_reservations(context).pop(item_id, None)
+            ev.set()
+
+
+BENCHMARK_CONFIGS = [
+    {"name": "default", "engine": "default"},
+    {"name": "fragments x4", "engine": "fragments", "fragments": 4},
+    {"name": "fragments x8", "engine": "fragments", "fragments": 8},
+    {"name": "parallel x4", "engine": "parallel", "fragments": 4},
+    {
+        "name": "fragments x8 + 1MB buf + 10MB chunk",
+        "engine": "fragments",
+        "fragments": 8,
+        "buffersize": 1024 * 1024,
+        "http_chunk_size": 10 * 1024 * 1024,
+    },
+]
+
+
+async def download_benchmark(context, chat_id: int, url: str, seconds: int):
+    """تنظیمات موتور دانلود را روی یک لینک مقایسه و نتیجه را به chat_id گزارش می‌کند."""
+    limits = _pipeline_limits(context)
+    async with limits["download"]:
+        results = await asyncio.to_thread(
+            benchmark_download_engines,
+            url,
+            BENCHMARK_CONFIGS,
+            format_selector=quality.ladder_selector(),
+            seconds=seconds,
+        )
+
+    lines = [f"🏎 بنچمارک موتور دانلود ({seconds}s برای هر تنظیم):"]
+    for r in sorted(results, key=lambda r: r["speed"], reverse=True):
+        if r["error"]:
+            lines.append(f"❌ {r['name']}: {r['error'][:200]}")
+        else:
+            lines.append(f"• {r['name']}: {_fmt_bytes(r['speed'])}/s ({_fmt_bytes(r['bytes'])} در {r['seconds']:.0f}s)")
+    await context.bot.send_message(chat_id, "\n".join(lines))
 
 
 async def publish_one_item_now(context, item_id: int | None = None):
     con = context.application.bot_data["db"]
 
     if item_id is None:
-        item_id = dbmod.pick_next_for_today(con)
+        item_id, quota_ok = _claim_next(context, con)
+    else:
+        # اجرای دستی یک آیتم مشخص (/publish_now ID): مثل pick_next_for_today به picking می‌رود
+        if not dbmod.pick_item(con, item_id):
+            await _safe_send(context, f"📭 آیتم #{item_id} در صف نیست یا در حال پردازش است.")
+            return
+        quota_ok = _reserve_upload(context, con, item_id)
+        if not quota_ok:
+            dbmod.mark_back_to_queue(con, item_id)
+
+    if not quota_ok:
+        await _safe_send(context, f"⛽️ quota یوتیوب برای آپلود کافی نیست.\n{_quota_note(con)}", priority=PRIO_ERROR)
+        return
 
     if not item_id:
         await _safe_send(context, "📭 آیتمی برای اجرای دستی پیدا نشد.")
         return
 
     await _safe_send(context, f"🧪 اجرای دستی publish_one_item_now برای آیتم #{item_id}")
-    await _process_item(context, con, item_id, set_today_done=False)
+    await _process_item(context, con, item_id)
+
+
+async def drain_queue(context, max_items: int, workers: int | None = None) -> dict:
+    """
+    حالت worker pool: تا max_items آیتم را با pick_next_for_today برمی‌دارد
+    و با چند worker همزمان پردازش می‌کند. سقف دانلود و آپلود جداست
+    (DOWNLOAD_CONCURRENCY / UPLOAD_CONCURRENCY)، پس آپلود کند جلوی دانلود بعدی را نمی‌گیرد.
+    """
+    con = context.application.bot_data["db"]
+    workers = max(1, min(workers or PUBLISH_WORKERS, max_items))
+
+    claim_lock = asyncio.Lock()
+    stats = {"claimed": 0, "ok": 0, "failed": 0, "quota_stop": False}
+    claimed_ids = []
+
+    async def _claim() -> int | None:
+        async with claim_lock:
+            if stats["claimed"] >= max_items:
+                return None
+            # آیتمی که در همین drain برگشت خورده دوباره برداشته نمی‌شود
+            item_id, quota_ok = _claim_next(context, con, exclude_ids=claimed_ids)
+            if not quota_ok:
+                stats["quota_stop"] = True
+            if item_id:
+                stats["claimed"] += 1
+                claimed_ids.append(item_id)
+            return item_id
+
+    async def _worker(label: str):
+        while True:
+            item_id = await _claim()
+            if not item_id:
+                return
+            await _safe_send(context, f"👷 {label} | آیتم #{item_id} برداشته شد", priority=PRIO_LOW)
+            try:
+                ok = await _process_item(context, con, item_id, worker=label)
+            except Exception:
+                ok = False
+            stats["ok" if ok else "failed"] += 1
+
+    await _safe_send(context, f"🚚 drain شروع شد: حداکثر {max_items} آیتم با {workers} worker")
+    await asyncio.gather(*(_worker(f"w{i + 1}") for i in range(workers)))
+    await _safe_send(
+        context,
+        f"🏁 drain تمام شد: برداشته={stats['claimed']} موفق={stats['ok']} ناموفق={stats['failed']}"
+        + (f"\n⛽️ به خاطر quota متوقف شد. {_quota_note(con)}" if stats["quota_stop"] else ""),
+    )
+    return stats
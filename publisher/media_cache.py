@@ -0,0 +1,88 @@
+import os
+import shutil
+import time
+from pathlib import Path
+
+from bot.config import MEDIA_CACHE_DIR, MEDIA_CACHE_MB
+from shared import db as dbmod
+
+
+def enabled() -> bool:
+    return MEDIA_CACHE_MB > 0
+
+
+def budget_bytes() -> int:
+    return MEDIA_CACHE_MB * 1024 * 1024
+
+
+def cache_key(video_id: str, format_id: str) -> str:
+    return f"{video_id}:{format_id}"
+
+
+def lookup(con, video_id: str, format_id: str) -> str | None:
+    """
+    مسیر فایل cache شده یا None. miss همین‌جا شمرده می‌شود؛ hit با record_hit بعد از آپلود موفق
+    (تا retryهای یک آیتم چند بار شمرده نشوند).
+    فایل cache فقط خوانده می‌شود؛ caller نباید آن را پاک یا جابجا کند.
+    """
+    key = cache_key(video_id, format_id)
+    row = dbmod.get_media_cache(con, key)
+    if row and not os.path.exists(row["file_path"]):
+        dbmod.delete_media_cache(con, key)
+        row = None
+
+    if not row:
+        dbmod.bump_media_cache_stat(con, "misses")
+        return None
+
+    dbmod.touch_media_cache(con, key, time.time())
+    return row["file_path"]
+
+
+def record_hit(con, file_path: str) -> None:
+    """آیتمی با فایل cache منتشر شد: یک hit و حجم دانلودی که لازم نشد."""
+    dbmod.bump_media_cache_stat(con, "hits")
+    try:
+        dbmod.bump_media_cache_stat(con, "bytes_saved", os.path.getsize(file_path))
+    except OSError:
+        pass
+
+
+def store(con, video_id: str, format_id: str, src_path: str) -> str | None:
+    """
+    فایل آپلودشده را (با rename، بدون کپی) به cache منتقل می‌کند و LRU را زیر سقف نگه می‌دارد.
+    خروجی: مسیر جدید، یا None اگر فایل در بودجه جا نشد (فایل سر جایش می‌ماند).
+    """
+    size = os.path.getsize(src_path)
+    if size > budget_bytes():
+        return None
+
+    Path(MEDIA_CACHE_DIR).mkdir(parents=True, exist_ok=True)
+    key = cache_key(video_id, format_id)
+    safe_fmt = format_id.replace("/", "_").replace("+", "_")
+    dst = os.path.join(MEDIA_CACHE_DIR, f"{video_id}.{safe_fmt}{Path(src_path).suffix}")
+
+    evict(con, budget_bytes() - size, keep=key)
+    shutil.move(src_path, dst)
+    dbmod.put_media_cache(con, key, video_id, format_id, dst, size, time.time())
+    return dst
+
+
+def evict(con, target_bytes: int, keep: str | None = None) -> list[str]:
+    """قدیمی‌ترین فایل‌ها (last_used_at) را پاک می‌کند تا حجم کل <= target_bytes شود."""
+    total = dbmod.media_cache_total_bytes(con)
+    removed = []
+    for row in dbmod.list_media_cache_lru(con):
+        if total <= target_bytes:
+            break
+        if row["cache_key"] == keep:
+            continue
+        try:
+            os.remove(row["file_path"])
+        except FileNotFoundError:
+            pass
+        dbmod.delete_media_cache(con, row["cache_key"])
+        dbmod.bump_media_cache_stat(con, "evictions")
+        total -= int(row["size_bytes"])
+        removed.append(row["cache_key"])
+    return removed
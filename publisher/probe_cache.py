@@ -0,0 +1,172 @@
+import asyncio
+import json
+import time
+
+from bot.config import PROBE_CACHE_TTL_MIN, PROBE_INFO_TTL_MIN
+from downloader.ytdlp_downloader import probe_youtube_formats
+from shared import db as dbmod
+from shared.youtube_public import extract_video_id
+
+# video_id -> (probed_at, info کامل yt-dlp)؛ URLهای داخل info بعد از چند ساعت منقضی می‌شوند
+_INFO_CACHE: dict[str, tuple[float, dict]] = {}
+# video_id -> Future برای probeهای در جریان (چند درخواست همزمان = یک extract_info)
+_INFLIGHT: dict[str, asyncio.Future] = {}
+
+# ترتیب فیلدهای هر فرمت در payload فشرده
+FORMAT_FIELDS = ("format_id", "ext", "height", "fps", "vcodec", "acodec", "size", "tbr")
+
+
+def summarize_info(info: dict) -> dict:
+    """info کامل yt-dlp را به خلاصه کوچکی تبدیل می‌کند که در SQLite ذخیره می‌شود."""
+    formats = []
+    for f in info.get("formats") or []:
+        size = f.get("filesize") or f.get("filesize_approx")
+        formats.append(
+            [
+                f.get("format_id"),
+                f.get("ext"),
+                f.get("height"),
+                f.get("fps"),
+                f.get("vcodec"),
+                f.get("acodec"),
+                int(size) if size else None,
+                f.get("tbr"),
+            ]
+        )
+    return {
+        "id": info.get("id"),
+        "title": info.get("title"),
+        "duration": info.get("duration"),
+        "formats": formats,
+    }
+
+
+def iter_formats(summary: dict):
+    """فرمت‌های خلاصه را به شکل dict برمی‌گرداند."""
+    for row in summary.get("formats") or []:
+        yield dict(zip(FORMAT_FIELDS, row))
+
+
+def available_heights(summary: dict, max_height: int = 2160) -> list[int]:
+    heights = {f["height"] for f in iter_formats(summary) if f.get("height")}
+    return sorted((int(h) for h in heights if int(h) <= max_height), reverse=True)
+
+
+def _codec_family(vcodec: str | None) -> str | None:
+    if not vcodec or vcodec == "none":
+        return None
+    return vcodec.split(".", 1)[0]
+
+
+def _est_size(f: dict, duration) -> int | None:
+    if f.get("size"):
+        return int(f["size"])
+    if f.get("tbr") and duration:
+        # tbr بر حسب kbit/s است
+        return int(float(f["tbr"]) * 1000 / 8 * float(duration))
+    return None
+
+
+def describe_heights(summary: dict, max_height: int = 2160) -> dict:
+    """
+    برای هر height: خانواده codec های ویدیو و اندازه تخمینی (بهترین ویدیو + بهترین صدا).
+    خروجی: {"heights": [...], "codecs": {h: [...]}, "sizes": {h: bytes|None}}
+    """
+    duration = summary.get("duration")
+    formats = list(iter_formats(summary))
+
+    audio = [f for f in formats if _codec_family(f.get("vcodec")) is None and f.get("acodec") not in (None, "none")]
+    best_audio = max(audio, key=lambda f: f.get("tbr") or 0, default=None)
+    audio_size = _est_size(best_audio, duration) if best_audio else 0
+
+    codecs: dict[int, list[str]] = {}
+    sizes: dict[int, int | None] = {}
+    for h in available_heights(summary, max_height):
+        videos = [f for f in formats if f.get("height") == h and _codec_family(f.get("vcodec"))]
+        codecs[h] = sorted({_codec_family(f["vcodec"]) for f in videos})
+        best = max(videos, key=lambda f: f.get("tbr") or 0, default=None)
+        size = _est_size(best, duration) if best else None
+        if size is not None and best.get("acodec") in (None, "none"):
+            size += audio_size or 0
+        sizes[h] = size
+
+    return {"heights": list(codecs), "codecs": codecs, "sizes": sizes}
+
+
+def _fresh(ts: float, ttl_min: int) -> bool:
+    return (time.time() - ts) < ttl_min * 60
+
+
+def cached_info(url: str) -> dict | None:
+    """info کامل اگر هنوز تازه باشد (برای دانلود بدون extract دوباره)."""
+    vid = extract_video_id(url)
+    rec = _INFO_CACHE.get(vid) if vid else None
+    if rec and _fresh(rec[0], PROBE_INFO_TTL_MIN):
+        return rec[1]
+    return None
+
+
+def cached_summary(con, url: str) -> dict | None:
+    vid = extract_video_id(url)
+    if not vid:
+        return None
+    row = dbmod.get_format_probe(con, vid)
+    if not row or not _fresh(row["probed_at"], PROBE_CACHE_TTL_MIN):
+        return None
+    try:
+        return json.loads(row["payload"])
+    except ValueError:
+        return None
+
+
+async def get_probe(con, url: str, *, need_info: bool = False) -> tuple[dict, dict | None]:
+    """
+    خروجی: (summary, info)
+    اگر خلاصه تازه در SQLite باشد (و need_info=False) هیچ درخواست شبکه‌ای زده نمی‌شود.
+    با need_info=True، info کامل از cache حافظه یا یک extract_info تازه برمی‌گردد.
+    """
+    vid = extract_video_id(url)
+
+    if not need_info:
+        summary = cached_summary(con, url)
+        if summary is not None:
+            return summary, cached_info(url)
+    else:
+        info = cached_info(url)
+        if info is not None:
+            return cached_summary(con, url) or summarize_info(info), info
+
+    if vid and vid in _INFLIGHT:
+        return await asyncio.shield(_INFLIGHT[vid])
+
+    fut = asyncio.get_running_loop().create_future()
+    if vid:
+        _INFLIGHT[vid] = fut
+    try:
+        info = await asyncio.to_thread(probe_youtube_formats, url)
+        summary = summarize_info(info)
+        now = time.time()
+        if vid:
+            _INFO_CACHE[vid] = (now, info)
+            dbmod.save_format_probe(con, vid, json.dumps(summary, separators=(",", ":")), now)
+            dbmod.purge_format_probes(con, now - PROBE_CACHE_TTL_MIN * 60)
+        fut.set_result((summary, info))
+        return summary, info
+    except asyncio.CancelledError:
+        fut.cancel()
+        raise
+    except Exception as e:
+        fut.set_exception(e)
+        # اگر کسی منتظر نبود، exception بی‌صاحب لاگ نشود
+        fut.exception()
+        raise
+    finally:
+        if vid:
+            _INFLIGHT.pop(vid, None)
+        _evict_expired()
+
+
+def _evict_expired() -> None:
+    for vid, (ts, _) in list(_INFO_CACHE.items()):
+        if not _fresh(ts, PROBE_INFO_TTL_MIN):
+            _INFO_CACHE.pop(vid, None)
@@ -0,0 +1,74 @@
+from bot.config import QUALITY_CODECS, QUALITY_LADDER, QUALITY_MAX_MB
+
+
+def ladder_heights() -> list[int]:
+    hs = [int(x) for x in QUALITY_LADDER.replace(" ", "").split(",") if x.isdigit()]
+    return sorted(set(hs), reverse=True) or [2160, 1080]
+
+
+def max_bytes() -> int | None:
+    return QUALITY_MAX_MB * 1024 * 1024 if QUALITY_MAX_MB > 0 else None
+
+
+def allowed_codecs() -> list[str]:
+    """خانواده codec های مجاز؛ vp9 و vp09 یکی حساب می‌شوند."""
+    out = []
+    for c in QUALITY_CODECS.replace(" ", "").lower().split(","):
+        if not c:
+            continue
+        out.append(c)
+        if c == "vp9":
+            out.append("vp09")
+    return out
+
+
+def _filters() -> str:
+    f = ""
+    limit = max_bytes()
+    if limit:
+        # "?" یعنی فرمت بدون اندازه معلوم رد نشود؛ سقف روی ترک ویدیو اعمال می‌شود
+        f += f"[filesize<?{limit}][filesize_approx<?{limit}]"
+    codecs = allowed_codecs()
+    if codecs:
+        f += f"[vcodec~='^({'|'.join(codecs)})']"
+    return f
+
+
+def height_selector(height: int) -> str:
+    # انتخاب دستی (qpick): فقط همان height، بدون محدودیت نردبان [web:610]
+    return f"bv*[height={height}]+ba/b[height={height}]"
+
+
+def ladder_selector() -> str:
+    """
+    یک format selector برای کل نردبان (مثلاً 2160→1440→1080→720)؛ yt-dlp اولین
+    پله موجود را در همان extract انتخاب می‌کند و نیازی به تلاش دوباره نیست.
+    """
+    f = _filters()
+    return "/".join(f"bv*[height={h}]{f}+ba/b[height={h}]{f}" for h in ladder_heights())
+
+
+def _codec_ok(families: list[str], codecs: list[str]) -> bool:
+    if not codecs:
+        return True
+    return any(fam.startswith(c) for fam in families for c in codecs)
+
+
+def pick_height(desc: dict) -> int | None:
+    """
+    پیش‌بینی پله‌ای که ladder_selector روی نتیجه probe انتخاب می‌کند.
+    desc: خروجی probe_cache.describe_heights
+    """
+    limit = max_bytes()
+    codecs = allowed_codecs()
+    heights = set(desc.get("heights") or [])
+    for h in ladder_heights():
+        if h not in heights:
+            continue
+        if not _codec_ok(desc["codecs"].get(h) or [], codecs):
+            continue
+        size = desc["sizes"].get(h)
+        if limit and size and size > limit:
+            continue
+        return h
+    return None
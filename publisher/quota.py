@@ -0,0 +1,61 @@
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+
+from bot.config import YT_QUOTA_DAILY, YT_QUOTA_UPLOAD_COST
+from shared import db as dbmod
+
+# quota روزانه YouTube Data API نیمه‌شب به وقت Pacific صفر می‌شود
+TZ_PT = ZoneInfo("America/Los_Angeles")
+
+COSTS = {
+    "videos.insert": YT_QUOTA_UPLOAD_COST,
+    "videos.list": 1,
+}
+
+
+def cost(kind: str) -> int:
+    return COSTS.get(kind, 1)
+
+
+def quota_day(now: datetime | None = None) -> str:
+    return (now or datetime.now(TZ_PT)).astimezone(TZ_PT).strftime("%Y-%m-%d")
+
+
+def next_reset(now: datetime | None = None) -> datetime:
+    now = (now or datetime.now(TZ_PT)).astimezone(TZ_PT)
+    tomorrow = now.date() + timedelta(days=1)
+    return datetime(tomorrow.year, tomorrow.month, tomorrow.day, tzinfo=TZ_PT)
+
+
+def spend(con, kind: str, calls: int = 1) -> None:
+    dbmod.add_quota_usage(con, quota_day(), kind, calls, cost(kind) * calls)
+
+
+def used(con) -> int:
+    return sum(int(r["units"]) for r in dbmod.get_quota_usage(con, quota_day()))
+
+
+def remaining(con, reserved: int = 0) -> int:
+    """باقیمانده امروز منهای واحدهای رزرو شده برای آپلودهایی که هنوز videos.insert نزده‌اند."""
+    return YT_QUOTA_DAILY - used(con) - reserved
+
+
+def can_afford(con, kind: str, reserved: int = 0) -> bool:
+    return remaining(con, reserved) >= cost(kind)
+
+
+def can_afford_upload(con, when: datetime | None = None, reserved: int = 0) -> bool:
+    """
+    آپلودی که در زمان when (پیش‌فرض: الان) زده می‌شود. اگر when در روز quota بعدی باشد
+    (بعد از reset نیمه‌شب Pacific)، بودجه آن روز هنوز دست‌نخورده است.
+    """
+    if when is not None and quota_day(when) != quota_day():
+        return cost("videos.insert") <= YT_QUOTA_DAILY
+    return can_afford(con, "videos.insert", reserved)
+
+
+def mark_exhausted(con) -> None:
+    """یوتیوب quotaExceeded داد (مثلاً مصرف بیرون از ربات): بقیه روز خرج‌شده حساب می‌شود."""
+    left = remaining(con)
+    if left > 0:
+        dbmod.add_quota_usage(con, quota_day(), "exhausted", 0, left)
@@ -0,0 +1,120 @@
+from datetime import date, datetime, time, timedelta
+from zoneinfo import ZoneInfo
+
+TZ_IR = ZoneInfo("Asia/Tehran")
+
+# اندیس = datetime.weekday() (دوشنبه=0)
+WEEKDAY_KEYS = ("mon", "tue", "wed", "thu", "fri", "sat", "sun")
+WEEKDAY_FA = ("دوشنبه", "سه‌شنبه", "چهارشنبه", "پنجشنبه", "جمعه", "شنبه", "یکشنبه")
+# ترتیب نمایش: هفته ایرانی از شنبه
+WEEK_ORDER_IR = (5, 6, 0, 1, 2, 3, 4)
+
+
+def parse_weekdays(text: str | None) -> str | None:
+    """
+    "sat,mon,wed" یا بازه "sat-wed" (هفته چرخشی) یا ترکیبشان -> "0,2,5" برای ستون weekdays.
+    خالی / "*" / "daily" یعنی هر روز (None). ورودی نامعتبر: ValueError.
+    """
+    text = (text or "").strip().lower()
+    if text in ("", "*", "daily"):
+        return None
+
+    days: set[int] = set()
+    for tok in text.split(","):
+        tok = tok.strip()
+        if "-" in tok:
+            a, b = (WEEKDAY_KEYS.index(p.strip()[:3]) for p in tok.split("-", 1))
+            d = a
+            days.add(d)
+            while d != b:
+                d = (d + 1) % 7
+                days.add(d)
+        elif tok:
+            days.add(WEEKDAY_KEYS.index(tok[:3]))
+
+    if not days:
+        raise ValueError("no weekday")
+    if len(days) == 7:
+        return None
+    return ",".join(str(d) for d in sorted(days))
+
+
+def slot_weekdays(row) -> tuple[int, ...] | None:
+    raw = row["weekdays"]
+    if not raw:
+        return None
+    return tuple(int(d) for d in raw.split(","))
+
+
+def weekdays_label(row) -> str:
+    days = slot_weekdays(row)
+    if days is None:
+        return "هر روز"
+    return "، ".join(WEEKDAY_FA[d] for d in WEEK_ORDER_IR if d in days)
+
+
+def slot_label(row) -> str:
+    return f"#{row['id']} — {row['hhmm']} ({weekdays_label(row)})"
+
+
+def runs_on(row, day: date) -> bool:
+    days = slot_weekdays(row)
+    return days is None or day.weekday() in days
+
+
+def slot_time(row) -> time:
+    hh, mm = row["hhmm"].split(":")
+    return time(hour=int(hh), minute=int(mm), tzinfo=TZ_IR)
+
+
+def slot_datetime(row, day: date) -> datetime:
+    t = slot_time(row)
+    return datetime(day.year, day.month, day.day, t.hour, t.minute, tzinfo=TZ_IR)
+
+
+def ptb_days(days: tuple[int, ...] | None, shift: int = 0) -> tuple[int, ...]:
+    """
+    روزهای هفته برای JobQueue.run_daily (PTB 20+: یکشنبه=0 ... شنبه=6).
+    shift=-1 وقتی زمان job (مثلاً prefetch) از نیمه‌شب به روز قبل رفته است.
+    """
+    if days is None:
+        return tuple(range(7))
+    return tuple(sorted({(d + 1 + shift) % 7 for d in days}))
+
+
+def minus_minutes(t: time, minutes: int) -> tuple[time, int]:
+    """(زمان جدید، جابجایی روز: 0، -1، ... برای فاصله‌های بیشتر از یک روز)"""
+    shift, m = divmod(t.hour * 60 + t.minute - int(minutes), 24 * 60)
+    return time(hour=m // 60, minute=m % 60, tzinfo=t.tzinfo), shift
+
+
+def _created_at(row) -> datetime | None:
+    # created_at با datetime('now') در SQLite ذخیره شده (UTC)
+    try:
+        return datetime.strptime(row["created_at"], "%Y-%m-%d %H:%M:%S").replace(tzinfo=ZoneInfo("UTC"))
+    except (TypeError, ValueError):
+        return None
+
+
+def missed_slots(rows, done: set[tuple[int, str]], cutoff: datetime, max_days: int) -> list[tuple]:
+    """
+    slotهایی که زمانشان (در max_days روز اخیر، تا cutoff) گذشته ولی در slot_runs ثبتی ندارند.
+    slotهای قبل از زمان ساخته شدنشان حساب نمی‌شوند.
+    خروجی: [(row, "YYYY-MM-DD", due_datetime), ...] به ترتیب زمان.
+    """
+    today = cutoff.astimezone(TZ_IR).date()
+    out = []
+    for row in rows:
+        created = _created_at(row)
+        for back in range(max_days, -1, -1):
+            day = today - timedelta(days=back)
+            if not runs_on(row, day):
+                continue
+            due = slot_datetime(row, day)
+            if due >= cutoff or (created and due < created):
+                continue
+            key = day.strftime("%Y-%m-%d")
+            if (row["id"], key) not in done:
+                out.append((row, key, due))
+    out.sort(key=lambda x: x[2])
+    return out
@@ -0,0 +1,106 @@
+import json
+import os
+import re
+import shutil
+from pathlib import Path
+
+from bot.config import PREFETCH_BUDGET_MB, STAGING_DIR
+from shared import db as dbmod
+
+_ITEM_DIR_RE = re.compile(r"^item_(\d+)$")
+
+
+def item_dir(item_id: int) -> str:
+    return os.path.join(STAGING_DIR, f"item_{item_id}")
+
+
+def budget_bytes() -> int:
+    return PREFETCH_BUDGET_MB * 1024 * 1024
+
+
+def used_bytes(con) -> int:
+    return dbmod.staged_media_total_bytes(con)
+
+
+def invalidate(con, item_id: int) -> None:
+    """ردیف staged_media و پوشه staging آیتم را پاک می‌کند."""
+    dbmod.delete_staged_media(con, item_id)
+    shutil.rmtree(item_dir(item_id), ignore_errors=True)
+
+
+def record(con, item_id: int, file_path: str, format_selector: str | None, info: dict, *, pinned: bool = False) -> int:
+    size = os.path.getsize(file_path)
+    meta = {
+        "title": info.get("title"),
+        "resolution": info.get("resolution"),
+        "format_id": info.get("format_id"),
+        "height": info.get("height"),
+    }
+    dbmod.set_staged_media(
+        con, item_id, file_path, size, format_selector, json.dumps(meta, ensure_ascii=False), pinned=pinned
+    )
+    return size
+
+
+def take_staged(con, item_id: int, format_selector: str | None) -> tuple[str, dict] | None:
+    """
+    اگر فایل آماده برای همین format_selector وجود داشت: (file_path, info) برمی‌گرداند.
+    فایل با فرمت دیگر (مثلاً بعد از انتخاب دستی کیفیت) باطل می‌شود.
+    """
+    row = dbmod.get_staged_media(con, item_id)
+    if not row:
+        return None
+
+    if row["format_selector"] != format_selector or not os.path.exists(row["file_path"]):
+        invalidate(con, item_id)
+        return None
+
+    try:
+        info = json.loads(row["meta"] or "{}")
+    except ValueError:
+        info = {}
+    return row["file_path"], info
+
+
+def invalidate_stale(con, keep_ids, busy_ids=()) -> list[int]:
+    """
+    فایل‌هایی را پاک می‌کند که دیگر به درد نمی‌خورند:
+    - آیتم حذف شده (delete_queue_item) یا پارک شده (failed)
+    - آیتم هنوز queued است ولی با swap_queue_order از پنجره K آیتم بعدی بیرون رفته
+      (مگر pinned باشد: فایل تلاش ناموفق قبلی که برای retry نگه داشته شده،
+      یا آیتم در انتظار backoff/defer باشد: بعد از رسیدن نوبتش همین فایل لازم است)
+    - پوشه‌های داخل STAGING_DIR که آیتمشان دیگر وجود ندارد
+    پوشه‌های بدون ردیف برای آیتم‌های موجود (فایل‌های .part نیمه‌کاره) برای resume می‌مانند.
+    آیتم‌های picking (در حال انتشار) و busy_ids (در حال دانلود) دست نمی‌خورند.
+    """
+    keep = {int(i) for i in keep_ids} | {int(i) for i in busy_ids}
+    removed = []
+
+    for r in dbmod.list_staged_media(con):
+        iid = int(r["item_id"])
+        st = r["item_status"]
+        out_of_window = st == "queued" and iid not in keep and not r["pinned"] and not r["waiting"]
+        stale = st in (None, "failed") or out_of_window or not os.path.exists(r["file_path"])
+        if stale:
+            invalidate(con, iid)
+            removed.append(iid)
+
+    root = Path(STAGING_DIR)
+    if not root.is_dir():
+        return removed
+
+    known = {int(r["item_id"]) for r in dbmod.list_staged_media(con)}
+    for p in root.iterdir():
+        m = _ITEM_DIR_RE.match(p.name)
+        if not m or not p.is_dir():
+            continue
+        iid = int(m.group(1))
+        if iid in known or iid in keep:
+            continue
+        if dbmod.get_queue_item(con, iid) is not None:
+            continue
+        shutil.rmtree(p, ignore_errors=True)
+        if iid not in removed:
+            removed.append(iid)
+
+    return removed
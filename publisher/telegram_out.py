@@ -0,0 +1,226 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+
+from telegram.error import BadRequest, NetworkError, RetryAfter
+
+logger = logging.getLogger(__name__)
+
+
+def retry_after_seconds(err: RetryAfter) -> float:
+    # PTB 21: int ثانیه؛ نسخه‌های جدیدتر: timedelta
+    ra = err.retry_after
+    return ra.total_seconds() if hasattr(ra, "total_seconds") else float(ra)
+
+
+class ChatBudget:
+    """
+    token bucket برای یک chat (گروه‌ها حدود ۲۰ پیام در دقیقه). ارسال و ادیت هر دو
+    از همین بودجه برداشت می‌کنند. بعد از RetryAfter کل chat تا پایان مهلت متوقف می‌شود.
+    """
+
+    def __init__(self, per_minute: int, burst: int = 3):
+        self.rate = max(1, per_minute) / 60.0
+        self.burst = max(1, burst)
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def block_for(self, seconds: float) -> None:
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+        self.tokens = 0.0
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.blocked_until:
+                    await asyncio.sleep(self.blocked_until - now)
+                    continue
+
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class ProgressEditor:
+    """
+    ادیت پیام‌های پیشرفت (دانلود و آپلود) برای یک chat:
+    - فقط آخرین متن هر پیام نگه داشته می‌شود (متن‌های میانی دور ریخته می‌شوند)
+    - برای هر پیام حداکثر یک ادیت در جریان است و فاصله دو ادیت حداقل interval ثانیه است
+    - RetryAfter کل chat را در ChatBudget متوقف می‌کند و همان آخرین متن دوباره تلاش می‌شود
+    """
+
+    def __init__(self, bot, chat_id: int, budget: ChatBudget, interval: float = 7.0):
+        self.bot = bot
+        self.chat_id = chat_id
+        self.budget = budget
+        self.interval = interval
+        # message_id -> {"text", "sent", "last_at", "task"}
+        self._msgs: dict[int, dict] = {}
+
+    def update(self, message_id: int, text: str) -> None:
+        """از thread حلقه رویداد صدا زده شود (از threadهای کارگر با call_soon_threadsafe)."""
+        st = self._msgs.get(message_id)
+        if st is None:
+            self._evict_idle()
+            st = self._msgs[message_id] = {"text": None, "sent": None, "last_at": 0.0, "task": None}
+        st["text"] = text
+        if st["task"] is None:
+            st["task"] = asyncio.create_task(self._flush(message_id, st))
+
+    async def _flush(self, message_id: int, st: dict) -> None:
+        try:
+            while st["text"] != st["sent"]:
+                wait = st["last_at"] + self.interval - time.monotonic()
+                if wait > 0:
+                    await asyncio.sleep(wait)
+
+                await self.budget.acquire()
+                text = st["text"]
+                try:
+                    await self.bot.edit_message_text(chat_id=self.chat_id, message_id=message_id, text=text)
+                except RetryAfter as e:
+                    self.budget.block_for(retry_after_seconds(e))
+                    continue
+                except BadRequest as e:
+                    # "message is not modified" یعنی همین متن قبلاً نشسته؛ بقیه BadRequestها با متن بعدی تکرار نمی‌شوند
+                    if "not modified" not in str(e).lower():
+                        logger.warning("progress edit failed (msg %s): %s", message_id, e)
+                except NetworkError as e:
+                    logger.warning("progress edit network error (msg %s): %s", message_id, e)
+                    st["last_at"] = time.monotonic()
+                    continue
+                except Exception as e:
+                    logger.warning("progress edit failed (msg %s): %s", message_id, e)
+
+                st["sent"] = text
+                st["last_at"] = time.monotonic()
+        finally:
+            st["task"] = None
+
+    def _evict_idle(self, max_idle: float = 3600.0) -> None:
+        now = time.monotonic()
+        for mid, st in list(self._msgs.items()):
+            if st["task"] is None and now - st["last_at"] > max_idle:
+                self._msgs.pop(mid, None)
+
+
+# اولویت پیام‌ها در SendQueue (عدد کمتر = زودتر)
+PRIO_ERROR = 0
+PRIO_NORMAL = 1
+PRIO_LOW = 2
+
+TG_MAX_TEXT = 4096
+
+
+class SendQueue:
+    """
+    صف خروجی پیام‌های یک chat:
+    - ارسال با بودجه ChatBudget (مشترک با ProgressEditor)
+    - اولویت: خطاها اول، بعد پیام‌های عادی، بعد اطلاعیه‌های کم‌اهمیت
+    - اطلاعیه‌های کم‌اهمیتی که پشت محدودیت جمع شده‌اند در یک پیام خلاصه ارسال می‌شوند
+    - RetryAfter: chat متوقف و همان پیام‌ها با همان ترتیب دوباره در صف می‌روند
+    send() یک Future برمی‌گرداند که با Message (یا None در صورت شکست نهایی) کامل می‌شود.
+    """
+
+    def __init__(self, bot, chat_id: int, budget: ChatBudget, max_tries: int = 3):
+        self.bot = bot
+        self.chat_id = chat_id
+        self.budget = budget
+        self.max_tries = max_tries
+        self._heap: list = []
+        self._seq = itertools.count()
+        self._wake = asyncio.Event()
+        self._task: asyncio.Task | None = None
+
+    def send(self, text: str, *, priority: int = PRIO_NORMAL, reply_markup=None) -> asyncio.Future:
+        fut = asyncio.get_running_loop().create_future()
+        entry = {"text": text, "reply_markup": reply_markup, "fut": fut, "tries": 0}
+        heapq.heappush(self._heap, (priority, next(self._seq), entry))
+        self._wake.set()
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+        return fut
+
+    def pending(self) -> int:
+        return len(self._heap)
+
+    async def _run(self) -> None:
+        while True:
+            if not self._heap:
+                self._wake.clear()
+                await self._wake.wait()
+                continue
+            await self.budget.acquire()
+            await self._deliver(self._take_batch())
+
+    def _take_batch(self) -> list:
+        first = heapq.heappop(self._heap)
+        batch = [first]
+        if first[0] != PRIO_LOW or first[2]["reply_markup"] is not None:
+            return batch
+
+        # اولین پیام LOW یعنی پیام مهم‌تری در صف نیست؛ بقیه LOWها تا سقف طول پیام جمع می‌شوند
+        size = len(first[2]["text"])
+        rest = []
+        while self._heap:
+            e = heapq.heappop(self._heap)
+            if e[2]["reply_markup"] is None and size + len(e[2]["text"]) + 2 < TG_MAX_TEXT - 64:
+                batch.append(e)
+                size += len(e[2]["text"]) + 2
+            else:
+                rest.append(e)
+        for e in rest:
+            heapq.heappush(self._heap, e)
+        return batch
+
+    async def _deliver(self, batch: list) -> None:
+        if len(batch) == 1:
+            text = batch[0][2]["text"]
+        else:
+            text = f"🗂 خلاصه {len(batch)} اطلاعیه:\n\n" + "\n\n".join(e[2]["text"] for e in batch)
+
+        try:
+            msg = await self.bot.send_message(
+                self.chat_id, text[:TG_MAX_TEXT], reply_markup=batch[0][2]["reply_markup"]
+            )
+        except RetryAfter as e:
+            self.budget.block_for(retry_after_seconds(e))
+            self._requeue(batch)
+            return
+        except BadRequest as e:
+            # BadRequest زیرکلاس NetworkError است؛ پیام خراب/بلند با تکرار درست نمی‌شود
+            logger.warning("send to %s dropped: %s", self.chat_id, e)
+            self._resolve(batch, None)
+            return
+        except NetworkError as e:
+            logger.warning("send to %s failed: %s", self.chat_id, e)
+            for b in batch:
+                b[2]["tries"] += 1
+            self._requeue([b for b in batch if b[2]["tries"] < self.max_tries])
+            self._resolve([b for b in batch if b[2]["tries"] >= self.max_tries], None)
+            return
+        except Exception as e:
+            # Forbidden و ...: تکرار فایده ندارد
+            logger.warning("send to %s dropped: %s", self.chat_id, e)
+            self._resolve(batch, None)
+            return
+
+        self._resolve(batch, msg)
+
+    def _requeue(self, batch: list) -> None:
+        for e in batch:
+            heapq.heappush(self._heap, e)
+
+    @staticmethod
+    def _resolve(batch: list, result) -> None:
+        for _, _, entry in batch:
+            if not entry["fut"].done():
+                entry["fut"].set_result(result)
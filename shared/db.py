@@ -33,6 +33,108 @@ def migrate(con: sqlite3.Connection) -> None:
     );
     """)
 
+    # فایل‌های از قبل دانلودشده (prefetch) برای آیتم‌های نزدیک به نوبت انتشار
+    con.execute("""
+    CREATE TABLE IF NOT EXISTS staged_media(
+        item_id INTEGER PRIMARY KEY,
+        file_path TEXT NOT NULL,
+        size_bytes INTEGER NOT NULL,
+        format_selector TEXT,
+        meta TEXT,                          -- json: title/resolution/format_id
+        staged_at TEXT NOT NULL
+    );
+    """)
+
+    # session های resumable upload تا بعد از خطا/ری‌استارت از همان offset ادامه بدهیم
+    con.execute("""
+    CREATE TABLE IF NOT EXISTS upload_sessions(
+        item_id INTEGER PRIMARY KEY,
+        session_uri TEXT NOT NULL,
+        file_path TEXT,
+        file_fingerprint TEXT NOT NULL,     -- اندازه + hash ابتدا/انتهای فایل
+        offset_bytes INTEGER NOT NULL DEFAULT 0,
+        updated_at TEXT NOT NULL
+    );
+    """)
+
+    # زمان‌بندی هر چانک آپلود برای تنظیم اندازه چانک روی لینک واقعی
+    con.execute("""
+    CREATE TABLE IF NOT EXISTS upload_chunk_stats(
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        item_id INTEGER NOT NULL,
+        seq INTEGER NOT NULL,
+        offset_bytes INTEGER NOT NULL,
+        size_bytes INTEGER NOT NULL,
+        chunksize INTEGER NOT NULL,
+        seconds REAL NOT NULL,
+        created_at TEXT NOT NULL
+    );
+    """)
+
+    # خلاصه فرمت‌های هر ویدیو (نتیجه extract_info) با TTL، کلید: video id
+    con.execute("""
+    CREATE TABLE IF NOT EXISTS format_probes(
+        video_id TEXT PRIMARY KEY,
+        payload TEXT NOT NULL,              -- json فشرده: title/duration/formats
+        probed_at REAL NOT NULL             -- unix time
+    );
+    """)
+
+    # cache محتوایی فایل‌ها: کلید = video_id + format_id
+    con.execute("""
+    CREATE TABLE IF NOT EXISTS media_cache(
+        cache_key TEXT PRIMARY KEY,         -- <video_id>:<format_id>
+        video_id TEXT NOT NULL,
+        format_id TEXT NOT NULL,
+        file_path TEXT NOT NULL,
+        size_bytes INTEGER NOT NULL,
+        hits INTEGER NOT NULL DEFAULT 0,
+        created_at TEXT NOT NULL,
+        last_used_at REAL NOT NULL          -- unix time برای LRU
+    );
+    """)
+
+    # شمارنده‌های cache: hits / misses / bytes_saved
+    con.execute("""
+    CREATE TABLE IF NOT EXISTS media_cache_stats(
+        name TEXT PRIMARY KEY,
+        value INTEGER NOT NULL DEFAULT 0
+    );
+    """)
+
+    # زمان‌های انتشار روزانه؛ weekdays=NULL یعنی هر روز، وگرنه "0,2,5" (datetime.weekday)
+    con.execute("""
+    CREATE TABLE IF NOT EXISTS publish_slots(
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        hhmm TEXT NOT NULL,                 -- به وقت ایران
+        weekdays TEXT,
+        created_at TEXT NOT NULL
+    );
+    """)
+
+    # اجرای هر slot در هر روز (جایگزین last_publish_day تکی)
+    con.execute("""
+    CREATE TABLE IF NOT EXISTS slot_runs(
+        slot_id INTEGER NOT NULL,
+        day TEXT NOT NULL,                  -- YYYY-MM-DD به وقت ایران
+        status TEXT NOT NULL,               -- 'done'|'empty'|'catchup'
+        item_id INTEGER,
+        finished_at TEXT NOT NULL,
+        PRIMARY KEY(slot_id, day)
+    );
+    """)
+
+    # مصرف quota یوتیوب به تفکیک نوع درخواست؛ day = تاریخ به وقت Pacific (زمان reset)
+    con.execute("""
+    CREATE TABLE IF NOT EXISTS quota_usage(
+        day TEXT NOT NULL,
+        kind TEXT NOT NULL,                 -- 'videos.insert'|'videos.list'|...
+        calls INTEGER NOT NULL DEFAULT 0,
+        units INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY(day, kind)
+    );
+    """)
+
     def _add_col_safe(table: str, col: str, coldef: str):
         cols = [r["name"] for r in con.execute(f"PRAGMA table_info({table})").fetchall()]
         if col not in cols:
@@ -48,6 +150,31 @@ def migrate(con: sqlite3.Connection) -> None:
     _add_col_safe("queue_items", "picked_at", "TEXT")
     _add_col_safe("queue_items", "published_at", "TEXT")
 
+    # نتیجه probe پس‌زمینه در زمان افزودن به صف
+    _add_col_safe("queue_items", "probe_status", "TEXT")          # 'ok'|'lowres'|'error'
+    _add_col_safe("queue_items", "probe_heights", "TEXT")         # json: [2160, 1440, ...]
+    _add_col_safe("queue_items", "probe_codecs", "TEXT")          # json: {"2160": ["vp9", "av01"], ...}
+    _add_col_safe("queue_items", "probe_sizes", "TEXT")           # json: {"2160": bytes, ...} تخمینی
+    _add_col_safe("queue_items", "probed_at", "TEXT")
+
+    # فرمتی که نردبان کیفیت (یا انتخاب دستی) در دانلود واقعی برداشت
+    _add_col_safe("queue_items", "chosen_format_id", "TEXT")
+    _add_col_safe("queue_items", "chosen_height", "INTEGER")
+    # height ثابت‌شده (انتخاب دستی qpick یا پایین آمدن کیفیت در admission)؛ بعد از ری‌استارت هم معتبر
+    _add_col_safe("queue_items", "pinned_height", "INTEGER")
+
+    # مرحله remux قبل از آپلود (UPLOAD_FASTSTART)
+    _add_col_safe("queue_items", "upload_container", "TEXT")      # 'mp4'|'mkv'|...
+    _add_col_safe("queue_items", "remux_seconds", "REAL")
+
+    # retry با backoff: بعد از N تلاش ناموفق status='failed' می‌شود
+    _add_col_safe("queue_items", "attempts", "INTEGER NOT NULL DEFAULT 0")
+    _add_col_safe("queue_items", "last_error", "TEXT")
+    _add_col_safe("queue_items", "next_attempt_at", "TEXT")       # datetime UTC؛ NULL = همین حالا
+
+    # فایل‌های دانلودشده در تلاش ناموفق قبلی (pinned) با sweep پنجره prefetch پاک نمی‌شوند
+    _add_col_safe("staged_media", "pinned", "INTEGER NOT NULL DEFAULT 0")
+
     # backfill sort_order for existing rows
     con.execute("""
     UPDATE queue_items
@@ -78,6 +205,13 @@ def init_defaults(con, default_time_ir: str, default_privacy: str) -> None:
     if get_setting(con, "privacy") is None:
         set_setting(con, "privacy", default_privacy)
 
+    # نسخه‌های قبلی فقط یک زمان و last_publish_day داشتند؛ همان به اولین slot تبدیل می‌شود
+    if con.execute("SELECT 1 FROM publish_slots LIMIT 1").fetchone() is None:
+        slot_id = add_publish_slot(con, get_publish_time_ir(con))
+        last = get_setting(con, "last_publish_day")
+        if last:
+            set_slot_run(con, slot_id, last, "done")
+
 
 def get_publish_time_ir(con) -> str:
     return get_setting(con, "publish_time_ir") or "17:00"
@@ -96,8 +230,8 @@ def add_queue_item_link(
 ) -> int:
     cur = con.execute(
         """
-        INSERT INTO queue_items(source_type, source_url, title, description, thumb_mode, created_at, status)
-        VALUES(?, ?, ?, ?, ?, datetime('now'), 'queued')
+        INSERT INTO queue_items(source_type, source_url, title, description, thumb_mode, created_at, status, sort_order)
+        VALUES(?, ?, ?, ?, ?, datetime('now'), 'queued', (SELECT COALESCE(MAX(COALESCE(sort_order, id)), 0) + 1 FROM queue_items))
         """,
         ("link", url, title, description, thumb_mode),
     )
@@ -105,6 +239,37 @@ def add_queue_item_link(
     return int(cur.lastrowid)
 
 
+def add_queue_items_bulk(con, rows) -> list[int]:
+    """
+    rows: [(url, title, description), ...] — همه در یک transaction و به همان ترتیب ته صف.
+    """
+    ids = []
+    try:
+        # ردیف‌های قدیمی بدون sort_order در migrate با sort_order=id پر می‌شوند
+        base = con.execute("SELECT COALESCE(MAX(COALESCE(sort_order, id)), 0) FROM queue_items").fetchone()[0]
+        for n, (url, title, description) in enumerate(rows, 1):
+            cur = con.execute(
+                """
+                INSERT INTO queue_items(source_type, source_url, title, description, thumb_mode, created_at, status, sort_order)
+                VALUES('link', ?, ?, ?, 'yt', datetime('now'), 'queued', ?)
+                """,
+                (url, title, description, base + n),
+            )
+            ids.append(int(cur.lastrowid))
+        con.commit()
+    except Exception:
+        con.rollback()
+        raise
+    return ids
+
+
+def list_active_source_urls(con) -> list[str]:
+    rows = con.execute(
+        "SELECT source_url FROM queue_items WHERE status IN ('queued','picking','ready','failed') AND source_url IS NOT NULL"
+    ).fetchall()
+    return [r["source_url"] for r in rows]
+
+
 def list_queued(con, limit: int = 20):
     return con.execute(
         "SELECT id, source_type, source_url, title, created_at, sort_order FROM queue_items "
@@ -114,7 +279,16 @@ def list_queued(con, limit: int = 20):
 
 
 def delete_queue_item(con, item_id: int) -> None:
-    con.execute("DELETE FROM queue_items WHERE id=? AND status IN ('queued','picking')", (item_id,))
+    con.execute("DELETE FROM queue_items WHERE id=? AND status IN ('queued','picking','failed')", (item_id,))
+    # فایل stage شده دیگر معتبر نیست؛ خود فایل را sweep در publisher.prefetch پاک می‌کند
+    con.execute(
+        "DELETE FROM staged_media WHERE item_id=? AND item_id NOT IN (SELECT id FROM queue_items)",
+        (item_id,),
+    )
+    con.execute(
+        "DELETE FROM upload_sessions WHERE item_id=? AND item_id NOT IN (SELECT id FROM queue_items)",
+        (item_id,),
+    )
     con.commit()
 
 
@@ -151,9 +325,13 @@ def update_queue_thumb_file_id(con, item_id: int, file_id: str):
     con.commit()
 
 
-def list_queued_ids(con, limit: int = 100):
+def list_queued_ids(con, limit: int = 100, due_only: bool = False):
+    """
+    due_only: فقط آیتم‌هایی که pick_next_for_today هم برمی‌دارد (backoff/defer آن‌ها گذشته باشد).
+    """
+    due = " AND (next_attempt_at IS NULL OR next_attempt_at <= datetime('now'))" if due_only else ""
     rows = con.execute(
-        "SELECT id FROM queue_items WHERE status='queued' ORDER BY sort_order ASC, id ASC LIMIT ?",
+        f"SELECT id FROM queue_items WHERE status='queued'{due} ORDER BY sort_order ASC, id ASC LIMIT ?",
         (limit,),
     ).fetchall()
     return [int(r["id"]) for r in rows]
@@ -178,17 +356,22 @@ def swap_queue_order(con, id1: int, id2: int) -> None:
     con.execute("COMMIT")
 
 
-def pick_next_for_today(con):
+def pick_next_for_today(con, exclude_ids=()):
     """
     یک آیتم queued را برمی‌دارد و picked_at می‌زند.
+    آیتم‌هایی که next_attempt_at آن‌ها هنوز نرسیده (backoff بعد از خطا) و exclude_ids رد می‌شوند.
     اگر همزمان دو پردازش تلاش کنند، با UPDATE شرط‌دار از دوباره‌برداشتن جلوگیری می‌کنیم.
     """
-    row = con.execute("""
+    exclude = [int(i) for i in exclude_ids]
+    not_in = f"AND id NOT IN ({','.join('?' * len(exclude))})" if exclude else ""
+    row = con.execute(f"""
         SELECT id FROM queue_items
         WHERE status='queued'
+          AND (next_attempt_at IS NULL OR next_attempt_at <= datetime('now'))
+          {not_in}
         ORDER BY sort_order ASC, id ASC
         LIMIT 1
-    """).fetchone()
+    """, exclude).fetchone()
     if not row:
         return None
 
@@ -208,19 +391,406 @@ def pick_next_for_today(con):
     return item_id
 
 
+def pick_item(con, item_id: int) -> bool:
+    """
+    همان pick_next_for_today برای یک آیتم مشخص (اجرای دستی)؛ backoff نادیده گرفته می‌شود.
+    """
+    cur = con.execute(
+        "UPDATE queue_items SET status='picking', picked_at=datetime('now') "
+        "WHERE id=? AND status='queued'",
+        (item_id,),
+    )
+    con.commit()
+    return cur.rowcount > 0
+
+
 def mark_back_to_queue(con, item_id: int):
     con.execute("UPDATE queue_items SET status='queued' WHERE id=? AND status='picking'", (item_id,))
     con.commit()
 
 
+def record_failed_attempt(con, item_id: int, error: str, max_attempts: int, delay_s: int) -> tuple[str, int]:
+    """
+    یک تلاش ناموفق ثبت می‌کند: attempts+1 و last_error.
+    اگر به max_attempts رسید status='failed' (پارک)، وگرنه queued با next_attempt_at = الان + delay_s.
+    خروجی: (status جدید, attempts)
+    """
+    row = con.execute("SELECT attempts FROM queue_items WHERE id=?", (item_id,)).fetchone()
+    if not row:
+        return "missing", 0
+
+    attempts = int(row["attempts"] or 0) + 1
+    status = "failed" if attempts >= max_attempts else "queued"
+    con.execute(
+        """
+        UPDATE queue_items
+        SET status=?, attempts=?, last_error=?, next_attempt_at=datetime('now', ?)
+        WHERE id=? AND status IN ('queued','picking')
+        """,
+        (status, attempts, (error or "")[:1000], f"+{int(delay_s)} seconds", item_id),
+    )
+    con.commit()
+    return status, attempts
+
+
+def defer_item(con, item_id: int, delay_s: int) -> None:
+    """
+    آیتم بدون شمردن تلاش ناموفق به صف برمی‌گردد ولی تا delay_s ثانیه دیگر برداشته نمی‌شود
+    (مثلاً کمبود فضای دیسک یا انتظار برای انتخاب کیفیت) تا جلوی آیتم‌های بعدی را نگیرد.
+    """
+    con.execute(
+        "UPDATE queue_items SET status='queued', next_attempt_at=datetime('now', ?) "
+        "WHERE id=? AND status IN ('queued','picking')",
+        (f"+{int(delay_s)} seconds", item_id),
+    )
+    con.commit()
+
+
+def clear_item_defer(con, item_id: int) -> None:
+    """آیتم defer شده (مثلاً بعد از انتخاب کیفیت) از همین حالا قابل برداشتن است."""
+    con.execute("UPDATE queue_items SET next_attempt_at=NULL WHERE id=? AND status='queued'", (item_id,))
+    con.commit()
+
+
+def requeue_failed(con, item_id: int) -> bool:
+    """آیتم پارک‌شده (failed) را با شمارنده صفر به صف برمی‌گرداند."""
+    cur = con.execute(
+        """
+        UPDATE queue_items
+        SET status='queued', attempts=0, last_error=NULL, next_attempt_at=NULL
+        WHERE id=? AND status='failed'
+        """,
+        (item_id,),
+    )
+    con.commit()
+    return cur.rowcount > 0
+
+
+def list_failed(con, limit: int = 20):
+    return con.execute(
+        "SELECT id, source_url, title, attempts, last_error FROM queue_items "
+        "WHERE status='failed' ORDER BY id DESC LIMIT ?",
+        (limit,),
+    ).fetchall()
+
+
+def requeue_stale_picking(con) -> int:
+    """
+    بعد از ری‌استارت، آیتم‌هایی که وسط پردازش مانده‌اند (picking) به صف برمی‌گردند
+    تا تلاش بعدی از فایل‌های staging و session آپلود ادامه دهد.
+    """
+    cur = con.execute("UPDATE queue_items SET status='queued' WHERE status='picking'")
+    con.commit()
+    return cur.rowcount
+
+
 def mark_ready(con, item_id: int):
     con.execute("UPDATE queue_items SET status='ready' WHERE id=? AND status='picking'", (item_id,))
     con.commit()
 
 
-def get_last_publish_day(con) -> str | None:
-    return get_setting(con, "last_publish_day")
+def list_publish_slots(con):
+    return con.execute("SELECT * FROM publish_slots ORDER BY hhmm, id").fetchall()
+
+
+def get_publish_slot(con, slot_id: int):
+    return con.execute("SELECT * FROM publish_slots WHERE id=?", (slot_id,)).fetchone()
+
+
+def add_publish_slot(con, hhmm: str, weekdays: str | None = None) -> int:
+    cur = con.execute(
+        "INSERT INTO publish_slots(hhmm, weekdays, created_at) VALUES(?,?,datetime('now'))",
+        (hhmm, weekdays),
+    )
+    con.commit()
+    return int(cur.lastrowid)
+
+
+def delete_publish_slot(con, slot_id: int) -> bool:
+    # سابقه slot_runs می‌ماند (purge_slot_runs بعداً پاکش می‌کند)
+    cur = con.execute("DELETE FROM publish_slots WHERE id=?", (slot_id,))
+    con.commit()
+    return cur.rowcount > 0
+
+
+def replace_publish_slots(con, hhmm: str, today: str) -> int:
+    """
+    همه slotها را با یک slot روزانه عوض می‌کند (/settime HH:MM).
+    اگر امروز چیزی منتشر شده بود، همان ثبت به slot جدید منتقل می‌شود تا با زمان
+    دیرتر، آیتم دوم در همین روز منتشر نشود (مثل last_publish_day قبلی).
+    """
+    published = con.execute(
+        "SELECT * FROM slot_runs WHERE day=? AND status IN ('done','catchup') ORDER BY finished_at DESC LIMIT 1",
+        (today,),
+    ).fetchone()
+    con.execute("DELETE FROM publish_slots")
+    con.commit()
+    set_publish_time_ir(con, hhmm)
+    slot_id = add_publish_slot(con, hhmm)
+    if published:
+        set_slot_run(con, slot_id, today, published["status"], published["item_id"])
+    return slot_id
+
+
+def get_slot_run(con, slot_id: int, day: str):
+    return con.execute("SELECT * FROM slot_runs WHERE slot_id=? AND day=?", (slot_id, day)).fetchone()
+
+
+def set_slot_run(con, slot_id: int, day: str, status: str, item_id: int | None = None) -> None:
+    con.execute(
+        "INSERT INTO slot_runs(slot_id, day, status, item_id, finished_at) VALUES(?,?,?,?,datetime('now')) "
+        "ON CONFLICT(slot_id, day) DO UPDATE SET status=excluded.status, item_id=excluded.item_id, "
+        "finished_at=excluded.finished_at",
+        (slot_id, day, status, item_id),
+    )
+    con.commit()
+
+
+def list_slot_runs_since(con, day: str) -> set[tuple[int, str]]:
+    rows = con.execute("SELECT slot_id, day FROM slot_runs WHERE day >= ?", (day,)).fetchall()
+    return {(int(r["slot_id"]), r["day"]) for r in rows}
+
+
+def purge_slot_runs(con, before_day: str) -> None:
+    con.execute("DELETE FROM slot_runs WHERE day < ?", (before_day,))
+    con.commit()
+
+
+def set_staged_media(
+    con,
+    item_id: int,
+    file_path: str,
+    size_bytes: int,
+    format_selector: str | None,
+    meta: str | None,
+    pinned: bool = False,
+):
+    con.execute(
+        """
+        INSERT INTO staged_media(item_id, file_path, size_bytes, format_selector, meta, staged_at, pinned)
+        VALUES(?, ?, ?, ?, ?, datetime('now'), ?)
+        ON CONFLICT(item_id) DO UPDATE SET
+            file_path=excluded.file_path,
+            size_bytes=excluded.size_bytes,
+            format_selector=excluded.format_selector,
+            meta=excluded.meta,
+            staged_at=excluded.staged_at,
+            pinned=MAX(staged_media.pinned, excluded.pinned)
+        """,
+        (item_id, file_path, int(size_bytes), format_selector, meta, 1 if pinned else 0),
+    )
+    con.commit()
+
+
+def get_staged_media(con, item_id: int):
+    return con.execute("SELECT * FROM staged_media WHERE item_id=?", (item_id,)).fetchone()
+
+
+def delete_staged_media(con, item_id: int) -> None:
+    con.execute("DELETE FROM staged_media WHERE item_id=?", (item_id,))
+    con.commit()
+
+
+def list_staged_media(con):
+    """
+    همه فایل‌های stage شده به همراه status آیتم (اگر آیتم حذف شده باشد status=None).
+    waiting=1 یعنی آیتم queued است ولی next_attempt_at آن هنوز نرسیده.
+    """
+    return con.execute(
+        """
+        SELECT s.*, q.status AS item_status,
+               COALESCE(q.next_attempt_at > datetime('now'), 0) AS waiting
+        FROM staged_media s
+        LEFT JOIN queue_items q ON q.id = s.item_id
+        ORDER BY s.staged_at ASC
+        """
+    ).fetchall()
+
+
+def staged_media_total_bytes(con) -> int:
+    row = con.execute("SELECT COALESCE(SUM(size_bytes), 0) AS total FROM staged_media").fetchone()
+    return int(row["total"])
+
+
+def get_upload_session(con, item_id: int):
+    return con.execute("SELECT * FROM upload_sessions WHERE item_id=?", (item_id,)).fetchone()
+
+
+def save_upload_session(con, item_id: int, session_uri: str, file_path: str, file_fingerprint: str, offset_bytes: int):
+    con.execute(
+        """
+        INSERT INTO upload_sessions(item_id, session_uri, file_path, file_fingerprint, offset_bytes, updated_at)
+        VALUES(?, ?, ?, ?, ?, datetime('now'))
+        ON CONFLICT(item_id) DO UPDATE SET
+            session_uri=excluded.session_uri,
+            file_path=excluded.file_path,
+            file_fingerprint=excluded.file_fingerprint,
+            offset_bytes=excluded.offset_bytes,
+            updated_at=excluded.updated_at
+        """,
+        (item_id, session_uri, file_path, file_fingerprint, int(offset_bytes)),
+    )
+    con.commit()
+
+
+def delete_upload_session(con, item_id: int) -> None:
+    con.execute("DELETE FROM upload_sessions WHERE item_id=?", (item_id,))
+    con.commit()
+
+
+def add_upload_chunk_stat(con, item_id: int, seq: int, offset_bytes: int, size_bytes: int, chunksize: int, seconds: float):
+    con.execute(
+        """
+        INSERT INTO upload_chunk_stats(item_id, seq, offset_bytes, size_bytes, chunksize, seconds, created_at)
+        VALUES(?, ?, ?, ?, ?, ?, datetime('now'))
+        """,
+        (item_id, seq, int(offset_bytes), int(size_bytes), int(chunksize), float(seconds)),
+    )
+    con.commit()
+
+
+def upload_chunk_summary(con, limit: int = 10):
+    """خلاصه چانک‌های آپلود به تفکیک آیتم (جدیدترین‌ها اول)."""
+    return con.execute(
+        """
+        SELECT item_id,
+               COUNT(*) AS chunks,
+               SUM(size_bytes) AS total_bytes,
+               SUM(seconds) AS total_seconds,
+               MIN(chunksize) AS min_chunk,
+               MAX(chunksize) AS max_chunk,
+               MAX(size_bytes / NULLIF(seconds, 0)) AS best_bps,
+               MAX(created_at) AS last_at
+        FROM upload_chunk_stats
+        GROUP BY item_id
+        ORDER BY last_at DESC
+        LIMIT ?
+        """,
+        (limit,),
+    ).fetchall()
+
+
+def get_format_probe(con, video_id: str):
+    return con.execute("SELECT * FROM format_probes WHERE video_id=?", (video_id,)).fetchone()
+
+
+def save_format_probe(con, video_id: str, payload: str, probed_at: float) -> None:
+    con.execute(
+        """
+        INSERT INTO format_probes(video_id, payload, probed_at) VALUES(?, ?, ?)
+        ON CONFLICT(video_id) DO UPDATE SET payload=excluded.payload, probed_at=excluded.probed_at
+        """,
+        (video_id, payload, float(probed_at)),
+    )
+    con.commit()
+
+
+def purge_format_probes(con, older_than: float) -> int:
+    cur = con.execute("DELETE FROM format_probes WHERE probed_at < ?", (float(older_than),))
+    con.commit()
+    return cur.rowcount
+
+
+def set_item_probe(con, item_id: int, status: str, heights: str | None, codecs: str | None, sizes: str | None) -> None:
+    con.execute(
+        """
+        UPDATE queue_items
+        SET probe_status=?, probe_heights=?, probe_codecs=?, probe_sizes=?, probed_at=datetime('now')
+        WHERE id=?
+        """,
+        (status, heights, codecs, sizes, item_id),
+    )
+    con.commit()
+
+
+def set_item_format(con, item_id: int, format_id: str | None, height: int | None) -> None:
+    con.execute(
+        "UPDATE queue_items SET chosen_format_id=?, chosen_height=? WHERE id=?",
+        (format_id, int(height) if height else None, item_id),
+    )
+    con.commit()
+
+
+def set_item_pinned_height(con, item_id: int, height: int | None) -> None:
+    con.execute("UPDATE queue_items SET pinned_height=? WHERE id=?", (int(height) if height else None, item_id))
+    con.commit()
+
+
+def get_item_pinned_height(con, item_id: int) -> int | None:
+    row = con.execute("SELECT pinned_height FROM queue_items WHERE id=?", (item_id,)).fetchone()
+    return int(row["pinned_height"]) if row and row["pinned_height"] else None
+
+
+def set_item_remux(con, item_id: int, container: str, seconds: float) -> None:
+    con.execute(
+        "UPDATE queue_items SET upload_container=?, remux_seconds=? WHERE id=?",
+        (container, float(seconds), item_id),
+    )
+    con.commit()
+
+
+def get_media_cache(con, cache_key: str):
+    return con.execute("SELECT * FROM media_cache WHERE cache_key=?", (cache_key,)).fetchone()
+
+
+def put_media_cache(con, cache_key: str, video_id: str, format_id: str, file_path: str, size_bytes: int, now: float) -> None:
+    con.execute(
+        """
+        INSERT INTO media_cache(cache_key, video_id, format_id, file_path, size_bytes, created_at, last_used_at)
+        VALUES(?, ?, ?, ?, ?, datetime('now'), ?)
+        ON CONFLICT(cache_key) DO UPDATE SET
+            file_path=excluded.file_path,
+            size_bytes=excluded.size_bytes,
+            last_used_at=excluded.last_used_at
+        """,
+        (cache_key, video_id, format_id, file_path, int(size_bytes), float(now)),
+    )
+    con.commit()
+
+
+def touch_media_cache(con, cache_key: str, now: float) -> None:
+    con.execute(
+        "UPDATE media_cache SET hits = hits + 1, last_used_at=? WHERE cache_key=?",
+        (float(now), cache_key),
+    )
+    con.commit()
+
+
+def delete_media_cache(con, cache_key: str) -> None:
+    con.execute("DELETE FROM media_cache WHERE cache_key=?", (cache_key,))
+    con.commit()
+
+
+def list_media_cache_lru(con):
+    return con.execute("SELECT * FROM media_cache ORDER BY last_used_at ASC").fetchall()
+
+
+def media_cache_total_bytes(con) -> int:
+    row = con.execute("SELECT COALESCE(SUM(size_bytes), 0) AS total FROM media_cache").fetchone()
+    return int(row["total"])
+
+
+def bump_media_cache_stat(con, name: str, delta: int = 1) -> None:
+    con.execute(
+        "INSERT INTO media_cache_stats(name, value) VALUES(?, ?) "
+        "ON CONFLICT(name) DO UPDATE SET value = value + excluded.value",
+        (name, int(delta)),
+    )
+    con.commit()
+
+
+def get_media_cache_stats(con) -> dict:
+    return {r["name"]: int(r["value"]) for r in con.execute("SELECT name, value FROM media_cache_stats").fetchall()}
+
+
+def add_quota_usage(con, day: str, kind: str, calls: int, units: int) -> None:
+    con.execute(
+        "INSERT INTO quota_usage(day, kind, calls, units) VALUES(?,?,?,?) "
+        "ON CONFLICT(day, kind) DO UPDATE SET calls=calls+excluded.calls, units=units+excluded.units",
+        (day, kind, calls, units),
+    )
+    con.commit()
 
 
-def set_last_publish_day(con, day: str):
-    set_setting(con, "last_publish_day", day)
+def get_quota_usage(con, day: str):
+    return con.execute("SELECT kind, calls, units FROM quota_usage WHERE day=? ORDER BY units DESC", (day,)).fetchall()
@@ -1,10 +1,17 @@
+import asyncio
 import re
+import threading
+import time
+from concurrent.futures import Future
 from urllib.parse import urlparse, parse_qs
 
 from googleapiclient.discovery import build
 
 ID_RE = re.compile(r"^[A-Za-z0-9_-]{11}$")
 
+# videos.list حداکثر 50 id در یک درخواست می‌پذیرد
+MAX_IDS_PER_CALL = 50
+
 
 def extract_video_id(url: str) -> str | None:
     url = (url or "").strip()
@@ -43,11 +50,152 @@ def extract_video_id(url: str) -> str | None:
     return None
 
 
+class MetadataClient:
+    """
+    کلاینت ماندگار videos.list (snippet + contentDetails):
+    - service یک بار ساخته می‌شود (نه یک build و parse سند discovery برای هر درخواست)
+    - درخواست‌های همزمان چند thread در batch_window_s جمع و با یک درخواست چند-idی (تا 50) گرفته می‌شوند
+    - نتیجه هر id (حتی «پیدا نشد») در cache با TTL می‌ماند
+    on_call: اگر تنظیم شود، بعد از هر درخواست واقعی به API صدا زده می‌شود (برای ledger quota)؛
+    از همان threadی که درخواست را زده.
+    """
+
+    def __init__(self, api_key: str, *, ttl_s: float = 600.0, negative_ttl_s: float = 60.0, batch_window_s: float = 0.05):
+        self.api_key = api_key
+        self.ttl_s = ttl_s
+        self.negative_ttl_s = negative_ttl_s
+        self.batch_window_s = batch_window_s
+        self.on_call = None
+        self._service = None
+        self._lock = threading.Lock()
+        # httplib2 پشت service برای استفاده همزمان از چند thread امن نیست
+        self._api_lock = threading.Lock()
+        self._cache: dict[str, tuple[float, dict | None]] = {}
+        self._inflight: dict[str, Future] = {}
+        self._pending: list[str] = []
+
+    def _yt(self):
+        if self._service is None:
+            self._service = build("youtube", "v3", developerKey=self.api_key, cache_discovery=False)
+        return self._service
+
+    def cached(self, video_id: str) -> tuple[bool, dict | None]:
+        """(hit، item) بدون درخواست شبکه."""
+        with self._lock:
+            return self._cached_locked(video_id)
+
+    def _cached_locked(self, video_id: str) -> tuple[bool, dict | None]:
+        rec = self._cache.get(video_id)
+        if rec is None:
+            return False, None
+        ttl = self.ttl_s if rec[1] is not None else self.negative_ttl_s
+        if time.monotonic() - rec[0] >= ttl:
+            self._cache.pop(video_id, None)
+            return False, None
+        return True, rec[1]
+
+    def get_videos(self, video_ids) -> dict[str, dict | None]:
+        """id -> item (یا None اگر ویدیو وجود ندارد/خصوصی است). خطای API برای همه idهای آن batch بالا می‌رود."""
+        out: dict[str, dict | None] = {}
+        waits: dict[str, Future] = {}
+        leader = False
+
+        with self._lock:
+            for vid in dict.fromkeys(video_ids):
+                hit, item = self._cached_locked(vid)
+                if hit:
+                    out[vid] = item
+                elif vid in self._inflight:
+                    waits[vid] = self._inflight[vid]
+                else:
+                    fut = Future()
+                    self._inflight[vid] = fut
+                    waits[vid] = fut
+                    if not self._pending:
+                        leader = True
+                    self._pending.append(vid)
+
+        # اولین thread که id جدید اضافه کرده، بعد از پنجره کوتاه همه idهای جمع‌شده را می‌فرستد
+        if leader:
+            time.sleep(self.batch_window_s)
+            self._flush()
+
+        for vid, fut in waits.items():
+            out[vid] = fut.result()
+        return out
+
+    def _flush(self) -> None:
+        with self._lock:
+            ids, self._pending = self._pending, []
+
+        for i in range(0, len(ids), MAX_IDS_PER_CALL):
+            chunk = ids[i : i + MAX_IDS_PER_CALL]
+            try:
+                with self._api_lock:
+                    res = self._yt().videos().list(
+                        part="snippet,contentDetails", id=",".join(chunk), maxResults=MAX_IDS_PER_CALL
+                    ).execute()
+                if self.on_call is not None:
+                    self.on_call()
+            except Exception as e:
+                self._resolve(chunk, {}, e)
+                continue
+            found = {it.get("id"): it for it in res.get("items", [])}
+            self._resolve(chunk, found, None)
+
+    def _resolve(self, ids: list[str], found: dict, err: Exception | None) -> None:
+        now = time.monotonic()
+        with self._lock:
+            futs = [(vid, self._inflight.pop(vid, None)) for vid in ids]
+            if err is None:
+                for vid in ids:
+                    self._cache[vid] = (now, found.get(vid))
+                self._evict_expired_locked()
+        for vid, fut in futs:
+            if fut is None:
+                continue
+            if err is not None:
+                fut.set_exception(err)
+            else:
+                fut.set_result(found.get(vid))
+
+    def _evict_expired_locked(self) -> None:
+        now = time.monotonic()
+        for vid, (ts, item) in list(self._cache.items()):
+            ttl = self.ttl_s if item is not None else self.negative_ttl_s
+            if now - ts >= ttl:
+                self._cache.pop(vid, None)
+
+
+_CLIENTS: dict[str, MetadataClient] = {}
+_CLIENTS_LOCK = threading.Lock()
+
+
+def get_client(api_key: str) -> MetadataClient:
+    """یک MetadataClient برای هر api key در کل پروسه."""
+    with _CLIENTS_LOCK:
+        client = _CLIENTS.get(api_key)
+        if client is None:
+            client = _CLIENTS[api_key] = MetadataClient(api_key)
+        return client
+
+
 def get_video(api_key: str, video_id: str) -> dict | None:
-    yt = build("youtube", "v3", developerKey=api_key)
-    res = yt.videos().list(part="snippet,contentDetails", id=video_id).execute()
-    items = res.get("items", [])
-    return items[0] if items else None
+    return get_client(api_key).get_videos([video_id]).get(video_id)
+
+
+async def get_video_async(api_key: str, video_id: str, *, timeout: float = 10.0) -> dict | None:
+    """
+    نسخه async برای handlerها: cache hit بدون thread برمی‌گردد، بقیه در thread جدا.
+    بعد از timeout، asyncio.TimeoutError بالا می‌رود ولی درخواست در پس‌زمینه تمام و cache می‌شود
+    تا تلاش بعدی برای همین id فوری جواب بگیرد.
+    """
+    client = get_client(api_key)
+    hit, item = client.cached(video_id)
+    if hit:
+        return item
+    res = await asyncio.wait_for(asyncio.to_thread(client.get_videos, [video_id]), timeout)
+    return res.get(video_id)
 
 
 def parse_iso8601_duration_to_seconds(dur: str) -> int:
@@ -1,43 +1,632 @@
+import asyncio
+import hashlib
+import mimetypes
+import mmap
 import os
-from googleapiclient.discovery import build
-from googleapiclient.http import MediaFileUpload
+import random
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+
+import google_auth_httplib2
+import httplib2
+from googleapiclient.discovery import build_from_document
+from googleapiclient.errors import HttpError
+from googleapiclient.http import MediaUpload
 
 from google.oauth2.credentials import Credentials
 
 SCOPES = ["https://www.googleapis.com/auth/youtube.upload"]
 
+# چانک‌های resumable upload باید مضرب 256KB باشند
+CHUNK_ALIGN = 256 * 1024
+DEFAULT_CHUNKSIZE = 16 * 1024 * 1024
+
+# خطاهای گذرا: بعد از backoff از offset تایید‌شده سرور ادامه می‌دهیم
+RETRIABLE_STATUS = {500, 502, 503, 504}
+RETRIABLE_EXCEPTIONS = (httplib2.HttpLib2Error, OSError)
+# session منقضی/نامعتبر: باید از صفر شروع کرد
+SESSION_GONE_STATUS = {404, 410}
+
+
+# توکن access این مقدار ثانیه قبل از انقضا تمدید می‌شود (نه وسط آپلود با 401)
+TOKEN_REFRESH_MARGIN_S = 300
+DISCOVERY_URL = "https://www.googleapis.com/discovery/v1/apis/youtube/v3/rest"
+
+
+class UploaderServices:
+    """
+    نگهدارنده سراسری service آپلود:
+    - سند discovery یک بار خوانده می‌شود (نسخه static همراه کتابخانه، وگرنه یک بار از شبکه)
+    - credentials در حافظه می‌ماند و قبل از انقضا تمدید می‌شود؛ توکن تازه به صورت atomic
+      در YT_TOKEN_PATH نوشته می‌شود تا ری‌استارت بعدی refresh دوباره لازم نداشته باشد
+    - هر thread service و Http خودش را دارد (httplib2 thread-safe نیست)
+    """
+
+    def __init__(self, token_path: str, scopes=SCOPES):
+        self.token_path = token_path
+        self.scopes = scopes
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._doc: str | None = None
+        self._creds: Credentials | None = None
+        self._saved_token: str | None = None
+
+    def _discovery_doc(self) -> str:
+        if self._doc is None:
+            try:
+                from googleapiclient.discovery_cache import get_static_doc
+
+                doc = get_static_doc("youtube", "v3")
+            except ImportError:
+                doc = None
+            if doc is None:
+                _, content = httplib2.Http().request(DISCOVERY_URL)
+                doc = content.decode("utf-8")
+            self._doc = doc
+        return self._doc
+
+    def _load(self) -> Credentials:
+        if not os.path.exists(self.token_path):
+            raise RuntimeError(
+                "token.json پیدا نشد. باید YT_TOKEN_JSON را در Railway Variables ست کنی "
+                "یا فایل token.json را در مسیر YT_TOKEN_PATH بسازی."
+            )
+        creds = Credentials.from_authorized_user_file(self.token_path, self.scopes)
+        self._saved_token = creds.token
+        return creds
+
+    def _needs_refresh(self, creds: Credentials) -> bool:
+        if not creds.token or creds.expiry is None:
+            return not creds.valid
+        # expiry در google-auth یک datetime بدون tz به UTC است
+        left = creds.expiry - datetime.now(timezone.utc).replace(tzinfo=None)
+        return left.total_seconds() < TOKEN_REFRESH_MARGIN_S
+
+    def _persist(self, creds: Credentials) -> None:
+        d = os.path.dirname(self.token_path) or "."
+        fd, tmp = tempfile.mkstemp(prefix=".token.", dir=d)
+        try:
+            with os.fdopen(fd, "w") as f:
+                f.write(creds.to_json())
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.token_path)
+        except BaseException:
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            raise
+        self._saved_token = creds.token
+
+    def credentials(self) -> Credentials:
+        with self._lock:
+            if self._creds is None:
+                self._creds = self._load()
+            creds = self._creds
+            if self._needs_refresh(creds) and creds.refresh_token:
+                creds.refresh(google_auth_httplib2.Request(httplib2.Http()))
+            # AuthorizedHttp هم ممکن است بعد از 401 خودش توکن را عوض کرده باشد
+            if creds.token != self._saved_token:
+                self._persist(creds)
+            return creds
+
+    def service(self):
+        creds = self.credentials()
+        svc = getattr(self._local, "service", None)
+        if svc is None:
+            http = google_auth_httplib2.AuthorizedHttp(creds, http=httplib2.Http())
+            svc = build_from_document(self._discovery_doc(), http=http)
+            self._local.service = svc
+        return svc
+
+
+_SERVICES: UploaderServices | None = None
+_SERVICES_LOCK = threading.Lock()
+
 
 def get_youtube_service():
+    global _SERVICES
     token_path = os.environ.get("YT_TOKEN_PATH", "/tmp/token.json")
+    with _SERVICES_LOCK:
+        if _SERVICES is None or _SERVICES.token_path != token_path:
+            _SERVICES = UploaderServices(token_path)
+    return _SERVICES.service()
 
-    if not os.path.exists(token_path):
-        raise RuntimeError(
-            "token.json پیدا نشد. باید YT_TOKEN_JSON را در Railway Variables ست کنی "
-            "یا فایل token.json را در مسیر YT_TOKEN_PATH بسازی."
-        )
-
-    creds = Credentials.from_authorized_user_file(token_path, SCOPES)
-    return build("youtube", "v3", credentials=creds)
 
+def _align_chunksize(n: int) -> int:
+    return max(CHUNK_ALIGN, (int(n) // CHUNK_ALIGN) * CHUNK_ALIGN)
 
-def upload_video(file_path: str, title: str, description: str, privacy_status: str = "public"):
-    youtube = get_youtube_service()
 
+def _insert_request(youtube, media, title: str, description: str, privacy_status: str):
     body = {
         "snippet": {"title": title, "description": description},
         "status": {"privacyStatus": privacy_status},
     }
-
-    media = MediaFileUpload(file_path, chunksize=-1, resumable=True)
-
-    request = youtube.videos().insert(
+    return youtube.videos().insert(
         part="snippet,status",
         body=body,
         media_body=media,
     )
 
+
+class MmapFileUpload(MediaUpload):
+    """
+    آپلود فایل از روی mmap: هر چانک مستقیم از نگاشت حافظه برش می‌خورد،
+    بدون خواندن کل فایل یا بافر رو به رشد. chunksize در طول آپلود قابل تغییر است
+    (next_chunk هر بار chunksize() را از نو می‌خواند).
+    """
+
+    def __init__(self, file_path: str, *, chunksize: int = DEFAULT_CHUNKSIZE, mimetype: str | None = None):
+        super().__init__()
+        self._file_path = file_path
+        self._mimetype = mimetype or mimetypes.guess_type(file_path)[0] or "application/octet-stream"
+        self._chunksize = _align_chunksize(chunksize)
+        self._fd = open(file_path, "rb")
+        self._size = os.fstat(self._fd.fileno()).st_size
+        self._mm = mmap.mmap(self._fd.fileno(), 0, access=mmap.ACCESS_READ) if self._size else None
+
+    def set_chunksize(self, n: int) -> None:
+        self._chunksize = _align_chunksize(n)
+
+    def chunksize(self):
+        return self._chunksize
+
+    def mimetype(self):
+        return self._mimetype
+
+    def size(self):
+        return self._size
+
+    def resumable(self):
+        return True
+
+    def has_stream(self):
+        return False
+
+    def getbytes(self, begin, length):
+        if self._mm is None:
+            return b""
+        return self._mm[begin : begin + length]
+
+    def close(self) -> None:
+        if self._mm is not None:
+            self._mm.close()
+            self._mm = None
+        self._fd.close()
+
+
+class AdaptiveChunkPolicy:
+    """
+    اندازه چانک را بر اساس throughput اندازه‌گیری‌شده تنظیم می‌کند تا هر چانک
+    حدود target_seconds طول بکشد؛ بین min_bytes و max_bytes، حداکثر دو برابر در هر قدم.
+    بعد از خطا نصف می‌شود تا ریسک از دست رفتن یک چانک بزرگ کم شود.
+    """
+
+    def __init__(self, min_bytes: int, max_bytes: int, target_seconds: float = 20.0):
+        self.min_bytes = _align_chunksize(min_bytes)
+        self.max_bytes = max(self.min_bytes, _align_chunksize(max_bytes))
+        self.target_seconds = max(1.0, float(target_seconds))
+        self.current = self.min_bytes
+
+    def _clamp(self, n: float) -> int:
+        return _align_chunksize(min(self.max_bytes, max(self.min_bytes, n)))
+
+    def after_chunk(self, nbytes: int, seconds: float) -> int:
+        if nbytes > 0 and seconds > 0:
+            wanted = nbytes / seconds * self.target_seconds
+            self.current = self._clamp(min(wanted, self.current * 2))
+        return self.current
+
+    def after_failure(self) -> int:
+        self.current = self._clamp(self.current / 2)
+        return self.current
+
+
+def file_fingerprint(file_path: str) -> str:
+    """
+    شناسه فایل برای تطبیق session ذخیره‌شده: اندازه + hash یک مگابایت اول و آخر.
+    """
+    size = os.path.getsize(file_path)
+    block = 1024 * 1024
+    h = hashlib.sha1(str(size).encode())
+    with open(file_path, "rb") as f:
+        h.update(f.read(block))
+        if size > block:
+            f.seek(max(block, size - block))
+            h.update(f.read(block))
+    return h.hexdigest()
+
+
+def _backoff_sleep(attempt: int) -> None:
+    time.sleep(min(60.0, 2 ** attempt) + random.uniform(0, 1))
+
+
+def _run_chunks(
+    request,
+    total: int | None,
+    progress_cb=None,
+    *,
+    on_session=None,
+    max_retries: int = 8,
+    chunk_policy: AdaptiveChunkPolicy | None = None,
+    chunk_cb=None,
+):
+    """
+    حلقه next_chunk با گزارش پیشرفت و retry.
+    progress_cb: تابع sync که dict پیشرفت را می‌گیرد (هم‌شکل progress_cb دانلودر).
+    on_session: بعد از هر چانک با (session_uri, offset) صدا زده می‌شود؛ (None, 0) یعنی session باطل شد.
+    chunk_policy: اگر داده شود و media از set_chunksize پشتیبانی کند، اندازه چانک تطبیقی می‌شود.
+    chunk_cb: برای هر چانک dict {seq, offset, bytes, seconds, chunksize} را می‌گیرد.
+    """
+    media = request.resumable
+    adaptive = chunk_policy is not None and hasattr(media, "set_chunksize")
+    if adaptive:
+        media.set_chunksize(chunk_policy.current)
+    seq = 0
+    t0 = time.monotonic()
+    uploaded = 0
+    # برای آپلود ادامه‌دار، سرعت از اولین offset تایید‌شده حساب می‌شود
+    start_offset = None if request.resumable_uri else 0
+    failures = 0
     response = None
     while response is None:
-        status, response = request.next_chunk()
+        before = uploaded
+        chunk_size = media.chunksize()
+        t_chunk = time.monotonic()
+        try:
+            status, response = request.next_chunk()
+        except HttpError as e:
+            code = int(getattr(e.resp, "status", 0) or 0)
+            if code in SESSION_GONE_STATUS and request.resumable_uri:
+                # session قدیمی دیگر معتبر نیست؛ یک session تازه از بایت صفر
+                request.resumable_uri = None
+                request.resumable_progress = 0
+                request._in_error_state = False
+                uploaded = 0
+                if on_session is not None:
+                    on_session(None, 0)
+                continue
+            if code not in RETRIABLE_STATUS or failures >= max_retries:
+                raise
+            failures += 1
+            if adaptive:
+                media.set_chunksize(chunk_policy.after_failure())
+            _backoff_sleep(failures)
+            continue
+        except RETRIABLE_EXCEPTIONS:
+            if failures >= max_retries:
+                raise
+            failures += 1
+            if adaptive:
+                media.set_chunksize(chunk_policy.after_failure())
+            _backoff_sleep(failures)
+            if request.resumable_uri:
+                # چانک بعدی اول offset تایید‌شده را از سرور می‌پرسد
+                request._in_error_state = True
+            continue
+
+        failures = 0
+        if status is not None:
+            uploaded = int(status.resumable_progress)
+        elif response is not None and total:
+            uploaded = total
+
+        chunk_seconds = time.monotonic() - t_chunk
+        # اولین چانک بعد از resume شامل offset قبلی است؛ فقط بایت‌هایی که واقعا فرستاده شده حساب می‌شوند
+        sent = min(max(0, uploaded - before), chunk_size)
+        if adaptive:
+            media.set_chunksize(chunk_policy.after_chunk(sent, chunk_seconds))
+        if chunk_cb is not None:
+            chunk_cb(
+                {
+                    "seq": seq,
+                    "offset": uploaded - sent,
+                    "bytes": sent,
+                    "seconds": chunk_seconds,
+                    "chunksize": chunk_size,
+                }
+            )
+        seq += 1
+
+        if on_session is not None and response is None and request.resumable_uri:
+            on_session(request.resumable_uri, uploaded)
+
+        if progress_cb is None:
+            continue
+
+        if start_offset is None:
+            start_offset = uploaded
+            t0 = time.monotonic()
+        elapsed = max(time.monotonic() - t0, 1e-6)
+        speed = max(0, uploaded - start_offset) / elapsed
+        eta = int((total - uploaded) / speed) if (total and speed > 0) else None
+
+        progress_cb(
+            {
+                "status": "finished" if response is not None else "uploading",
+                "uploaded": uploaded,
+                "total": total or 0,
+                "percent": (uploaded / total * 100) if total else None,
+                "speed": speed,
+                "eta": eta,
+            }
+        )
+
+    return response
+
+
+def upload_video(
+    file_path: str,
+    title: str,
+    description: str,
+    privacy_status: str = "public",
+    *,
+    progress_cb=None,
+    chunksize: int = DEFAULT_CHUNKSIZE,
+    session: dict | None = None,
+    on_session=None,
+    max_retries: int = 8,
+    chunk_policy: AdaptiveChunkPolicy | None = None,
+    chunk_cb=None,
+):
+    """
+    session: رکورد ذخیره‌شده قبلی {"session_uri", "file_fingerprint"}؛ اگر با همین فایل
+    جور باشد آپلود از offset تایید‌شده سرور ادامه پیدا می‌کند (بدون videos.insert جدید).
+    on_session: تابع sync که dict {"session_uri", "file_fingerprint", "offset"} یا None
+    می‌گیرد تا session بیرون از پروسه ذخیره شود. None = session قبلی پاک شود؛ هر بار که
+    یک videos.insert تازه شروع می‌شود صدا زده می‌شود.
+    chunk_policy / chunk_cb: چانک تطبیقی و ثبت زمان هر چانک (نگاه کن به _run_chunks).
+    """
+    youtube = get_youtube_service()
+
+    # آپلود چانکی تا پیشرفت قابل گزارش باشد؛ چانک‌ها از mmap خوانده می‌شوند
+    media = MmapFileUpload(file_path, chunksize=chunksize)
+    try:
+        return _upload_media(
+            youtube,
+            media,
+            file_path,
+            title,
+            description,
+            privacy_status,
+            progress_cb=progress_cb,
+            session=session,
+            on_session=on_session,
+            max_retries=max_retries,
+            chunk_policy=chunk_policy,
+            chunk_cb=chunk_cb,
+        )
+    finally:
+        media.close()
+
+
+def _upload_media(
+    youtube,
+    media,
+    file_path: str,
+    title: str,
+    description: str,
+    privacy_status: str,
+    *,
+    progress_cb,
+    session,
+    on_session,
+    max_retries: int,
+    chunk_policy,
+    chunk_cb,
+):
+    request = _insert_request(youtube, media, title, description, privacy_status)
+
+    fp = file_fingerprint(file_path) if (session or on_session) else None
+    if session and session.get("session_uri") and session.get("file_fingerprint") == fp:
+        request.resumable_uri = session["session_uri"]
+        # با error state، next_chunk اول با Content-Range: bytes */size offset را از سرور می‌گیرد
+        request._in_error_state = True
+
+    def _on_session(uri, offset):
+        if on_session is None:
+            return
+        if uri is None:
+            on_session(None)
+        else:
+            on_session({"session_uri": uri, "file_fingerprint": fp, "offset": offset})
+
+    # on_session(None) یعنی «session قبلی کنار رفت و videos.insert تازه زده می‌شود»:
+    # هم وقتی session نبود، هم وقتی fingerprint فایل عوض شده، هم بعد از SESSION_GONE_STATUS
+    if request.resumable_uri is None:
+        _on_session(None, 0)
+
+    return _run_chunks(
+        request,
+        os.path.getsize(file_path),
+        progress_cb,
+        on_session=_on_session,
+        max_retries=max_retries,
+        chunk_policy=chunk_policy,
+        chunk_cb=chunk_cb,
+    )
+
+
+async def upload_video_async(
+    file_path: str,
+    title: str,
+    description: str,
+    privacy_status: str = "public",
+    *,
+    progress_cb=None,
+    chunksize: int = DEFAULT_CHUNKSIZE,
+    session: dict | None = None,
+    on_session=None,
+    chunk_policy: AdaptiveChunkPolicy | None = None,
+    chunk_cb=None,
+):
+    """
+    نسخه async: حلقه چانک‌ها در thread جدا اجرا می‌شود تا event loop بات آزاد بماند.
+    progress_cb داخل همان thread صدا زده می‌شود (مثل دانلودر)؛ برای کار با loop از call_soon_threadsafe استفاده کن.
+    """
+    return await asyncio.to_thread(
+        upload_video,
+        file_path,
+        title,
+        description,
+        privacy_status,
+        progress_cb=progress_cb,
+        chunksize=chunksize,
+        session=session,
+        on_session=on_session,
+        chunk_policy=chunk_policy,
+        chunk_cb=chunk_cb,
+    )
+
+
+class StreamingMediaUpload(MediaUpload):
+    """
+    MediaUpload با اندازه نامعلوم که از یک stream (مثلاً stdout ffmpeg) می‌خواند.
+
+    یک thread جدا stream را در بافری با سقف ثابت (window) می‌ریزد تا دانلود و آپلود
+    همزمان جلو بروند؛ بایت‌هایی که سرور تایید کرده دور ریخته می‌شوند.
+    حافظه مصرفی حداکثر حدود chunksize * (window_chunks + 1) است.
+    """
+
+    def __init__(
+        self,
+        stream,
+        *,
+        mimetype: str = "video/x-matroska",
+        chunksize: int = 8 * 1024 * 1024,
+        window_chunks: int = 4,
+        read_block: int = 1024 * 1024,
+        on_eof=None,
+    ):
+        super().__init__()
+        self._stream = stream
+        self._mimetype = mimetype
+        self._chunksize = _align_chunksize(chunksize)
+        # چانک در حال ارسال (تا تایید سرور) + window چانک پیش‌خوان + یک بایت برای تشخیص EOF
+        self._max_buffer = self._chunksize * (max(1, window_chunks) + 1) + 1
+        self._read_block = read_block
+        self._on_eof = on_eof
+
+        self._cond = threading.Condition()
+        self._buf = bytearray()
+        self._buf_start = 0          # offset مطلق اولین بایت داخل _buf
+        self._next_begin = 0         # offset مورد انتظار برای چانک بعدی
+        self._eof = False
+        self._error = None
+
+        self._reader = threading.Thread(target=self._pump, daemon=True)
+        self._reader.start()
+
+    def _pump(self):
+        try:
+            while True:
+                with self._cond:
+                    while len(self._buf) >= self._max_buffer and self._error is None:
+                        self._cond.wait()
+                    if self._error is not None:
+                        return
+
+                block = self._stream.read(self._read_block)
+
+                if not block:
+                    # قبل از اعلام EOF مطمئن شو منبع سالم تمام شده؛ وگرنه فایل ناقص نهایی می‌شود
+                    if self._on_eof is not None:
+                        self._on_eof()
+                    with self._cond:
+                        self._eof = True
+                        self._cond.notify_all()
+                    return
+
+                with self._cond:
+                    self._buf += block
+                    self._cond.notify_all()
+        except Exception as e:
+            with self._cond:
+                self._error = e
+                self._eof = True
+                self._cond.notify_all()
+
+    def _wait_for(self, end: int) -> None:
+        with self._cond:
+            while not self._eof and self._buf_start + len(self._buf) < end:
+                self._cond.wait()
+            if self._error is not None:
+                raise self._error
+
+    def abort(self, exc: Exception | None = None) -> None:
+        with self._cond:
+            self._error = exc or RuntimeError("stream aborted")
+            self._eof = True
+            self._cond.notify_all()
+
+    def chunksize(self):
+        return self._chunksize
+
+    def mimetype(self):
+        return self._mimetype
+
+    def resumable(self):
+        return True
+
+    def has_stream(self):
+        return False
+
+    def size(self):
+        # یک بایت بیشتر از چانک بعدی را جلوتر می‌خوانیم: اگر به EOF رسیدیم اندازه کل
+        # مشخص می‌شود و چانک آخر (حتی وقتی دقیقا هم‌اندازه chunksize است) درست بسته می‌شود.
+        self._wait_for(self._next_begin + self._chunksize + 1)
+        with self._cond:
+            return self._buf_start + len(self._buf) if self._eof else None
+
+    def getbytes(self, begin, length):
+        with self._cond:
+            if begin < self._buf_start:
+                raise RuntimeError(f"stream offset {begin} already discarded (buffer starts at {self._buf_start})")
+            del self._buf[: begin - self._buf_start]
+            self._buf_start = begin
+            self._cond.notify_all()
+
+        self._wait_for(begin + length)
+
+        with self._cond:
+            data = bytes(self._buf[:length])
+        self._next_begin = begin + len(data)
+        return data
+
+
+def upload_stream(
+    stream,
+    title: str,
+    description: str,
+    privacy_status: str = "public",
+    *,
+    chunksize: int = 8 * 1024 * 1024,
+    window_chunks: int = 4,
+    on_eof=None,
+    progress_cb=None,
+):
+    """
+    آپلود resumable از روی stream بدون فایل کامل روی دیسک.
+    on_eof: قبل از بستن آپلود صدا زده می‌شود؛ اگر exception بدهد آپلود نهایی نمی‌شود.
+    progress_cb: مثل upload_video؛ total تا آخر کار نامعلوم (0) است.
+    """
+    youtube = get_youtube_service()
+
+    media = StreamingMediaUpload(
+        stream,
+        chunksize=chunksize,
+        window_chunks=window_chunks,
+        on_eof=on_eof,
+    )
+
+    try:
+        request = _insert_request(youtube, media, title, description, privacy_status)
+        response = _run_chunks(request, None, progress_cb)
+    except BaseException as e:
+        media.abort(e if isinstance(e, Exception) else None)
+        raise
 
     return response